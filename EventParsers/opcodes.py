@@ -0,0 +1,100 @@
+# The estimated BMS versions and the games whose files they are based on.
+# See PARSERS in pyBMS.py for how the games are mapped to the versions.
+VERSIONS = [(0, "BMS Base Events"),
+            (0.5, "Pikmin 1"),
+            (1, "Super Mario Sunshine"),
+            (1.5, "Zelda: WW"),
+            (2, "Pikmin 2")]
+
+
+def _ids(start, end):
+    return tuple(range(start, end))
+
+
+# Every entry describes how the data of one or more command IDs is laid out.
+# An entry is a tuple of:
+#   - the command IDs,
+#   - the data layout: a struct format string, the name of a parser function
+#     in parser_helper.py, or None if the command is only ever deprecated,
+#   - the version in which the command has been added,
+#   - the versions in which the command has been marked as deprecated.
+OPCODES = [
+    # Note-on event: Polyphonic ID, Volume
+    (_ids(0x00, 0x80), "bb", 0, ()),
+    # Delay event for up to 255 ticks
+    ((0x80,), "B", 0, ()),
+    # Note-off event
+    (_ids(0x81, 0x88), "parse_noteOff", 0, ()),
+    # Delay event for up to 0xFFFF (65535) ticks
+    ((0x88,), ">H", 0, ()),
+    # Pan change: Unknown, Pan, Unknown
+    ((0x9A,), ">BBB", 0, ()),
+    # Volume Change: Unknown, volume
+    ((0x9C,), ">BH", 0, ()),
+    # Pitch shift: Unknown, Pitch, Unknown
+    ((0x9E,), ">BHB", 0, ()),
+    # Bank Select/Program Select: Unknown, Value
+    # If unknown == 32, value is instrument bank
+    # If unknown == 33, value is program (i.e. an ID of an instrument)
+    ((0xA4,), ">BB", 0, ()),
+    # Create new subroutine: Track ID, Track Offset (3 bytes!)
+    ((0xC1,), "parse_1Byte_1Tripplet", 0, ()),
+    # Goto offset: Offset
+    ((0xC4,), ">I", 0, ()),
+    # Go back to last stored position, one byte
+    ((0xC6,), "B", 0, ()),
+    # Loop to offset: Mode, Offset (Three bytes!)
+    ((0xC8,), "parse_1Byte_1Tripplet", 0, ()),
+    # Variable-length delay
+    ((0xF0,), "parse_VL_delay", 0, ()),
+    # BPM Value
+    ((0xFD,), ">H", 0, ()),
+    # PPQN Value
+    ((0xFE,), ">H", 0, ()),
+    # End of Track
+    ((0xFF,), "", 0, ()),
+
+    # Pikmin 1, unknown values
+    ((0xC9, 0xD0), ">H", 0.5, (1, 1.5)),
+    ((0xE7,), ">H", 0.5, ()),
+    ((0x98,), ">BB", 0.5, ()),
+    ((0xCB,), ">BB", 0.5, (1,)),
+    ((0xD2,), ">BB", 0.5, (1, 2)),
+    ((0xCD, 0xDE), ">B", 0.5, (1, 1.5)),
+    ((0xF1,), ">B", 0.5, (1,)),
+    # for deletion: 0xA2, 0xB0, 0xC5, 0xCA, 0xA6?
+    ((0xE3,), "", 0.5, (1, 1.5)),
+    ((0x92,), ">HB", 0.5, (1, 1.5)),
+    ((0xAA,), ">I", 0.5, (1, 1.5)),
+    ((0xAC,), ">BBB", 0.5, ()),
+    ((0xAF,), ">BBB", 0.5, (1, 1.5)),
+    ((0xDD,), ">BH", 0.5, ()),
+    ((0xDF,), ">I", 0.5, (1, 1.5)),
+    ((0xEF,), ">BBB", 0.5, ()),
+
+    # Super Mario Sunshine
+    # Volume Change: Unknown, volume (volume is only 1 byte instead of two bytes)
+    # is not used yet, 0x9C keeps the two byte volume.
+    ((0xFA,), None, None, (1,)),
+
+    # Zelda: Wind Waker
+    # Volume Change: Unknown, volume (volume is 2 bytes again)
+    # Maybe Nintendo thought that Mario did not need such a precision for SMS,
+    # or maybe development of the audio engine for SMS was independent of the
+    # development of the audio engine for Pikmin 1, which was released earlier.
+    ((0xF4,), ">B", 1.5, (1, 2)),
+    # Unknown event, the last two bytes are often 0xFFFF
+    ((0xAD,), ">BH", 1.5, ()),
+    ((0xA1, 0xA6), ">BB", 1.5, ()),
+    ((0xE6, 0xCC), "BB", 1.5, ()),
+
+    # Pikmin 2, unknown values
+    ((0xCF,), "B", 2, ()),
+    ((0xA0,), ">H", 2, ()),
+    ((0xA3,), "BB", 2, ()),
+    # Unknown IDs used only by specific bms files.
+    ((0xB1,), "parse_0xB1", 2, ()),
+    ((0xA7,), "BB", 2, ()),
+    ((0xDA,), "B", 2, ()),
+    ((0xE1,), "", 2, ()),
+]
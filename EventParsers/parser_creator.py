@@ -28,10 +28,18 @@ class DuplicateCommand(Exception):
 
 
 class ParserContainer(object):
-    def __init__(self):
+    def __init__(self, parser_loader=None):
         self.parsers = {}
         
         self.versions = []
+
+        # If set, parser_loader is called the first time a parser is needed.
+        # It returns the version specific parsers that should be added to the
+        # container, so that they don't have to be created on import.
+        self._parser_loader = parser_loader
+
+        # Parsers that have already been put together by get_parser, by version.
+        self._merged_parsers = {}
         
     def add_parser(self, parser):
         # The version number has to be either an integer or a float, any other
@@ -39,17 +47,37 @@ class ParserContainer(object):
         assert isinstance(parser.estimated_version, (int, float)) is True
         
         if parser.estimated_version in self.parsers:
-            existing_name = self.parsers[parser.estimated_version].gameName
+            existing_name = self.parsers[parser.estimated_version].game_name
             
             raise RuntimeError("Parser version ({version}) of '{newParserName}' "
                                "already in use by parser '{existingParser}'".format(version=parser.estimated_version,
-                                                                                    newParserName=parser.gameName,
+                                                                                    newParserName=parser.game_name,
                                                                                     existingParser=existing_name))
         self.versions.append(parser.estimated_version)
         self.parsers[parser.estimated_version] = parser
         self.versions.sort()
+        self._merged_parsers = {}
     
+    # Adds the parsers returned by the parser loader. It is only called once.
+    def _load_parsers(self):
+        parser_loader = self._parser_loader
+        self._parser_loader = None
+
+        for parser in parser_loader():
+            self.add_parser(parser)
+
+    # The parser returned for a version is shared by everyone who asks for that
+    # version, so that the tables compiled from it only need to be built once.
     def get_parser(self, estimated_version):
+        if self._parser_loader is not None:
+            self._load_parsers()
+
+        if estimated_version not in self._merged_parsers:
+            self._merged_parsers[estimated_version] = self._merge_parsers(estimated_version)
+
+        return self._merged_parsers[estimated_version]
+
+    def _merge_parsers(self, estimated_version):
         base_parser = VersionSpecificParser(estimated_version,
                                             "Parser v{0}".format(estimated_version))
         
@@ -78,17 +106,13 @@ class VersionSpecificParser(object):
         
         self.parents.append((parent, game_name))
         
-        for command_id, function in parent.command_parsers.iteritems():
+        for command_id, function in parent.command_parsers.items():
             if command_id not in parent.deprecated:
                 self.command_parsers[command_id] = function
             elif command_id in self.command_parsers:
                 del self.command_parsers[command_id]
         
         self.deprecated = parent.deprecated
-        
-        print parent.game_name, parent.estimated_version
-        print self.deprecated
-        print parent.deprecated
 
     def set_parser_function(self, function, command_id):
         if command_id in self.deprecated:
@@ -104,7 +128,7 @@ class VersionSpecificParser(object):
     # This is useful for adding parsers for the note-on events, of which there are
     # 128. (command ID 0x00 to 0x7F)
     def set_parser_function_range(self, function, start_command_id, end_command_id):
-        for command_id in xrange(start_command_id, end_command_id):
+        for command_id in range(start_command_id, end_command_id):
             if command_id in self.deprecated:
                 raise TriedToAddDeprecatedCommand(command_id, self.estimated_version)
             elif command_id in self.command_parsers:
@@ -135,28 +159,31 @@ class VersionSpecificParser(object):
                                    "that command!".format(cmd=hex(cmd)))
             self.deprecated[cmd] = True
     
-    def parse_next_cmd(self, bmsfile, reader, strict=False):
-        cmd_id = reader.byte()
-        
-        if cmd_id not in self.command_parsers:
-            offset = int(bmsfile.tell() - 1)
-            # print type(cmdID), self.command_parsers.keys()
-            raise RuntimeError("Unknown Command ID: {cmdID} at offset {offset}"
-                               "".format(cmdID=hex(cmd_id), offset=hex(offset)))
-        else:
-            parser_func = self.command_parsers[cmd_id]
-            args = parser_func(bmsfile, reader, strict, cmd_id)
-            
-            return cmd_id, args
+    # Returns a tuple with an entry for each of the 256 command IDs.
+    # Each entry is a (struct_obj, parser_func) tuple. struct_obj is the struct.Struct
+    # object used by parsers created with create_parser_function, so that the data can be
+    # unpacked without calling the parser function. It is None for custom parser functions.
+    # Both are None if the parser does not know the command.
+    def compile_decoders(self):
+        decoders = []
+
+        for command_id in range(256):
+            function = self.command_parsers.get(command_id)
+
+            if function is None:
+                decoders.append((None, None))
+            else:
+                decoders.append((getattr(function, "struct", None), function))
+
+        return tuple(decoders)
 
 
 def create_parser_function(struct_string):
     struct_obj = struct.Struct(struct_string)
 
-    def parser_func(bmsfile, reader, strict, command_id=None):
-        bin_data = bmsfile.read(struct_obj.size)
-        values = struct_obj.unpack(bin_data)
-        
-        return values
+    def parser_func(reader, strict, command_id=None):
+        return reader.unpack(struct_obj)
+
+    parser_func.struct = struct_obj
     
-    return parser_func
\ No newline at end of file
+    return parser_func
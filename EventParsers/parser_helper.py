@@ -1,38 +1,35 @@
+import struct
 
 
 # The note off event contains no data, except for the least significant bits
 # represening the polyphonic ID, so that all notes with that particular
 # polyphonic ID can be turned off.
-def parse_noteOff(bmsfile, read, strict, commandID):
+def parse_noteOff(read, strict, commandID):
     return (commandID & 0b111,)
 
 # Several commands use three bytes of data and one byte for
 # something else. Because Python's struct module does not have
 # a way to parse three bytes at once, we need to do it as follows.
-def parse_1Byte_1Tripplet(bmsfile, read, strict, commandID):
+def parse_1Byte_1Tripplet(read, strict, commandID):
     byte = read.byte()
     tripplet = read.tripplet()
 
     return (byte, tripplet)
 
-# Variable-length delay
-def parse_VL_delay(bmsfile, read, strict, commandID):
-    start = bmsfile.tell()
-
+# Variable-length delay. Every byte holds 7 bits of the value,
+# the most significant bit is set if another byte follows.
+def parse_VL_delay(read, strict, commandID):
     value = read.byte()
+    delay = value & 0x7F
 
     while (value >> 7) == 1:
         value = read.byte()
+        delay = (delay << 7) | (value & 0x7F)
 
-    dataLen = bmsfile.tell() - start
-    bmsfile.seek(start)
-
-    data = read.byteArray(dataLen)
-
-    return (data, )
+    return (delay, )
 
 # Unknown piece data that can be 4 or 5 bytes in length, based on the second byte.
-def parse_0xB1(bmsfile, read, strict, commandID):
+def parse_0xB1(read, strict, commandID):
     C1_byte = read.byte()
     unknown_byte = read.byte()
 
@@ -41,4 +38,45 @@ def parse_0xB1(bmsfile, read, strict, commandID):
     else:
         unknown_data = read.int()
 
-    return (C1_byte, unknown_byte, unknown_data)
\ No newline at end of file
+    return (C1_byte, unknown_byte, unknown_data)
+
+
+# The encode functions do the opposite of the parser functions above. They receive the
+# values returned by the parser function and return the data that follows the command ID.
+def encode_noteOff(values, commandID):
+    if len(values) > 0 and values[0] != commandID & 0b111:
+        raise struct.error("Polyphonic ID {0} does not match command ID {1}"
+                           "".format(values[0], hex(commandID)))
+
+    return b""
+
+def encode_1Byte_1Tripplet(values, commandID):
+    byte, tripplet = values
+
+    if not 0 <= tripplet <= 0xFFFFFF:
+        raise struct.error("Tripplet out of range: {0}".format(tripplet))
+
+    return struct.pack(">BBH", byte, tripplet >> 16, tripplet & 0xFFFF)
+
+def encode_VL_delay(values, commandID):
+    delay = values[0]
+
+    if delay < 0:
+        raise struct.error("Negative delay: {0}".format(delay))
+
+    data = [delay & 0x7F]
+    delay >>= 7
+
+    while delay > 0:
+        data.append(0x80 | (delay & 0x7F))
+        delay >>= 7
+
+    return bytes(reversed(data))
+
+def encode_0xB1(values, commandID):
+    C1_byte, unknown_byte, unknown_data = values
+
+    if unknown_byte == 0x40:
+        return struct.pack(">BBH", C1_byte, unknown_byte, unknown_data)
+    else:
+        return struct.pack(">BBI", C1_byte, unknown_byte, unknown_data)
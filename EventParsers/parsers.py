@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import struct
+import tempfile
+
+from . import parser_helper
+from .opcodes import OPCODES, VERSIONS
+from .parser_creator import (ParserContainer,
+                             VersionSpecificParser)
+
+from .parser_creator import create_parser_function as bin_struct
+
+
+# Creates the parsers of every version from the OPCODES table.
+# The parsers are put together by version in the same way they would be
+# if every command had been added to its parser by hand.
+class OpcodeTableContainer(ParserContainer):
+    def __init__(self, opcodes, versions, cache_dir=None):
+        super(OpcodeTableContainer, self).__init__(parser_loader=self._create_parsers)
+
+        self._opcodes = opcodes
+        self._versions = versions
+
+        # If cache_dir is set, the merged command table of every version is written to it,
+        # and loaded from it by the next process that needs the same version.
+        self.cache_dir = cache_dir
+
+        # Parser functions by data layout, and the data layout of every parser function.
+        self._functions = {}
+        self._layouts = {}
+
+    def _get_function(self, layout):
+        if layout not in self._functions:
+            if hasattr(parser_helper, layout):
+                function = getattr(parser_helper, layout)
+            else:
+                function = bin_struct(layout)
+
+            self._functions[layout] = function
+            self._layouts[function] = layout
+
+        return self._functions[layout]
+
+    def _create_parsers(self):
+        parsers = []
+
+        for version, game_name in self._versions:
+            parser = VersionSpecificParser(version, game_name)
+
+            for command_ids, layout, added, deprecated in self._opcodes:
+                if version in deprecated:
+                    parser.deprecate_parser_function(*command_ids)
+
+            for command_ids, layout, added, deprecated in self._opcodes:
+                if added == version:
+                    parser.set_many_parser_functions(self._get_function(layout),
+                                                     *command_ids)
+
+            parsers.append(parser)
+
+        return parsers
+
+    # Returns the data layout of every command ID known to the parser of the version,
+    # e.g. so that the commands can be encoded again.
+    def get_layouts(self, estimated_version):
+        parser = self.get_parser(estimated_version)
+
+        return dict((command_id, self._layouts[function])
+                    for command_id, function in parser.command_parsers.items())
+
+    def _get_cache_path(self, estimated_version):
+        # Changes to the table result in a different file name,
+        # so outdated cache files are never used.
+        table_hash = hashlib.sha1(repr((self._versions, self._opcodes)).encode("utf-8")).hexdigest()
+        file_name = "parser_v{0}_{1}.json".format(estimated_version, table_hash[:16])
+
+        return os.path.join(self.cache_dir, file_name)
+
+    # Returns None if there is no cache file, or if it cannot be read, e.g. because
+    # it has been written by an older version or is broken.
+    def _load_cached_parser(self, estimated_version, cache_path):
+        try:
+            with open(cache_path, "r") as f:
+                cached_parser = json.load(f)
+
+            parser = VersionSpecificParser(estimated_version, cached_parser["game_name"])
+            for command_id, layout in cached_parser["commands"]:
+                parser.command_parsers[command_id] = self._get_function(layout)
+            for command_id in cached_parser["deprecated"]:
+                parser.deprecated[command_id] = True
+
+        except (OSError, ValueError, KeyError, TypeError, struct.error):
+            return None
+
+        return parser
+
+    # Several processes can create the same cache file at the same time, so the file is
+    # written under a temporary name first and then renamed, which replaces it at once.
+    def _store_cached_parser(self, parser, cache_path):
+        cached_parser = {"game_name": parser.game_name,
+                         "commands": [(command_id, self._layouts[function])
+                                      for command_id, function in parser.command_parsers.items()],
+                         "deprecated": list(parser.deprecated)}
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+
+        try:
+            with os.fdopen(handle, "w") as f:
+                json.dump(cached_parser, f)
+
+            os.replace(temp_path, cache_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _merge_parsers(self, estimated_version):
+        if self.cache_dir is None:
+            return super(OpcodeTableContainer, self)._merge_parsers(estimated_version)
+
+        cache_path = self._get_cache_path(estimated_version)
+        parser = self._load_cached_parser(estimated_version, cache_path)
+
+        if parser is None:
+            parser = super(OpcodeTableContainer, self)._merge_parsers(estimated_version)
+            self._store_cached_parser(parser, cache_path)
+
+        return parser
+
+
+# The parsers are only created once a parser is requested from the container.
+container = OpcodeTableContainer(OPCODES, VERSIONS,
+                                 cache_dir=os.environ.get("PYBMS_PARSER_CACHE"))
+
+
+__all__ = ["container"]
@@ -9,7 +9,7 @@ class OptionsCollector(object):
         self.opts = kwargs
 
     def set_options(self, **kwargs):
-        for key, val in kwargs.iteritems():
+        for key, val in kwargs.items():
             if key not in self.opts:
                 raise RuntimeError("Key '{0}' does not exist in the option collector!".format(key))
             else:
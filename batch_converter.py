@@ -1,48 +1,320 @@
+import argparse
+import json
+import multiprocessing
 import os
-import struct
+import time
 
-from pyBMS import BmsInterpreter
+from pyBMS import BmsInterpreter, PARSERS, STATUS_ERROR
+from EventParsers import parsers
+from bmsmodules.conversion_cache import ConversionCache, get_conversion_key
+from bmsmodules.disassembler import disassemble
+from bmsmodules.subroutine_template import SubroutineEventsTemplate, get_dispatch_table
 
+# Status of files that have not been interpreted because they contain unknown commands.
+STATUS_REJECTED = "rejected"
 
 
-if __name__ == "__main__":
-    input_dir = "zelda_bms"#"pikmin2_bms"
-    output_dir = os.path.join("output", input_dir)
-    parser = "zeldawindwaker"
+# Every worker process builds the parser tables once, before it
+# converts the first file. They are reused for all following files.
+def init_worker(parser_name):
+    version_parser = parsers.container.get_parser(PARSERS[parser_name])
+    get_dispatch_table(version_parser, SubroutineEventsTemplate)
+
+
+def new_result(input_path):
+    return {"input": input_path,
+            "output": None,
+            "status": None,
+            "ticks": 0,
+            "events": 0,
+            "output_size": 0,
+            "ports": 0,
+            "channels": None,
+            "wall_time": 0.0,
+            "error": None}
+
+
+# Disassembles the file and returns the IDs of the commands used in it, together with
+# the reason for rejecting the file, or None. Files with unknown commands on any
+# reachable path would fail at some point during interpretation, so they are skipped.
+def check_commands(bms_data, parser_name):
+    graph = disassemble(bms_data, parsers.container.get_parser(PARSERS[parser_name]))
+
+    if len(graph.unknown_commands) > 0:
+        return None, "Unknown commands: " + ", ".join(
+            "0x{0:02X} at 0x{1:x}".format(cmd_id, offset)
+            for offset, cmd_id in graph.unknown_commands)
+
+    return set(instruction.cmd_id for instruction in graph.instructions.values()), None
+
+
+# Converts a single file and returns a dictionary describing the result,
+# which becomes the entry of the file in the manifest. If checked is set,
+# the commands of the file have already been checked by scan_file.
+def convert_file(job):
+    input_path, output_path, parser_name, instrument_bank, bpm, checked = job
+
+    result = new_result(input_path)
+    start = time.time()
+
+    try:
+        with open(input_path, "rb") as f:
+            bms_data = f.read()
+
+        rejection = None
+        if not checked:
+            used_cmd_ids, rejection = check_commands(bms_data, parser_name)
+
+        if rejection is not None:
+            result["status"] = STATUS_REJECTED
+            result["error"] = rejection
+
+        else:
+            bms_parser = BmsInterpreter(bms_data, parser_name=parser_name,
+                                        scheduler_mode="event")
+            status = bms_parser.parse_file()
+
+            result["status"] = status
+            result["ticks"] = bms_parser.get_ticks()
+            result["events"] = bms_parser.scheduler.event_count()
+
+            if bms_parser.error is not None:
+                result["error"] = str(bms_parser.error)
+
+            if status != STATUS_ERROR:
+                # The old output might be a hard link to a cached conversion,
+                # which must not be overwritten.
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+
+                with open(output_path, "wb") as f:
+                    bms_parser.scheduler.compile_midi(instrument_bank=instrument_bank, bpm=bpm,
+                                                      fileobj=f)
+
+                # The port and channel of every subroutine in the midi file.
+                channels = bms_parser.scheduler.channels
+                result["ports"] = channels.port_count()
+                result["channels"] = channels.as_dict()
+
+                result["output"] = output_path
+                result["output_size"] = os.path.getsize(output_path)
+
+    except Exception as error:
+        # A single broken file should not stop the whole batch.
+        result["status"] = STATUS_ERROR
+        result["error"] = "{0}: {1}".format(type(error).__name__, error)
+
+    result["wall_time"] = time.time() - start
+
+    return result
+
+
+# Runs in the worker processes before the conversion when the cache is used. Returns the
+# conversion key of the job and the result of the job if the file is rejected. The key is
+# None if the file is rejected or cannot be read, the conversion reports the error then.
+def scan_file(job):
+    input_path, output_path, parser_name, instrument_bank, bpm, checked = job
+    start = time.time()
+
+    try:
+        with open(input_path, "rb") as f:
+            bms_data = f.read()
+
+        used_cmd_ids, rejection = check_commands(bms_data, parser_name)
+    except Exception:
+        return None, None
+
+    if rejection is not None:
+        result = new_result(input_path)
+        result["status"] = STATUS_REJECTED
+        result["error"] = rejection
+        result["wall_time"] = time.time() - start
+
+        return None, result
 
-    instrument_bank = 0
-    bpm = 100
+    options = {"parser": parser_name,
+               "instrument_bank": instrument_bank,
+               "bpm": bpm}
+    version_parser = parsers.container.get_parser(PARSERS[parser_name])
 
-    print(os.listdir(input_dir))
+    return get_conversion_key(bms_data, version_parser, used_cmd_ids, options), None
 
 
+# Creates the result of a job from a conversion of the same content.
+def reuse_result(cache, key, result, job):
+    input_path, output_path = job[:2]
+    start = time.time()
+
+    result = dict(result)
+    result["input"] = input_path
+    result["cached"] = True
+
+    if result["output"] is not None:
+        cache.copy_output(key, output_path)
+        result["output"] = output_path
+
+    result["wall_time"] = time.time() - start
+
+    return result
+
+
+def convert_directory(input_dir, output_dir, parser_name,
+                      instrument_bank=0, bpm=100, processes=None, cache=None):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    for bms_file in os.listdir(input_dir):
+    jobs = []
+    for bms_file in sorted(os.listdir(input_dir)):
         if bms_file.endswith(".bms"):
-            input_path = os.path.join(input_dir, bms_file)
+            jobs.append((os.path.join(input_dir, bms_file),
+                         os.path.join(output_dir, bms_file+".midi"),
+                         parser_name, instrument_bank, bpm, False))
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    results = []
+
+    pool = None
+    if processes == 1:
+        init_worker(parser_name)
+    else:
+        pool = multiprocessing.Pool(processes, init_worker, (parser_name, ))
+
+    try:
+        convert_jobs(pool, jobs, cache, results)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if cache is not None:
+        cache.evict()
+
+    results.sort(key=lambda result: result["input"])
+
+    return results
+
 
-            with open(input_path, "rb") as f:
-                #bms_data = StringIO(f.read())
+# Converts the jobs with the pool, or in this process if pool is None,
+# and adds their results to the list of results.
+def convert_jobs(pool, jobs, cache, results):
+    # The conversion keys of the jobs that need to be converted, by input path,
+    # and the jobs with the same key, which reuse the result of the conversion.
+    job_keys = {}
+    duplicate_jobs = {}
 
-                bms_parser = BmsInterpreter(f.read(), parser_name=parser)#bms_data)
+    if cache is not None:
+        pending_jobs = []
+
+        if pool is None:
+            scanned = map(scan_file, jobs)
+        else:
+            scanned = pool.imap(scan_file, jobs)
+
+        for job, (key, rejected_result) in zip(jobs, scanned):
+            cached_result = cache.get(key) if key is not None else None
+
+            if rejected_result is not None:
+                results.append(rejected_result)
+                print_result(rejected_result)
+            elif key is None:
+                pending_jobs.append(job)
+            elif cached_result is not None:
+                results.append(reuse_result(cache, key, cached_result, job))
+                print_result(results[-1])
+            elif key in duplicate_jobs:
+                duplicate_jobs[key].append(job)
+            else:
+                duplicate_jobs[key] = []
+                job_keys[job[0]] = key
+                pending_jobs.append(job[:-1] + (True, ))
+
+        jobs = pending_jobs
+
+    def handle_result(result):
+        results.append(result)
+        print_result(result)
+
+        key = job_keys.get(result["input"])
+        if key is not None and result["status"] != STATUS_ERROR:
+            cache.store(key, result, result["output"])
+
+            for job in duplicate_jobs[key]:
+                results.append(reuse_result(cache, key, result, job))
+                print_result(results[-1])
+
+    if pool is None:
+        for job in jobs:
+            handle_result(convert_file(job))
+    else:
+        for result in pool.imap_unordered(convert_file, jobs):
+            handle_result(result)
+
+    # Files whose conversion failed are converted on their own,
+    # so that every file gets its own error message.
+    for key, jobs in duplicate_jobs.items():
+        if cache.get(key) is None:
+            for job in jobs:
+                handle_result(convert_file(job[:-1] + (True, )))
+
+
+def print_result(result):
+    if result["error"] is not None:
+        print("{input}: {status} ({error})".format(**result))
+    else:
+        print("{input}: {status}, {ticks} ticks, {events} events, {wall_time:.2f}s".format(**result))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Convert all BMS files in a directory to midi files.")
+    arg_parser.add_argument("input_dir", nargs="?", default="zelda_bms")
+    arg_parser.add_argument("output_dir", nargs="?", default=None,
+                            help="Defaults to output/<input_dir>")
+    arg_parser.add_argument("--parser", default="zeldawindwaker", choices=sorted(PARSERS.keys()))
+    arg_parser.add_argument("--instrument-bank", type=int, default=0)
+    arg_parser.add_argument("--bpm", type=int, default=100)
+    arg_parser.add_argument("--processes", type=int, default=None,
+                            help="Amount of worker processes, defaults to the amount of CPUs")
+    arg_parser.add_argument("--manifest", default=None,
+                            help="Where to write the results, defaults to <output_dir>/manifest.json")
+    arg_parser.add_argument("--cache-dir", default=None,
+                            help="Reuse the conversions of files that have been converted before")
+    arg_parser.add_argument("--cache-max-size", type=float, default=None,
+                            help="Maximum size of the cache in megabytes")
+    arg_parser.add_argument("--cache-max-age", type=float, default=None,
+                            help="Remove cached conversions that have not been used for this many days")
 
-            try:
-                bms_parser.parse_file()
-            except struct.error as e:
-                #print e
-                print "{input} successully parsed".format(input=input_path)
-            except Exception as e:
-                print "{input} not parsed".format(input=input_path)
-                continue
+    args = arg_parser.parse_args()
 
+    output_dir = args.output_dir
+    if output_dir is None:
+        output_dir = os.path.join("output", args.input_dir)
 
-            midi = bms_parser.scheduler.compile_midi(instrument_bank=instrument_bank, bpm=bpm)
+    manifest_path = args.manifest
+    if manifest_path is None:
+        manifest_path = os.path.join(output_dir, "manifest.json")
 
-            output_path = os.path.join(output_dir, bms_file+".midi")
-            with open(output_path, "wb") as f:
-                midi.write_midi(f)
+    cache = None
+    if args.cache_dir is not None:
+        cache = ConversionCache(args.cache_dir)
+        if args.cache_max_size is not None:
+            cache.max_size = int(args.cache_max_size*1024*1024)
+        if args.cache_max_age is not None:
+            cache.max_age = args.cache_max_age*24*60*60
 
+    start = time.time()
+    results = convert_directory(args.input_dir, output_dir, args.parser,
+                                instrument_bank=args.instrument_bank, bpm=args.bpm,
+                                processes=args.processes, cache=cache)
 
+    with open(manifest_path, "w") as f:
+        json.dump({"parser": args.parser,
+                   "instrument_bank": args.instrument_bank,
+                   "bpm": args.bpm,
+                   "wall_time": time.time() - start,
+                   "files": results}, f, indent=4)
 
+    print("Converted {0} files in {1:.2f}s, results written to {2}".format(len(results),
+                                                                           time.time() - start,
+                                                                           manifest_path))
@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from pyBMS import BmsInterpreter, PARSERS
+from bmsmodules.song_generator import generate_song
+
+# Metrics of which higher values are better. For all other metrics
+# ending with _time or _memory, lower values are better.
+THROUGHPUT_METRICS = ("commands_per_second", "ticks_per_second",
+                      "events_per_second", "bytes_per_second")
+
+# The songs that are generated for every benchmark run, with the arguments for build_song
+# and whether they are interpreted with parse_file_parallel instead of parse_file.
+GENERATED_SONGS = [("generated_small", dict(track_count=4, notes_per_track=500), False),
+                   ("generated_large", dict(track_count=16, notes_per_track=5000), False),
+                   ("generated_many_tracks", dict(track_count=40, notes_per_track=500), False),
+                   ("generated_looping", dict(track_count=8, notes_per_track=1000, loop=True), False),
+                   ("generated_nested", dict(track_count=16, notes_per_track=1000, nesting=4,
+                                             pattern_notes=8, extra_command_chance=0.2), False),
+                   ("generated_large_parallel", dict(track_count=16, notes_per_track=5000), True),
+                   ("generated_looping_parallel", dict(track_count=8, notes_per_track=1000,
+                                                       loop=True), True)]
+
+GENERATED_PARSER = "pikmin2"
+
+
+def interpret(bms_data, parser_name, parallel):
+    interpreter = BmsInterpreter(bms_data, parser_name=parser_name, scheduler_mode="event")
+
+    if parallel:
+        interpreter.parse_file_parallel()
+    else:
+        interpreter.parse_file()
+
+    return interpreter
+
+
+# Returns what func returns and the most memory that has been allocated by Python
+# while func was running, counted from the time at which tracemalloc has been started.
+def measure_memory(func, *args):
+    tracemalloc.reset_peak()
+    result = func(*args)
+
+    return result, tracemalloc.get_traced_memory()[1]
+
+
+def compile_midi(interpreter):
+    return interpreter.scheduler.compile_midi(instrument_bank=0, bpm=100)
+
+
+def write_midi(midi_data, midi_file):
+    midi_file.seek(0)
+    midi_file.truncate()
+    midi_data.write_midi(midi_file)
+    midi_file.flush()
+
+
+# Runs in a separate process, so that nothing is left over from the other cases.
+# The midi data is compiled in memory, so the write stage only writes the encoded
+# tracks into a real file on disk.
+def run_case(case):
+    name, bms_data, parser_name, parallel, repeat = case
+
+    # The amount of commands is only known from a profiled run, which is not timed.
+    interpreter = BmsInterpreter(bms_data, parser_name=parser_name,
+                                 scheduler_mode="event", profile=True)
+    interpreter.parse_file()
+    commands = interpreter.profiler.get_report()["commands"]
+    del interpreter
+
+    interpret_time = compile_time = write_time = None
+
+    with tempfile.TemporaryFile() as midi_file:
+        for i in range(repeat):
+            start = time.time()
+            interpreter = interpret(bms_data, parser_name, parallel)
+            interpreted = time.time()
+
+            midi_data = compile_midi(interpreter)
+            compiled = time.time()
+
+            write_midi(midi_data, midi_file)
+            written = time.time()
+
+            interpret_time = min(interpret_time, interpreted - start) if i > 0 else interpreted - start
+            compile_time = min(compile_time, compiled - interpreted) if i > 0 else compiled - interpreted
+            write_time = min(write_time, written - compiled) if i > 0 else written - compiled
+
+            del interpreter, midi_data
+
+        # Tracing the memory slows everything down, so it is measured in a run of its own.
+        # With parse_file_parallel, the memory of the worker processes is not included.
+        tracemalloc.start()
+        try:
+            interpreter, interpret_memory = measure_memory(interpret, bms_data, parser_name, parallel)
+            midi_data, compile_memory = measure_memory(compile_midi, interpreter)
+            ignored, write_memory = measure_memory(write_midi, midi_data, midi_file)
+        finally:
+            tracemalloc.stop()
+
+        midi_bytes = midi_file.tell()
+
+    ticks = interpreter.get_ticks()
+    events = interpreter.scheduler.event_count()
+
+    result = {"status": interpreter.status,
+              "commands": commands,
+              "ticks": ticks,
+              "events": events,
+              "midi_bytes": midi_bytes,
+              "interpret_time": interpret_time,
+              "commands_per_second": commands/interpret_time if interpret_time else None,
+              "ticks_per_second": ticks/interpret_time if interpret_time else None,
+              "compile_time": compile_time,
+              "events_per_second": events/compile_time if compile_time else None,
+              "write_time": write_time,
+              "bytes_per_second": midi_bytes/write_time if write_time else None,
+              "interpret_memory": interpret_memory,
+              "compile_memory": compile_memory,
+              "write_memory": write_memory,
+              "peak_memory": max(interpret_memory, compile_memory, write_memory)}
+
+    return name, result
+
+
+# Measures how long a new Python process takes to import the parsers,
+# and to create the first parser after that.
+def measure_import(repeat):
+    code = ("import time; start = time.time(); from EventParsers import parsers; "
+            "imported = time.time(); parsers.container.get_parser(2); "
+            "print(imported - start, time.time() - imported)")
+
+    import_time = parser_time = None
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=base_dir,
+                                         universal_newlines=True)
+        imported, parsed = [float(value) for value in output.split()]
+
+        import_time = min(import_time, imported) if i > 0 else imported
+        parser_time = min(parser_time, parsed) if i > 0 else parsed
+
+    return {"import_time": import_time,
+            "first_parser_time": parser_time}
+
+
+def run_benchmarks(sample_dir=None, sample_parser="pikmin2", repeat=3):
+    cases = []
+
+    for name, song_args, parallel in GENERATED_SONGS:
+        cases.append((name, generate_song(PARSERS[GENERATED_PARSER], **song_args),
+                      GENERATED_PARSER, parallel, repeat))
+
+    if sample_dir is not None:
+        for file_name in sorted(os.listdir(sample_dir)):
+            if file_name.endswith(".bms"):
+                with open(os.path.join(sample_dir, file_name), "rb") as f:
+                    cases.append((file_name, f.read(), sample_parser, False, repeat))
+
+    results = {}
+
+    for case in cases:
+        # Unlike the processes of multiprocessing.Pool, the process of the executor
+        # can start the pool of parse_file_parallel.
+        with ProcessPoolExecutor(1) as executor:
+            name, result = executor.submit(run_case, case).result()
+
+        results[name] = result
+        print("{0}: {1:.0f} commands/s, {2:.0f} ticks/s, {3:.0f} events/s, {4:.0f} bytes/s".format(
+            name, result["commands_per_second"] or 0, result["ticks_per_second"] or 0,
+            result["events_per_second"] or 0, result["bytes_per_second"] or 0))
+
+    return {"python": sys.version.split()[0],
+            "repeat": repeat,
+            "import": measure_import(repeat),
+            "cases": results}
+
+
+def _is_lower_better(metric):
+    return metric.endswith("_time") or metric.endswith("_memory")
+
+
+# Returns (where, metric, baseline value, new value, change, is regression) tuples
+# for every metric that is in both results. change is the relative change of the value,
+# positive values are improvements. A regression is a change worse than -tolerance.
+def compare_results(baseline, results, tolerance):
+    pairs = [("import", baseline["import"], results["import"])]
+
+    for name in sorted(results["cases"]):
+        if name in baseline["cases"]:
+            pairs.append((name, baseline["cases"][name], results["cases"][name]))
+
+    comparison = []
+
+    for where, old_metrics, new_metrics in pairs:
+        for metric in sorted(new_metrics):
+            if metric not in THROUGHPUT_METRICS and not _is_lower_better(metric):
+                continue
+
+            old_value, new_value = old_metrics.get(metric), new_metrics[metric]
+            if not old_value or new_value is None:
+                continue
+
+            change = (new_value - old_value)/float(old_value)
+            if _is_lower_better(metric):
+                change = -change
+
+            comparison.append((where, metric, old_value, new_value, change, change < -tolerance))
+
+    return comparison
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Measure the speed of the interpreter "
+                                                     "and the midi conversion.")
+    arg_parser.add_argument("--samples", default=None,
+                            help="A directory with BMS files to run in addition to the generated songs. "
+                                 "No game files come with the repository, they need to be supplied here")
+    arg_parser.add_argument("--parser", default="pikmin2", choices=sorted(PARSERS.keys()),
+                            help="The parser for the BMS files in the samples directory")
+    arg_parser.add_argument("--repeat", type=int, default=3,
+                            help="The best of this many runs is used")
+    arg_parser.add_argument("--output", default="benchmark.json",
+                            help="Where to write the results")
+    arg_parser.add_argument("--baseline", default=None,
+                            help="The results of an earlier run to compare with")
+    arg_parser.add_argument("--tolerance", type=float, default=0.1,
+                            help="How much worse a metric can get before it counts as a regression")
+
+    args = arg_parser.parse_args()
+
+    results = run_benchmarks(args.samples, args.parser, args.repeat)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+
+    print("Import: {import_time:.3f}s, first parser: {first_parser_time:.3f}s".format(**results["import"]))
+    print("Results written to", args.output)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+        regressions = 0
+
+        for where, metric, old_value, new_value, change, regressed in compare_results(baseline, results,
+                                                                                      args.tolerance):
+            print("{0:<8} {1}: {2}: {3:.4g} -> {4:.4g} ({5:+.1%})".format(
+                "WORSE" if regressed else "", where, metric, old_value, new_value, change))
+
+            if regressed:
+                regressions += 1
+
+        print("{0} regressions".format(regressions))
+
+        if regressions > 0:
+            sys.exit(1)
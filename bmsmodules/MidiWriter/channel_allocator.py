@@ -0,0 +1,110 @@
+from .event_kinds import EVENT_NOTE_ON, EVENT_PROGRAM
+
+CHANNELS_PER_PORT = 16
+
+
+# Describes on which port and channel the events of every track are played.
+class ChannelAllocation(object):
+    def __init__(self):
+        # (port, channel) tuples by track id
+        self.channels = {}
+
+        # (tick, program) tuples by track id of the tracks that take over a channel which
+        # another track has used before. The channel needs to be reset at the tick,
+        # which is the tick of the first event of the track, see reset_channel.
+        self.resets = {}
+
+    def set_channel(self, track_id, port, channel):
+        self.channels[track_id] = (port, channel)
+
+    def get_channel(self, track_id):
+        return self.channels[track_id]
+
+    def set_reset(self, track_id, tick, program):
+        self.resets[track_id] = (tick, program)
+
+    # Returns None if the track does not need to reset its channel.
+    def get_reset(self, track_id):
+        return self.resets.get(track_id)
+
+    def port_count(self):
+        if len(self.channels) == 0:
+            return 1
+        else:
+            return max(port for port, channel in self.channels.values()) + 1
+
+    def channel_count(self):
+        return len(set(self.channels.values()))
+
+    # The mapping as a dictionary that can be written to a JSON file.
+    def as_dict(self):
+        return {str(track_id): list(port_channel)
+                for track_id, port_channel in self.channels.items()}
+
+
+# Returns the program that is used for the first note of the track. A channel
+# plays program 0 until it receives a program change.
+def get_initial_program(track, default=0):
+    for kind, data1 in zip(track.kinds, track.data1):
+        if kind == EVENT_PROGRAM:
+            return data1
+        elif kind == EVENT_NOTE_ON:
+            return default
+
+    return default
+
+
+# Returns the program that is used after the last event of the track.
+def get_final_program(track, initial_program):
+    for i in range(len(track) - 1, -1, -1):
+        if track.kinds[i] == EVENT_PROGRAM:
+            return track.data1[i]
+
+    return initial_program
+
+
+# Puts the tracks onto as few channels as possible. If every track id is a valid
+# channel, the track ids are used as the channels, like in older versions.
+# Otherwise, a track shares a channel with other tracks if their events do not
+# overlap in time and the channel still uses the program the track starts with,
+# so that every track sounds like it would on a channel of its own. The controllers
+# and the pitch that the tracks before it have changed are reset, see reset_channel.
+# Once all 16 channels of a port are used up, the channels of the next port are used.
+def allocate_channels(tracks):
+    allocation = ChannelAllocation()
+
+    if all(0 <= track_id < CHANNELS_PER_PORT for track_id in tracks):
+        for track_id in tracks:
+            allocation.set_channel(track_id, 0, track_id)
+
+        return allocation
+
+    # [tick of the last event, program] of every channel in use, channel i
+    # being channel i % 16 of port i // 16.
+    channels = []
+
+    # The tracks are handled in the order in which they start playing. Tracks
+    # without events do not play anything and can be put on any channel.
+    playing_tracks = sorted((min(track.ticks), track_id)
+                            for track_id, track in tracks.items() if len(track) > 0)
+
+    for first_tick, track_id in playing_tracks:
+        track = tracks[track_id]
+        initial_program = get_initial_program(track)
+
+        for i, (last_tick, program) in enumerate(channels):
+            if last_tick < first_tick and program == initial_program:
+                allocation.set_reset(track_id, first_tick, initial_program)
+                break
+        else:
+            i = len(channels)
+            channels.append(None)
+
+        channels[i] = [max(track.ticks), get_final_program(track, initial_program)]
+        allocation.set_channel(track_id, i // CHANNELS_PER_PORT, i % CHANNELS_PER_PORT)
+
+    for track_id, track in tracks.items():
+        if len(track) == 0:
+            allocation.set_channel(track_id, 0, 0)
+
+    return allocation
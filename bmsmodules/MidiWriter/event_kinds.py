@@ -0,0 +1,19 @@
+# The kinds of events which are stored by the scheduler.
+EVENT_NOTE_ON = 0
+EVENT_NOTE_OFF = 1
+EVENT_CONTROLLER = 2
+EVENT_CONTROLLER_TWO_BYTES = 3
+EVENT_PROGRAM = 4
+EVENT_PITCH = 5
+EVENT_BPM = 6
+EVENT_PPQN = 7
+
+# The names of the event kinds, as used by actions_iter.
+EVENT_NAMES = {EVENT_NOTE_ON: "note_on",
+               EVENT_NOTE_OFF: "note_off",
+               EVENT_CONTROLLER: "controller",
+               EVENT_CONTROLLER_TWO_BYTES: "controller",
+               EVENT_PROGRAM: "program",
+               EVENT_PITCH: "pitch",
+               EVENT_BPM: "bpm",
+               EVENT_PPQN: "ppqn"}
@@ -1,87 +1,148 @@
 import struct
 
-from math import log, ceil
-from cStringIO import StringIO
+from io import BytesIO
 
+HEADER = struct.Struct(">4sIHHH")
+TRACK_HEADER = struct.Struct(">4sI")
+TRACK_LENGTH = struct.Struct(">I")
 
+SHORT_EVENT = struct.Struct("Bbb")
+PROGRAM_EVENT = struct.Struct("BB")
+CONTROLLER_TWO_BYTES = struct.Struct("Bbbb")
+META_EVENT = struct.Struct("BB")
+TEMPO_DATA = struct.Struct("BBB")
+
+END_OF_TRACK = b"\xFF\x2F\x00"
+
+# The events of a track are encoded into a buffer of this size, which is
+# written to the file whenever it is full and when the track ends.
+BUFFER_SIZE = 64*1024
+
+# Enough space for the delta time (at most 5 bytes) and any event
+# except for meta events, which reserve space for their data separately.
+MAX_EVENT_SIZE = 16
+
+
+# If fileobj is given, the midi data is written to it while the tracks are being
+# created, instead of being kept in memory until write_midi is called. fileobj
+# needs to be seekable, because the length of a track is only known once it has ended.
 class MIDI(object):
-    def __init__(self, track_amount, bpm):
-        self.midi_file = StringIO()
+    def __init__(self, track_amount, bpm, fileobj=None):
+        self._streaming = fileobj is not None
+
+        if fileobj is None:
+            fileobj = BytesIO()
+        self.midi_file = fileobj
         
-        self.magic = "MThd"
+        self.magic = b"MThd"
         self.header_size = 6
         
         self.midi_format_version = 1
         self.track_amount = track_amount
         self.tempo = bpm
         
-        self.midi_file.write(self.magic)
-        self.midi_file.write(struct.pack(">IHHH", 
+        self.midi_file.write(HEADER.pack(self.magic,
                                          self.header_size, self.midi_format_version,
                                          self.track_amount, self.tempo))
     
         self._current_track_length = 0
-        self._track_data = None
-    
+        self._track_start = None
+
+        self._buffer = bytearray(BUFFER_SIZE)
+        self._buffer_pos = 0
+
+    # Makes sure that the buffer has space for size more bytes.
+    def _reserve(self, size):
+        if self._buffer_pos + size > len(self._buffer):
+            self._flush()
+
+            if size > len(self._buffer):
+                self._buffer = bytearray(size)
+
+    def _flush(self):
+        self.midi_file.write(memoryview(self._buffer)[:self._buffer_pos])
+        self._current_track_length += self._buffer_pos
+        self._buffer_pos = 0
+
+    # Encodes the time and returns the position in the buffer after it.
+    # There needs to be enough space reserved.
+    def _write_time(self, time_passed):
+        if self._track_start is None:
+            raise RuntimeError("You need to start a track before adding events to it!")
+
+        return pack_varlen_into(self._buffer, self._buffer_pos, time_passed)
+
     def write_action(self, time_passed, data):
-        varlength_bytes = varlen_encode(time_passed)
+        self._reserve(MAX_EVENT_SIZE + len(data))
 
-        packed_varlength = struct.pack("B"*len(varlength_bytes), *varlength_bytes)
-        
-        self._track_data.write(packed_varlength)
-        self._track_data.write(data)#append((packedVariableLength, data))
+        pos = self._write_time(time_passed)
+        self._buffer[pos:pos+len(data)] = data
+        self._buffer_pos = pos + len(data)
     
+    # Adds events which have already been encoded, e.g. by midi_numpy.encode_track.
+    def write_encoded_events(self, data):
+        if self._track_start is None:
+            raise RuntimeError("You need to start a track before adding events to it!")
+
+        self._flush()
+        self.midi_file.write(data)
+        self._current_track_length += len(data)
+
     def start_track(self):
-        if self._track_data is not None:
+        if self._track_start is not None:
             raise RuntimeError("You need to end the previous track before starting a new one!")
         
-        header = "MTrk"
+        # The length of the track is written once the track has ended.
+        self._track_start = self.midi_file.tell()
+        self.midi_file.write(TRACK_HEADER.pack(b"MTrk", 0))
         self._current_track_length = 0
-        self._track_data = StringIO()
+
+    def _write_short_event(self, time_passed, status, data1, data2):
+        self._reserve(MAX_EVENT_SIZE)
+
+        pos = self._write_time(time_passed)
+        SHORT_EVENT.pack_into(self._buffer, pos, status, data1, data2)
+        self._buffer_pos = pos + 3
     
     def note_on(self, time_passed, channel, note, velocity):
         assert channel <= 15
         
-        note_data = struct.pack("Bbb", 0x90+channel, note, velocity)
-        
-        self.write_action(time_passed, note_data)
+        self._write_short_event(time_passed, 0x90+channel, note, velocity)
     
     def note_off(self, time_passed, channel, note, velocity):
         assert channel <= 15
         
-        note_data = struct.pack("Bbb", 0x80+channel, note, velocity)
-        
-        self.write_action(time_passed, note_data)
+        self._write_short_event(time_passed, 0x80+channel, note, velocity)
     
     def set_instrument(self, time_passed, channel, instrument):
         assert channel <= 15
         assert 0 <= instrument <= 127
         
-        note_data = struct.pack("BB", 0xC0+channel, instrument)
-        
-        self.write_action(time_passed, note_data)
+        self._reserve(MAX_EVENT_SIZE)
+
+        pos = self._write_time(time_passed)
+        PROGRAM_EVENT.pack_into(self._buffer, pos, 0xC0+channel, instrument)
+        self._buffer_pos = pos + 2
     
     def set_pitch(self, time_passed, channel, pitch):
         assert channel <= 15
         
         # the 7 least significant bits come into the first data byte,
         # the 7 most significant bits come into the second data byte
-        pitch_lsb = (pitch >> 7) & 127
-        pitch_msb = pitch & 127
+        pitch_lsb = pitch & 127
+        pitch_msb = (pitch >> 7) & 127
         
-        #self.write_short(0xE0 + channel, pitch_lsb, pitch_msb)
-        pitch_data = struct.pack("Bbb", 0xE0+channel, pitch_lsb, pitch_msb)
-        
-        self.write_action(time_passed, pitch_data)
+        self._write_short_event(time_passed, 0xE0+channel, pitch_lsb, pitch_msb)
     
     def set_meta_event(self, time_passed, meta_event_type, data):
-        varlength_bytes = varlen_encode(len(data))
-        
-        meta_event_data = struct.pack("BB" + "B"*len(varlength_bytes), 0xFF,
-                                      meta_event_type, *varlength_bytes)
-        meta_event_data += data
-        
-        self.write_action(time_passed, meta_event_data)
+        self._reserve(MAX_EVENT_SIZE + len(data))
+
+        pos = self._write_time(time_passed)
+        META_EVENT.pack_into(self._buffer, pos, 0xFF, meta_event_type)
+        pos = pack_varlen_into(self._buffer, pos + 2, len(data))
+
+        self._buffer[pos:pos+len(data)] = data
+        self._buffer_pos = pos + len(data)
     
     def set_tempo(self, time_passed, tempo):
         assert tempo <= 2**24-1
@@ -90,68 +151,85 @@ class MIDI(object):
         tempo_byte2 = (tempo >> 8) & 0xFF
         tempo_byte3 = tempo & 0xFF
         
-        data = struct.pack("BBB", tempo_byte1, tempo_byte2, tempo_byte3)
+        data = TEMPO_DATA.pack(tempo_byte1, tempo_byte2, tempo_byte3)
         
         self.set_meta_event(time_passed, 0x51, data)
         
+    # All following events of the track are sent to the given port.
+    # This allows for more than 16 channels.
+    def set_port(self, time_passed, port):
+        assert 0 <= port <= 127
+
+        self.set_meta_event(time_passed, 0x21, bytes((port, )))
+
     def program_event(self, time_passed, channel, program, value, two_bytes=False):
         assert channel <= 15
         
         if not two_bytes:
             assert value <= 127
             
-            program_data = struct.pack("Bbb", 0xB0+channel, program, value)
+            self._write_short_event(time_passed, 0xB0+channel, program, value)
         else:
             assert value <= 2**14-1
             
             value_msb = (value >> 7) & 127
             value_lsb = value & 127
 
-            program_data = struct.pack("Bbbb", 0xB0+channel, program,
-                                       value_lsb, value_msb)
-        
-        self.write_action(time_passed, program_data)
+            self._reserve(MAX_EVENT_SIZE)
+
+            pos = self._write_time(time_passed)
+            CONTROLLER_TWO_BYTES.pack_into(self._buffer, pos, 0xB0+channel, program,
+                                           value_lsb, value_msb)
+            self._buffer_pos = pos + 4
 
     def end_track(self, time_passed=0):
-        end_of_track = struct.pack("BBB", 0xFF, 0x2F, 0x00)
-        self.write_action(time_passed, end_of_track)
-        
-        track_data = self._track_data.getvalue()
-        
-        self.midi_file.write("MTrk")
-        self.midi_file.write(struct.pack(">I", len(track_data)))
-        self.midi_file.write(track_data)
-        #for action in self.__track_data:
-        #    time, data = action
-        #    self.midi_file.write(time)
-        #    self.midi_file.write(data)
+        self.write_action(time_passed, END_OF_TRACK)
+        self._flush()
+
+        # Now that the length of the track is known, it is written into the header of the track.
+        track_end = self.midi_file.tell()
+        self.midi_file.seek(self._track_start + 4)
+        self.midi_file.write(TRACK_LENGTH.pack(self._current_track_length))
+        self.midi_file.seek(track_end)
         
-        self._track_data = None
+        self._track_start = None
 
     def write_midi(self, fileobj):
-        fileobj.write(self.midi_file.getvalue())
+        if self._streaming:
+            raise RuntimeError("The midi data has already been written to the file "
+                               "object the MIDI instance has been created with!")
+
+        fileobj.write(self.midi_file.getbuffer())
             
 
+# Writes the variable length quantity into the buffer at offset
+# and returns the offset after it.
+def pack_varlen_into(buffer, offset, number):
+    if number < 0x80:
+        buffer[offset] = number
+        return offset + 1
+
+    # The 7 bit groups of the number, starting with the least significant one.
+    groups = []
+    while number > 0:
+        groups.append(number & 0x7F)
+        number >>= 7
+
+    # Every byte except for the last one has the most significant bit set.
+    for i in range(len(groups)-1, 0, -1):
+        buffer[offset] = groups[i] | 0x80
+        offset += 1
+
+    buffer[offset] = groups[0]
+
+    return offset + 1
+
+
 def varlen_encode(number):
-    if number == 0:
-        bytes_needed = 1
-        data = [0b00000000]
-        return data#struct.pack("B", 0b10000000)
-    else:
-        # The number of bytes we need to encode the variable length
-        bytes_needed = max(
-            int(ceil(log(number, 128))),
-            1)
-    
-    data = []
-    for i in reversed(xrange(bytes_needed)):
-        byte = (number >> (i*7)) & 127
-        data.append(byte | 0b10000000)
-    #print data, number, bytes_needed
-    last_byte = data[-1]
-    data[-1] = last_byte & 127# 0b10000000
-    
-    return data
+    data = bytearray(5)
+    length = pack_varlen_into(data, 0, number)
+
+    return list(data[:length])
 
 if __name__ == "__main__":
     my_midi = MIDI(2, 96)
@@ -175,4 +253,4 @@ if __name__ == "__main__":
     with open("myMidi_test.midi", "wb") as f:
         my_midi.write_midi(f)
     
-    print "Done!"
\ No newline at end of file
+    print("Done!")
\ No newline at end of file
@@ -0,0 +1,149 @@
+from .event_kinds import (EVENT_NOTE_ON, EVENT_NOTE_OFF, EVENT_CONTROLLER, EVENT_CONTROLLER_TWO_BYTES,
+                         EVENT_PROGRAM, EVENT_PITCH, EVENT_BPM, EVENT_PPQN)
+
+# NumPy is optional. Without it, the tracks are encoded event by event by the MIDI class.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The status byte and the size of each kind of event, without the delta time.
+# Tempo changes are meta events: FF 51 03 followed by the 3 bytes of the tempo.
+STATUS_BYTES = [0x90, 0x80, 0xB0, 0xB0, 0xC0, 0xE0, 0xFF, 0xFF]
+EVENT_SIZES = [3, 3, 3, 4, 2, 3, 6, 6]
+
+EVENT_KIND_COUNT = len(EVENT_SIZES)
+
+# A delta time of up to 32 bits takes up to 5 bytes as a variable length quantity.
+MAX_VARLEN_SIZE = 5
+MAX_EVENT_SIZE = 6
+
+
+def is_available():
+    return numpy is not None
+
+
+def _as_array(data, dtype):
+    if len(data) == 0:
+        return numpy.zeros(0, dtype=dtype)
+    else:
+        return numpy.frombuffer(data, dtype=data.typecode).astype(dtype)
+
+
+def _in_range(values, mask, minimum, maximum):
+    selected = values[mask]
+    return len(selected) == 0 or (selected.min() >= minimum and selected.max() <= maximum)
+
+
+# Encodes all events of an EventTrack at once and returns the encoded events together with
+# the last BPM value, which is needed for the tempo of PPQN events in the following tracks.
+# The result is the same as the one of MidiScheduler._compile_track. If the track has events
+# that would make the MIDI class raise an error, None is returned, so that the track is
+# compiled event by event and raises the same error.
+def encode_track(track, channel, last_bpm):
+    if channel > 15:
+        return None
+
+    count = len(track)
+    if count == 0:
+        return b"", last_bpm
+
+    ticks = _as_array(track.ticks, numpy.int64)
+    kinds = _as_array(track.kinds, numpy.int64)
+    data1 = _as_array(track.data1, numpy.int64)
+    data2 = _as_array(track.data2, numpy.int64)
+
+    if kinds.max() >= EVENT_KIND_COUNT:
+        return None
+
+    deltas = ticks.copy()
+    deltas[1:] -= ticks[:-1]
+
+    if deltas.min() < 0:
+        return None
+
+    is_note = (kinds == EVENT_NOTE_ON) | (kinds == EVENT_NOTE_OFF)
+    is_controller = kinds == EVENT_CONTROLLER
+    is_controller_two_bytes = kinds == EVENT_CONTROLLER_TWO_BYTES
+    is_program = kinds == EVENT_PROGRAM
+    is_pitch = kinds == EVENT_PITCH
+    is_bpm = kinds == EVENT_BPM
+    is_ppqn = kinds == EVENT_PPQN
+
+    # The data bytes of these events are packed as signed bytes.
+    if not (_in_range(data1, is_note | is_controller | is_controller_two_bytes, -128, 127)
+            and _in_range(data2, is_note | is_controller, -128, 127)
+            and _in_range(data2, is_controller_two_bytes, -2**15, 2**14-1)
+            and _in_range(data1, is_program, 0, 127)):
+        return None
+
+    # The BPM value at every event is the one of the last BPM event before it,
+    # or the one from the previous tracks if there is none.
+    bpm_index = numpy.where(is_bpm, numpy.arange(count), -1)
+    numpy.maximum.accumulate(bpm_index, out=bpm_index)
+    current_bpm = numpy.where(bpm_index >= 0, data1[bpm_index], last_bpm)
+
+    divisors = numpy.where(is_bpm, data1, 0)
+    divisors[is_ppqn] = current_bpm[is_ppqn]*data1[is_ppqn]
+    is_tempo = is_bpm | is_ppqn
+
+    if not (divisors[is_tempo] > 0).all():
+        return None
+
+    tempos = numpy.zeros(count, dtype=numpy.int64)
+    tempos[is_tempo] = 60000000 // divisors[is_tempo]
+
+    if tempos.max() > 2**24-1:
+        return None
+
+    if bpm_index[-1] >= 0:
+        last_bpm = int(data1[bpm_index[-1]])
+
+    # The bytes of every event which follow its delta time.
+    body = numpy.zeros((count, MAX_EVENT_SIZE), dtype=numpy.int64)
+    body[:, 0] = numpy.take(STATUS_BYTES, kinds) + numpy.where(is_tempo, 0, channel)
+    body[:, 1] = data1 & 0xFF
+    body[:, 2] = data2 & 0xFF
+
+    body[is_pitch, 1] = data1[is_pitch] & 127
+    body[is_pitch, 2] = (data1[is_pitch] >> 7) & 127
+
+    body[is_controller_two_bytes, 2] = data2[is_controller_two_bytes] & 127
+    body[is_controller_two_bytes, 3] = (data2[is_controller_two_bytes] >> 7) & 127
+
+    body[is_tempo, 1] = 0x51
+    body[is_tempo, 2] = 3
+    body[is_tempo, 3] = (tempos[is_tempo] >> 16) & 0xFF
+    body[is_tempo, 4] = (tempos[is_tempo] >> 8) & 0xFF
+    body[is_tempo, 5] = tempos[is_tempo] & 0xFF
+
+    # Every event starts with its delta time as a variable length quantity.
+    varlen_sizes = numpy.ones(count, dtype=numpy.int64)
+    for i in range(1, MAX_VARLEN_SIZE):
+        varlen_sizes += deltas >= (1 << (7*i))
+
+    event_sizes = numpy.take(EVENT_SIZES, kinds)
+    ends = numpy.cumsum(varlen_sizes + event_sizes)
+    starts = ends - varlen_sizes - event_sizes
+
+    encoded = numpy.zeros(ends[-1], dtype=numpy.uint8)
+
+    for i in range(MAX_VARLEN_SIZE):
+        mask = varlen_sizes > i
+        remaining = varlen_sizes[mask] - 1 - i
+
+        # The 7 most significant bits come first, every byte except
+        # for the last one has the most significant bit set.
+        groups = (deltas[mask] >> (7*remaining)) & 0x7F
+        groups |= numpy.where(remaining > 0, 0x80, 0)
+
+        encoded[starts[mask] + i] = groups
+
+    body_starts = starts + varlen_sizes
+
+    for i in range(MAX_EVENT_SIZE):
+        mask = event_sizes > i
+        encoded[body_starts[mask] + i] = body[mask, i]
+
+    # The array is written to the file as it is, without copying it into a bytes object.
+    return memoryview(encoded), last_bpm
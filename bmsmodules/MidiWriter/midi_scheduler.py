@@ -1,4 +1,65 @@
-from midi import MIDI
+from array import array
+
+from . import midi_numpy
+from .channel_allocator import allocate_channels
+from .event_kinds import (EVENT_NOTE_ON, EVENT_NOTE_OFF, EVENT_CONTROLLER, EVENT_CONTROLLER_TWO_BYTES,
+                         EVENT_PROGRAM, EVENT_PITCH, EVENT_BPM, EVENT_PPQN, EVENT_NAMES)
+from .midi import MIDI
+
+
+# The events of a track are stored in parallel arrays instead of a list of tuples,
+# which needs about 11 bytes per event: the tick, the kind of the event and
+# up to two arguments, e.g. the note and the volume of a note_on event.
+class EventTrack(object):
+    def __init__(self, starts_at):
+        self.starts_at = starts_at
+
+        self.ticks = array("I")
+        self.kinds = array("B")
+        self.data1 = array("i")
+        self.data2 = array("h")
+
+    def add(self, tick, kind, data1=0, data2=0):
+        self.ticks.append(tick)
+        self.kinds.append(kind)
+        self.data1.append(data1)
+        self.data2.append(data2)
+
+    def __len__(self):
+        return len(self.ticks)
+
+    # Removes all events but the first count events.
+    def truncate(self, count):
+        del self.ticks[count:]
+        del self.kinds[count:]
+        del self.data1[count:]
+        del self.data2[count:]
+
+    # Yields (tick, kind, data1, data2) tuples.
+    def __iter__(self):
+        return zip(self.ticks, self.kinds, self.data1, self.data2)
+
+
+# Returns a copy of the track which starts with events that put its channel back into the
+# state of an unused channel at the tick, so that the controllers, the pitch and the program
+# set by the tracks that have used the channel before do not carry over to it.
+# Controller 121 resets all controllers but the volume and the pan, which are set to
+# their default values separately.
+def reset_channel(track, tick, program):
+    reset_track = EventTrack(track.starts_at)
+
+    reset_track.add(tick, EVENT_CONTROLLER, 121, 0)
+    reset_track.add(tick, EVENT_CONTROLLER, 7, 100)
+    reset_track.add(tick, EVENT_CONTROLLER, 10, 64)
+    reset_track.add(tick, EVENT_PITCH, 0x2000)
+    reset_track.add(tick, EVENT_PROGRAM, program)
+
+    reset_track.ticks.extend(track.ticks)
+    reset_track.kinds.extend(track.kinds)
+    reset_track.data1.extend(track.data1)
+    reset_track.data2.extend(track.data2)
+
+    return reset_track
 
 
 # BMS files, when played back, have lots of tracks playing at once.
@@ -9,53 +70,125 @@ class MidiScheduler(object):
     def __init__(self):
         self.tracks = {}
 
-    def add_track(self, track_id, tick):
-        self.tracks[track_id] = {"starts_at": tick, "actions": []}
+        # The ChannelAllocation used by the last call of compile_midi.
+        self.channels = None
+
+        # The values of the last BPM and PPQN events, if there were any.
+        self.bpm = None
+        self.ppqn = None
 
-    def add_action(self, track_id, tick, action):
-        self.tracks[track_id]["actions"].append((tick, action))
+    def add_track(self, track_id, tick):
+        self.tracks[track_id] = EventTrack(tick)
 
     def note_on(self, track_id, tick, note, volume):
-        self.add_action(track_id, tick, ("note_on", note, volume))
+        self.tracks[track_id].add(tick, EVENT_NOTE_ON, note, volume)
 
     def note_off(self, track_id, tick, note, volume):
-        self.add_action(track_id, tick, ("note_off", note, volume))
+        self.tracks[track_id].add(tick, EVENT_NOTE_OFF, note, volume)
 
     def controller_event(self, track_id, tick, controller, value, use_two_bytes=False):
-        self.add_action(track_id, tick, ("controller", controller, value, use_two_bytes))
+        if use_two_bytes:
+            self.tracks[track_id].add(tick, EVENT_CONTROLLER_TWO_BYTES, controller, value)
+        else:
+            self.tracks[track_id].add(tick, EVENT_CONTROLLER, controller, value)
 
     def program_change(self, track_id, tick, program):
-        self.add_action(track_id, tick, ("program", program))
+        self.tracks[track_id].add(tick, EVENT_PROGRAM, program)
 
     def pitch_change(self, track_id, tick, pitch):
-        self.add_action(track_id, tick, ("pitch", pitch))
+        self.tracks[track_id].add(tick, EVENT_PITCH, pitch)
 
     def change_bpm(self, track_id, tick, bpm):
-        self.add_action(track_id, tick, ("bpm", bpm))
+        self.tracks[track_id].add(tick, EVENT_BPM, bpm)
+        self.bpm = bpm
 
     def change_ppqn(self, track_id, tick, ppqn):
-        self.add_action(track_id, tick, ("ppqn", ppqn))
+        self.tracks[track_id].add(tick, EVENT_PPQN, ppqn)
+        self.ppqn = ppqn
+
+    # Returns the amount of events of every track and the tempo, so that
+    # the events added afterwards can be removed with restore_checkpoint.
+    def save_checkpoint(self):
+        event_counts = tuple((track_id, len(track)) for track_id, track in self.tracks.items())
+
+        return event_counts, self.bpm, self.ppqn
+
+    def restore_checkpoint(self, checkpoint):
+        event_counts, self.bpm, self.ppqn = checkpoint
+        event_counts = dict(event_counts)
+
+        for track_id in list(self.tracks):
+            if track_id not in event_counts:
+                del self.tracks[track_id]
+            else:
+                self.tracks[track_id].truncate(event_counts[track_id])
 
     def track_iterator(self):
         for trackID in self.tracks:
             yield trackID
 
     def get_track_start(self, track_id):
-        return self.tracks[track_id]["starts_at"]
+        return self.tracks[track_id].starts_at
+
+    def event_count(self):
+        return sum(len(track) for track in self.tracks.values())
+
+    # Returns the events of all tracks as (tick, track_id, kind, data1, data2) tuples,
+    # sorted by tick. read_counts maps track ids to the amount of their events that
+    # have been returned before. It is updated, so that passing the same dictionary
+    # again only returns the events that have been added since.
+    def collect_events(self, read_counts=None):
+        if read_counts is None:
+            read_counts = {}
+
+        events = []
+
+        for track_id, track in self.tracks.items():
+            start = read_counts.get(track_id, 0)
 
+            for i in range(start, len(track)):
+                events.append((track.ticks[i], track_id, track.kinds[i],
+                               track.data1[i], track.data2[i]))
+
+            read_counts[track_id] = len(track)
+
+        events.sort()
+
+        return events
+
+    # Yields the events of the track as (tick, (name, arguments...)) tuples.
     def actions_iter(self, track_id):
-        for action in self.tracks[track_id]["actions"]:
-            yield action
+        for tick, kind, data1, data2 in self.tracks[track_id]:
+            name = EVENT_NAMES[kind]
+
+            if kind in (EVENT_NOTE_ON, EVENT_NOTE_OFF):
+                yield tick, (name, data1, data2)
+            elif kind == EVENT_CONTROLLER:
+                yield tick, (name, data1, data2, False)
+            elif kind == EVENT_CONTROLLER_TWO_BYTES:
+                yield tick, (name, data1, data2, True)
+            else:
+                yield tick, (name, data1)
+
+    # If fileobj is given, the midi data is written straight into it
+    # while it is compiled, see the MIDI class.
+    # With use_numpy, the events of the tracks are encoded with NumPy, see midi_numpy.py.
+    # By default NumPy is used if it is installed. Both ways result in the same midi data.
+    def compile_midi(self, instrument_bank, bpm, fileobj=None, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = midi_numpy.is_available()
+        elif use_numpy and not midi_numpy.is_available():
+            raise RuntimeError("NumPy is not installed!")
 
-    def compile_midi(self, instrument_bank, bpm):
         track_count = len(self.tracks)
-        midi_data = MIDI(track_count, bpm)
+        midi_data = MIDI(track_count, bpm, fileobj)
 
-        last_bpm = bpm
+        self.channels = allocate_channels(self.tracks)
+        use_ports = self.channels.port_count() > 1
 
-        instruments = []
-        bpm_values = []
-        ppqn_values = []
+        # The BPM value is needed for the tempo of PPQN events,
+        # and carries over from one track to the next.
+        last_bpm = bpm
 
         for track_id in self.track_iterator():
             #midiFileOutput.start_of_track(n_track = trackID)
@@ -66,10 +199,14 @@ class MidiScheduler(object):
             #myMidi.addTempo(trackID, start, BPM)
             midi_data.start_track()
 
+            port, channel = self.channels.get_channel(track_id)
+            if use_ports:
+                midi_data.set_port(0, port)
+
             # Change the instrument bank for each track in case the default
             # instrument bank sounds odd.
 
-            midi_data.program_event(0, channel=track_id,
+            midi_data.program_event(0, channel=channel,
                                     program=0x00, value=instrument_bank)
             #myMidi.set_tempo(0, baseTempo)
 
@@ -81,64 +218,74 @@ class MidiScheduler(object):
 
             #midiFileOutput.update_time(start)
 
-            last_time = start
-            for action in self.actions_iter(track_id):
-                timestamp, data = action
+            track = self.tracks[track_id]
 
-                ticks_passed = timestamp - last_time
-                last_time = timestamp
+            reset = self.channels.get_reset(track_id)
+            if reset is not None:
+                track = reset_channel(track, *reset)
 
-                #midiFileOutput.update_time(ticks_passed)
+            encoded = None
+            if use_numpy:
+                encoded = midi_numpy.encode_track(track, channel, last_bpm)
 
-                command, args = data[0], data[1:]
+            if encoded is not None:
+                data, last_bpm = encoded
+                midi_data.write_encoded_events(data)
+            else:
+                last_bpm = self._compile_track(midi_data, track, channel, last_bpm)
 
-                if command == "note_on":
-                    note, volume = args
-                    midi_data.note_on(ticks_passed, channel=track_id, note=note, velocity=volume)
+            midi_data.end_track()
 
-                elif command == "note_off":
-                    note, volume = args
-                    midi_data.note_off(ticks_passed, channel=track_id, note=note, velocity=volume)
+        return midi_data
 
-                elif command == "controller":
-                    controller, value, use_two_bytes = args
-                    midi_data.program_event(ticks_passed, channel=track_id,
-                                            program=controller, value=value, twoBytes=use_two_bytes)
+    # Writes the events of the track into the midi data and returns the last BPM value.
+    def _compile_track(self, midi_data, track, channel, last_bpm):
+        # Every track of the midi file starts at tick 0, so the first event
+        # of a track that has been started later needs to include the start.
+        last_time = 0
+        for timestamp, kind, data1, data2 in track:
+            ticks_passed = timestamp - last_time
+            last_time = timestamp
 
-                elif command == "program":
-                    program_instrument = args[0]
-                    instruments.append(program_instrument)
-                    #midiFileOutput.patch_change(channel = trackID,
-                    #                            patch = program)
-                    #myMidi.set_instrument(ticks_passed, channel = 0, instrument = program_instrument)
-                    midi_data.set_instrument(ticks_passed, channel=track_id, instrument=program_instrument)
+            #midiFileOutput.update_time(ticks_passed)
 
-                elif command == "pitch":
-                    pitch = args[0]
-                    #midiFileOutput.pitch_bend(channel = trackID,
-                    #                          value = pitch)
+            if kind == EVENT_NOTE_ON:
+                midi_data.note_on(ticks_passed, channel=channel, note=data1, velocity=data2)
 
-                    midi_data.set_pitch(ticks_passed, channel=track_id, pitch=pitch)
+            elif kind == EVENT_NOTE_OFF:
+                midi_data.note_off(ticks_passed, channel=channel, note=data1, velocity=data2)
 
-                elif command == "bpm":
-                    bpm = args[0]
-                    bpm_values.append(bpm)
+            elif kind == EVENT_CONTROLLER or kind == EVENT_CONTROLLER_TWO_BYTES:
+                midi_data.program_event(ticks_passed, channel=channel,
+                                        program=data1, value=data2,
+                                        two_bytes=(kind == EVENT_CONTROLLER_TWO_BYTES))
 
-                    tempo = int(60000000/bpm)
+            elif kind == EVENT_PROGRAM:
+                program_instrument = data1
+                #midiFileOutput.patch_change(channel = trackID,
+                #                            patch = program)
+                #myMidi.set_instrument(ticks_passed, channel = 0, instrument = program_instrument)
+                midi_data.set_instrument(ticks_passed, channel=channel, instrument=program_instrument)
 
-                    last_bpm = bpm
+            elif kind == EVENT_PITCH:
+                pitch = data1
+                #midiFileOutput.pitch_bend(channel = trackID,
+                #                          value = pitch)
 
-                    midi_data.set_tempo(ticks_passed, tempo)
+                midi_data.set_pitch(ticks_passed, channel=channel, pitch=pitch)
 
-                elif command == "ppqn":
-                    ppqn = args[0]
-                    tempo = 60000000 / (last_bpm * ppqn)
-                    ppqn_values.append(ppqn)
-                    midi_data.set_tempo(ticks_passed, tempo)
+            elif kind == EVENT_BPM:
+                bpm = data1
 
-            midi_data.end_track()
+                tempo = 60000000 // bpm
 
-        return midi_data
+                last_bpm = bpm
 
+                midi_data.set_tempo(ticks_passed, tempo)
 
+            elif kind == EVENT_PPQN:
+                ppqn = data1
+                tempo = 60000000 // (last_bpm * ppqn)
+                midi_data.set_tempo(ticks_passed, tempo)
 
+        return last_bpm
@@ -0,0 +1,46 @@
+from .event_kinds import EVENT_BPM, EVENT_PPQN
+
+
+# Converts ticks into seconds the same way the midi files created by
+# MidiScheduler.compile_midi are played: division ticks per quarter note at
+# tempo_bpm quarter notes per minute, until a BPM or PPQN event changes the tempo.
+class TempoClock(object):
+    def __init__(self, division=100, tempo_bpm=120):
+        self.division = division
+        self.tempo_bpm = tempo_bpm
+
+        # compile_midi uses the division as the BPM value for PPQN
+        # events that come before the first BPM event.
+        self._last_bpm = division
+
+        # The tick and time at which the current tempo has started.
+        self._tempo_tick = 0
+        self._tempo_time = 0.0
+
+    def seconds_per_tick(self):
+        return 60.0 / (self.tempo_bpm * self.division)
+
+    def tick_to_time(self, tick):
+        return self._tempo_time + (tick - self._tempo_tick)*self.seconds_per_tick()
+
+    def time_to_tick(self, seconds):
+        return self._tempo_tick + int((seconds - self._tempo_time)/self.seconds_per_tick())
+
+    def change_tempo(self, tick, tempo_bpm):
+        self._tempo_time = self.tick_to_time(tick)
+        self._tempo_tick = tick
+        self.tempo_bpm = tempo_bpm
+
+    # Changes the tempo if the event is a BPM or PPQN event, and returns whether it was.
+    # The events need to be handled in the order of their ticks.
+    def handle_event(self, tick, kind, data1):
+        if kind == EVENT_BPM:
+            self._last_bpm = data1
+            self.change_tempo(tick, data1)
+            return True
+        elif kind == EVENT_PPQN:
+            # Same as the tempo that compile_midi writes for PPQN events.
+            self.change_tempo(tick, self._last_bpm*data1)
+            return True
+        else:
+            return False
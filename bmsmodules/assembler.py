@@ -0,0 +1,300 @@
+import struct
+
+from EventParsers import parser_helper, parsers
+
+# Commands that are written with a name instead of their command ID.
+CMD_DELAY_BYTE = 0x80
+CMD_DELAY_SHORT = 0x88
+CMD_NEW_SUBROUTINE = 0xC1
+CMD_CALL = 0xC4
+CMD_RETURN = 0xC6
+CMD_JUMP = 0xC8
+CMD_VL_DELAY = 0xF0
+CMD_END_OF_TRACK = 0xFF
+
+# The source of the assembler has one command per line:
+#
+#   ; Comments start with a semicolon.
+#   track_1:              A label for the offset of the next command.
+#   0x9A 0 64 0           A command ID followed by the values of the command.
+#   note 60 1 100         Note-on: note, polyphonic ID, volume
+#   off 1                 Note-off: polyphonic ID
+#   delay 300             A delay, written with the shortest delay command
+#   spawn 1 track_1       0xC1: track ID, offset
+#   call pattern          0xC4: offset
+#   return                0xC6
+#   jump track_1          0xC8 with mode 0: offset
+#   end                   0xFF
+#
+# Values that are not numbers are the names of labels and are replaced by their offset.
+
+
+# Returns a tuple of 256 functions that encode the values of a command, as returned
+# by the parser of the version, back into the data following the command ID. The
+# function is None for commands that the parser does not know.
+def get_encoders(version):
+    encoders = [None]*256
+    created = {}
+
+    for command_id, layout in parsers.container.get_layouts(version).items():
+        if layout not in created:
+            created[layout] = _create_encoder(layout)
+
+        encoders[command_id] = created[layout]
+
+    return tuple(encoders)
+
+
+def _create_encoder(layout):
+    if hasattr(parser_helper, layout):
+        return getattr(parser_helper, "encode_" + layout[len("parse_"):])
+    else:
+        struct_obj = struct.Struct(layout)
+
+        def encode(values, command_id):
+            return struct_obj.pack(*values)
+
+        return encode
+
+
+# Turns BMS commands into the data of a BMS file. Commands are added either with
+# the methods below or from source text with parse, and assemble returns the data.
+# Labels can be used in place of any value, they are replaced by offsets once
+# the offsets of all commands are known.
+class Assembler(object):
+    def __init__(self, version=2):
+        self.version = version
+        self._encoders = get_encoders(version)
+
+        # (command id, values, line number) tuples, the line number is None
+        # for commands that have not been added from source text.
+        self._commands = []
+
+        # The index of the command that follows the label, by label name.
+        self._labels = {}
+
+        # The indices of the commands that have labels in their values.
+        self._labelled = []
+
+    def __len__(self):
+        return len(self._commands)
+
+    def label(self, name, line=None):
+        if name in self._labels:
+            raise RuntimeError("Label '{0}' is defined twice{1}".format(name, _at_line(line)))
+
+        self._labels[name] = len(self._commands)
+
+    def command(self, command_id, *values, **kwargs):
+        line = kwargs.get("line")
+
+        if not 0 <= command_id <= 0xFF or self._encoders[command_id] is None:
+            raise RuntimeError("Command ID {0} is not known in version {1}{2}"
+                               "".format(hex(command_id), self.version, _at_line(line)))
+
+        if any(isinstance(value, str) for value in values):
+            self._labelled.append(len(self._commands))
+
+        self._commands.append((command_id, values, line))
+
+    # The command ID of a note-on is the note, so notes from 0x80 on would be other commands.
+    # The volume can be given as an unsigned byte, it is encoded as the signed byte it is read as.
+    def note_on(self, note, poly_id, volume, line=None):
+        if not 0 <= note < 0x80:
+            raise RuntimeError("Note {0} is not between 0 and 127{1}".format(note, _at_line(line)))
+        elif not 0 <= poly_id <= 7:
+            raise RuntimeError("Polyphonic ID {0} is not between 0 and 7{1}".format(poly_id, _at_line(line)))
+        elif not -0x80 <= volume <= 0xFF:
+            raise RuntimeError("Volume {0} does not fit into a byte{1}".format(volume, _at_line(line)))
+
+        if volume > 0x7F:
+            volume -= 0x100
+
+        self.command(note, poly_id, volume, line=line)
+
+    # Note-off commands are 0x81 to 0x87, 0x80 is a delay.
+    def note_off(self, poly_id, line=None):
+        if not 1 <= poly_id <= 7:
+            raise RuntimeError("Polyphonic ID {0} of a note-off is not between 1 and 7{1}"
+                               "".format(poly_id, _at_line(line)))
+
+        self.command(0x80 | poly_id, line=line)
+
+    # Adds the shortest command for the delay.
+    def delay(self, ticks, line=None):
+        if ticks <= 0xFF:
+            self.command(CMD_DELAY_BYTE, ticks, line=line)
+        elif ticks <= 0xFFFF:
+            self.command(CMD_DELAY_SHORT, ticks, line=line)
+        else:
+            self.command(CMD_VL_DELAY, ticks, line=line)
+
+    def spawn(self, track_id, label):
+        self.command(CMD_NEW_SUBROUTINE, track_id, label)
+
+    def call(self, label):
+        self.command(CMD_CALL, label)
+
+    def ret(self):
+        self.command(CMD_RETURN, 0)
+
+    def jump(self, label, mode=0):
+        self.command(CMD_JUMP, mode, label)
+
+    def end(self):
+        self.command(CMD_END_OF_TRACK)
+
+    def parse(self, source):
+        for line_number, line in enumerate(source.splitlines(), 1):
+            line = line.split(";", 1)[0].strip()
+            if len(line) == 0:
+                continue
+
+            if line.endswith(":"):
+                self.label(line[:-1].strip(), line_number)
+                continue
+
+            parts = line.split()
+            name, values = parts[0].lower(), [_parse_value(part) for part in parts[1:]]
+
+            try:
+                if name == "note":
+                    note, poly_id, volume = values
+                    self.note_on(note, poly_id, volume, line_number)
+                elif name == "off":
+                    poly_id, = values
+                    self.note_off(poly_id, line_number)
+                elif name == "delay":
+                    ticks, = values
+                    self.delay(ticks, line_number)
+                elif name == "spawn":
+                    self.command(CMD_NEW_SUBROUTINE, *values, line=line_number)
+                elif name == "call":
+                    self.command(CMD_CALL, *values, line=line_number)
+                elif name == "return":
+                    self.command(CMD_RETURN, 0, line=line_number)
+                elif name == "jump":
+                    self.command(CMD_JUMP, 0, *values, line=line_number)
+                elif name == "end":
+                    self.command(CMD_END_OF_TRACK, line=line_number)
+                elif isinstance(_parse_value(parts[0]), str):
+                    raise RuntimeError("Unknown command '{0}'{1}".format(parts[0], _at_line(line_number)))
+                else:
+                    self.command(_parse_value(parts[0]), *values, line=line_number)
+            except (ValueError, TypeError):
+                raise RuntimeError("Cannot read '{0}'{1}".format(line, _at_line(line_number)))
+
+    # Returns the source text of the commands, which parse turns back into the same commands.
+    def format_source(self):
+        labels = {}
+        for name, index in self._labels.items():
+            labels.setdefault(index, []).append(name)
+
+        lines = []
+
+        for index, (command_id, values, line) in enumerate(self._commands):
+            for name in sorted(labels.get(index, [])):
+                lines.append("{0}:".format(name))
+
+            lines.append("    " + " ".join(["0x{0:02X}".format(command_id)]
+                                           + [str(value) for value in values]))
+
+        for name in sorted(labels.get(len(self._commands), [])):
+            lines.append("{0}:".format(name))
+
+        return "\n".join(lines) + "\n"
+
+    def _encode(self, command_id, values, line, label_offsets):
+        if label_offsets is not None:
+            values = [label_offsets[value] if isinstance(value, str) else value
+                      for value in values]
+
+        try:
+            return bytes((command_id, )) + self._encoders[command_id](values, command_id)
+        except (struct.error, ValueError, TypeError) as error:
+            raise RuntimeError("Cannot encode command {0} with values {1}{2}: {3}"
+                               "".format(hex(command_id), tuple(values), _at_line(line), error))
+
+    def assemble(self):
+        labelled = set(self._labelled)
+
+        for index in self._labelled:
+            command_id, values, line = self._commands[index]
+
+            for value in values:
+                if isinstance(value, str) and value not in self._labels:
+                    raise RuntimeError("Unknown label '{0}'{1}".format(value, _at_line(line)))
+
+        # The commands are encoded with 0 in place of the labels to find out the offsets,
+        # only the commands that use labels need to be encoded again afterwards.
+        placeholders = dict((name, 0) for name in self._labels)
+        data = []
+        offsets = []
+        offset = 0
+
+        for index, (command_id, values, line) in enumerate(self._commands):
+            encoded = self._encode(command_id, values, line,
+                                   placeholders if index in labelled else None)
+            offsets.append(offset)
+            data.append(encoded)
+            offset += len(encoded)
+
+        offsets.append(offset)
+        label_offsets = dict((name, offsets[index]) for name, index in self._labels.items())
+
+        for index in self._labelled:
+            command_id, values, line = self._commands[index]
+            encoded = self._encode(command_id, values, line, label_offsets)
+
+            if len(encoded) != len(data[index]):
+                raise RuntimeError("The size of command {0} depends on the offset of a label{1}"
+                                   "".format(hex(command_id), _at_line(line)))
+
+            data[index] = encoded
+
+        return b"".join(data)
+
+
+def _parse_value(text):
+    try:
+        return int(text, 0)
+    except ValueError:
+        return text
+
+
+def _at_line(line):
+    if line is None:
+        return ""
+    else:
+        return " in line {0}".format(line)
+
+
+def assemble(source, version=2):
+    assembler = Assembler(version)
+    assembler.parse(source)
+
+    return assembler.assemble()
+
+
+if __name__ == "__main__":
+    import argparse
+    from pyBMS import PARSERS
+
+    arg_parser = argparse.ArgumentParser(description="Assemble a BMS file from source text.")
+    arg_parser.add_argument("input_path")
+    arg_parser.add_argument("output_path", nargs="?", default=None,
+                            help="Defaults to the input path with .bms added")
+    arg_parser.add_argument("--parser", default="pikmin2", choices=sorted(PARSERS.keys()))
+    args = arg_parser.parse_args()
+
+    output_path = args.output_path
+    if output_path is None:
+        output_path = args.input_path + ".bms"
+
+    with open(args.input_path, "r") as f:
+        bms_data = assemble(f.read(), PARSERS[args.parser])
+
+    with open(output_path, "wb") as f:
+        f.write(bms_data)
+
+    print("Wrote {0} bytes to {1}".format(len(bms_data), output_path))
@@ -0,0 +1,125 @@
+import bisect
+
+# Rough estimates of how many bytes the parts of a checkpoint take up in memory.
+CHECKPOINT_BASE_SIZE = 512
+SUBROUTINE_STATE_SIZE = 256
+TRACK_STATE_SIZE = 64
+# A visited state of the loop detection takes up VISITED_STATE_SIZE bytes,
+# and VISITED_SUBROUTINE_SIZE more bytes for every subroutine.
+VISITED_STATE_SIZE = 128
+VISITED_SUBROUTINE_SIZE = 128
+
+
+# The state of a BmsInterpreter before it handles the given tick. The subroutines are stored
+# as the tuples returned by SubroutineTemplate.save_checkpoint, the midi scheduler as the
+# tuple returned by MidiScheduler.save_checkpoint. The visited states for the loop detection
+# are only ever added to, so the checkpoint keeps a reference to their list and its length.
+class Checkpoint(object):
+    def __init__(self, tick, ticks, subroutines, scheduler_state,
+                 visited_states, visited_count,
+                 loop_start, loop_length, end_tick, fade_steps):
+        self.tick = tick
+        self.ticks = ticks
+
+        self.subroutines = subroutines
+        self.scheduler_state = scheduler_state
+
+        self.visited_states = visited_states
+        self.visited_count = visited_count
+
+        self.loop_start = loop_start
+        self.loop_length = loop_length
+        self.end_tick = end_tick
+        self.fade_steps = fade_steps
+
+    # The visited states are not included, as their list is shared with other checkpoints.
+    def estimated_size(self):
+        event_counts = self.scheduler_state[0]
+
+        return (CHECKPOINT_BASE_SIZE
+                + SUBROUTINE_STATE_SIZE*len(self.subroutines)
+                + TRACK_STATE_SIZE*len(event_counts))
+
+    def estimated_visited_state_size(self):
+        return VISITED_STATE_SIZE + VISITED_SUBROUTINE_SIZE*len(self.subroutines)
+
+
+# Keeps the checkpoints of an interpreter, sorted by tick. A checkpoint should be taken
+# every interval ticks. Once the checkpoints take up more than memory_budget bytes, every
+# second checkpoint is thrown away and the interval is doubled, so that long songs end up
+# with fewer, evenly spaced checkpoints instead of using more and more memory.
+# The lists of visited states that the checkpoints refer to are counted as well. Every list
+# is only counted once, up to the largest length that one of the checkpoints uses.
+class CheckpointStore(object):
+    def __init__(self, interval, memory_budget):
+        if interval <= 0:
+            raise RuntimeError("The checkpoint interval needs to be positive, not {0}".format(interval))
+
+        self.interval = interval
+        self.memory_budget = memory_budget
+
+        self._checkpoints = []
+        self._ticks = []
+        self._size = 0
+
+        # (list, counted length) tuples of the lists of visited states, by their id.
+        self._visited_lists = {}
+
+    def __len__(self):
+        return len(self._checkpoints)
+
+    def __iter__(self):
+        return iter(self._checkpoints)
+
+    def estimated_size(self):
+        return self._size
+
+    def add(self, checkpoint):
+        if len(self._ticks) > 0 and checkpoint.tick <= self._ticks[-1]:
+            raise RuntimeError("Checkpoints need to be added in the order of their ticks!")
+
+        self._checkpoints.append(checkpoint)
+        self._ticks.append(checkpoint.tick)
+        self._size += checkpoint.estimated_size() + self._count_visited_states(checkpoint)
+
+        while self._size > self.memory_budget and len(self._checkpoints) > 1:
+            self._thin_out()
+
+    def _thin_out(self):
+        self._set_checkpoints(self._checkpoints[::2])
+        self.interval *= 2
+
+    # Returns the estimated size of the visited states of the checkpoint
+    # that have not been counted for an earlier checkpoint yet.
+    def _count_visited_states(self, checkpoint):
+        visited_states = checkpoint.visited_states
+        counted = self._visited_lists.get(id(visited_states), (visited_states, 0))[1]
+
+        if checkpoint.visited_count <= counted:
+            return 0
+
+        self._visited_lists[id(visited_states)] = (visited_states, checkpoint.visited_count)
+
+        return (checkpoint.visited_count - counted)*checkpoint.estimated_visited_state_size()
+
+    def _set_checkpoints(self, checkpoints):
+        self._checkpoints = checkpoints
+        self._ticks = [checkpoint.tick for checkpoint in checkpoints]
+
+        self._visited_lists = {}
+        self._size = sum(checkpoint.estimated_size() + self._count_visited_states(checkpoint)
+                         for checkpoint in checkpoints)
+
+    # Returns the last checkpoint at or before the tick, or None if there is none.
+    def find(self, tick):
+        index = bisect.bisect_right(self._ticks, tick)
+
+        if index == 0:
+            return None
+        else:
+            return self._checkpoints[index-1]
+
+    # Removes every checkpoint after the tick.
+    def discard_after(self, tick):
+        index = bisect.bisect_right(self._ticks, tick)
+        self._set_checkpoints(self._checkpoints[:index])
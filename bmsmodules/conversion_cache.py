@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import types
+
+# Needs to be increased whenever the midi data created from the same file changes
+# for other reasons than the sources in CONVERTER_SOURCES, so that the cached
+# conversions made by older versions are not used anymore.
+CONVERTER_VERSION = 3
+
+# The sources of the event handlers, the scheduler and the midi writer, relative to the
+# directory of pyBMS.py. Any change to them is treated as a new converter version.
+CONVERTER_SOURCES = ["pyBMS.py",
+                     "bmsmodules/data_reader.py",
+                     "bmsmodules/subroutine_template.py",
+                     "bmsmodules/track_parts.py",
+                     "bmsmodules/MidiWriter/channel_allocator.py",
+                     "bmsmodules/MidiWriter/event_kinds.py",
+                     "bmsmodules/MidiWriter/midi.py",
+                     "bmsmodules/MidiWriter/midi_numpy.py",
+                     "bmsmodules/MidiWriter/midi_scheduler.py"]
+
+_source_hash = None
+
+
+# Returns a hash of the files in CONVERTER_SOURCES. They are only read once per process.
+def get_source_hash():
+    global _source_hash
+
+    if _source_hash is None:
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        source_hash = hashlib.sha1()
+
+        for source_path in CONVERTER_SOURCES:
+            with open(os.path.join(base_dir, source_path), "rb") as f:
+                source_hash.update(source_path.encode("utf-8") + b"\0" + f.read() + b"\0")
+
+        _source_hash = source_hash.hexdigest()
+
+    return _source_hash
+
+
+# Returns a string describing the data layout of a parser function,
+# which changes when the parser of a command changes. Functions that
+# decode the data themselves are described by a hash of their code.
+def get_parser_layout(parser_func):
+    struct_obj = getattr(parser_func, "struct", None)
+
+    if struct_obj is not None:
+        return "struct:" + struct_obj.format
+    else:
+        code_hash = hashlib.sha1()
+        _hash_code(code_hash, parser_func.__code__)
+
+        return "function:{0}:{1}".format(parser_func.__name__, code_hash.hexdigest())
+
+
+# The representation of code objects contains their memory address, so code objects
+# in the constants, e.g. of generator expressions, are hashed the same way instead.
+def _hash_code(code_hash, code):
+    code_hash.update(code.co_code)
+    code_hash.update(repr(code.co_names).encode("utf-8"))
+
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hash_code(code_hash, const)
+        else:
+            code_hash.update(repr(const).encode("utf-8"))
+
+
+# The key of a conversion is a hash of everything that decides what the
+# converted file looks like: the file data, the conversion options, the sources
+# of the interpreter and the midi writer, and the parsers of the commands used
+# in the file. Changes to the parsers of commands the file does not use result
+# in the same key.
+def get_conversion_key(bms_data, parser, used_cmd_ids, options):
+    key = hashlib.sha1()
+    key.update("converter {0} {1};".format(CONVERTER_VERSION, get_source_hash()).encode("utf-8"))
+    key.update(bms_data)
+
+    for cmd_id in sorted(used_cmd_ids):
+        layout = get_parser_layout(parser.command_parsers[cmd_id])
+        key.update("0x{0:02X}={1};".format(cmd_id, layout).encode("utf-8"))
+
+    key.update(json.dumps(sorted(options.items())).encode("utf-8"))
+
+    return key.hexdigest()
+
+
+# Stores the midi files created by earlier conversions, together with the result
+# of the conversion, under their conversion key. Each conversion consists of two files,
+# <key>.midi and <key>.json. The modification time of the json file is the time
+# at which the conversion has last been used.
+class ConversionCache(object):
+    def __init__(self, cache_dir, max_size=None, max_age=None):
+        self.cache_dir = cache_dir
+
+        # The maximum size of all cached midi files in bytes,
+        # and the maximum time in seconds a conversion is kept without being used.
+        self.max_size = max_size
+        self.max_age = max_age
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _get_path(self, key, extension):
+        return os.path.join(self.cache_dir, key + extension)
+
+    # Returns the result of the cached conversion, or None if there is none.
+    def get(self, key):
+        result_path = self._get_path(key, ".json")
+
+        if not os.path.exists(result_path):
+            return None
+
+        with open(result_path, "r") as f:
+            result = json.load(f)
+
+        os.utime(result_path, None)
+
+        return result
+
+    def store(self, key, result, midi_path):
+        if midi_path is not None:
+            shutil.copyfile(midi_path, self._get_path(key, ".midi"))
+
+        with open(self._get_path(key, ".json"), "w") as f:
+            json.dump(result, f)
+
+    # Puts the cached midi file at output_path. A hard link is used when possible,
+    # so that files with the same content don't use up more space.
+    def copy_output(self, key, output_path):
+        midi_path = self._get_path(key, ".midi")
+
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+        try:
+            os.link(midi_path, output_path)
+        except (AttributeError, OSError):
+            # Hard links are not available on every OS and file system.
+            shutil.copyfile(midi_path, output_path)
+
+    # Removes the conversions that have not been used for longer than max_age, and then
+    # the least recently used ones until the cached midi files fit into max_size.
+    def evict(self):
+        entries = []
+
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(".json"):
+                key = file_name[:-len(".json")]
+                midi_path = self._get_path(key, ".midi")
+                size = os.path.getsize(midi_path) if os.path.exists(midi_path) else 0
+                last_used = os.path.getmtime(self._get_path(key, ".json"))
+
+                entries.append((last_used, size, key))
+
+        entries.sort()
+        total_size = sum(size for last_used, size, key in entries)
+        now = time.time()
+        removed = 0
+
+        for last_used, size, key in entries:
+            too_old = self.max_age is not None and now - last_used > self.max_age
+            too_large = self.max_size is not None and total_size > self.max_size
+
+            if not too_old and not too_large:
+                break
+
+            for extension in (".json", ".midi"):
+                if os.path.exists(self._get_path(key, extension)):
+                    os.remove(self._get_path(key, extension))
+
+            total_size -= size
+            removed += 1
+
+        return removed
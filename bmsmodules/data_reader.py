@@ -1,65 +1,89 @@
 import struct
 
+BYTE = struct.Struct("B")
+INT = struct.Struct(">I")
+UINT = struct.Struct(">i")
+SHORT = struct.Struct(">H")
+USHORT = struct.Struct(">h")
+FLOAT = struct.Struct(">f")
+CHAR = struct.Struct("c")
+# The most significant byte and the remaining two bytes of a tripplet.
+TRIPPLET = struct.Struct(">BH")
 
+
+# All subroutines read from the same file data. Instead of giving each of them
+# its own file handle, every reader only keeps the offset at which it is
+# currently reading and decodes the data at that offset directly.
+# The data can be bytes or anything else that supports the buffer protocol,
+# it is only looked at through a memoryview, so it is never copied. A memoryview
+# of bytes is used as it is, so that the readers of a song can share the same view.
 class DataReader():
-    def __init__(self, fileobj):
-        self.filehandle = fileobj
-        
+    __slots__ = ("data", "offset")
+
+    def __init__(self, data, offset=0):
+        if not isinstance(data, memoryview) or data.format != "B":
+            data = memoryview(data).cast("B")
+
+        self.data = data
+        self.offset = offset
+
+    def seek(self, offset):
+        self.offset = offset
+
+    def tell(self):
+        return self.offset
+
+    # Reads the values described by a struct.Struct object at the current offset.
+    def unpack(self, struct_obj):
+        values = struct_obj.unpack_from(self.data, self.offset)
+        self.offset += struct_obj.size
+        return values
+
+    # Indexing the memoryview is faster than unpacking the byte. Reading past the end
+    # raises struct.error like every other method does.
     def byte(self):
-        data = self.filehandle.read(1)
-        return struct.unpack("B", data)[0]
+        try:
+            value = self.data[self.offset]
+        except IndexError:
+            raise struct.error("Cannot read a byte at offset {0}".format(self.offset))
+
+        self.offset += 1
+        return value
     
     def ubyte(self):
-        data = self.filehandle.read(1)
-        return struct.unpack("B", data)[0]
+        return self.byte()
         
     def int(self):
-        data = self.filehandle.read(4)
-        return struct.unpack(">I", data)[0]
+        return self.unpack(INT)[0]
     
     def uint(self):
-        data = self.filehandle.read(4)
-        return struct.unpack(">i", data)[0]
+        return self.unpack(UINT)[0]
     
     def short(self):
-        data = self.filehandle.read(2)
-        return struct.unpack(">H", data)[0]
+        return self.unpack(SHORT)[0]
     
     def ushort(self):
-        data = self.filehandle.read(2)
-        return struct.unpack(">h", data)[0]
+        return self.unpack(USHORT)[0]
     
     def float(self):
-        data = self.filehandle.read(4)
-        return struct.unpack(">F", data)[0]
+        return self.unpack(FLOAT)[0]
     
     def ufloat(self):
-        data = self.filehandle.read(4)
-        return struct.unpack(">f", data)[0]
+        return self.unpack(FLOAT)[0]
     
     def char(self):
-        data = self.filehandle.read(1)
-        info = struct.unpack("c", data)[0]
-        return info
+        return self.unpack(CHAR)[0]
     
     def char_array(self, length):
-        info = []
-
-        for i in range(0, length):
-            info.append(self.char())
-
-        return "".join(info)
+        return b"".join(self.unpack(struct.Struct("{0}c".format(length))))
     
     def byte_array(self, length):
-        data = self.filehandle.read(length)
-        byte_array = struct.unpack(str(length)+"B", data)
-
-        return byte_array
+        return self.unpack(struct.Struct("{0}B".format(length)))
     
     # an integer with 3 bytes
     def tripplet(self):
-        data = chr(0x0) + self.filehandle.read(3)
-        return struct.unpack(">I", data)[0]
+        high, low = self.unpack(TRIPPLET)
+        return (high << 16) | low
     
     def tripplet_int(self):
-        return self.tripplet
\ No newline at end of file
+        return self.tripplet()
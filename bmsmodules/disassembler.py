@@ -0,0 +1,246 @@
+import struct
+
+from bmsmodules.data_reader import DataReader
+
+
+# Commands that change the control flow of a subroutine.
+CMD_NEW_SUBROUTINE = 0xC1
+CMD_CALL = 0xC4
+CMD_RETURN = 0xC6
+CMD_JUMP = 0xC8
+CMD_END_OF_TRACK = 0xFF
+
+# Kinds of edges between the basic blocks.
+EDGE_FALLTHROUGH = "fallthrough"
+EDGE_JUMP = "jump"
+EDGE_CALL = "call"
+EDGE_SPAWN = "spawn"
+
+
+class Instruction(object):
+    def __init__(self, offset, cmd_id, args, next_offset):
+        self.offset = offset
+        self.cmd_id = cmd_id
+        self.args = args
+        self.next_offset = next_offset
+
+    def __repr__(self):
+        return "0x{0:06x}: 0x{1:02X} {2}".format(self.offset, self.cmd_id, self.args)
+
+
+class BasicBlock(object):
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        self.instructions = []
+
+        # (kind, offset) tuples of the blocks that can follow this block.
+        self.successors = []
+
+    def __repr__(self):
+        return "<BasicBlock 0x{0:x}-0x{1:x}, {2} instructions>".format(self.start, self.end,
+                                                                       len(self.instructions))
+
+
+class ControlFlowGraph(object):
+    def __init__(self):
+        # Basic blocks by their start offset.
+        self.blocks = {}
+
+        # All decoded instructions by their offset.
+        self.instructions = {}
+
+        # (track id, offset) tuples of every track that can be started,
+        # the main track has no track id.
+        self.track_entries = [(None, 0)]
+
+        # Offsets that are the target of 0xC4 commands.
+        self.call_targets = set()
+
+        # (from offset, to offset, kind) tuples of all jumps, calls and spawns,
+        # from offset being the offset of the command.
+        self.edges = []
+
+        # (offset, command id) tuples of commands which are not known to the parser.
+        self.unknown_commands = []
+
+        # Offsets at which decoding a command ran past the end of the file data.
+        self.truncated = []
+
+    def is_valid(self):
+        return len(self.unknown_commands) == 0 and len(self.truncated) == 0
+
+    def get_block(self, offset):
+        return self.blocks[offset]
+
+    def __iter__(self):
+        for offset in sorted(self.blocks):
+            yield self.blocks[offset]
+
+    # Returns True if a subroutine can get back to a block it has already been in by
+    # following jumps, calls and fallthroughs, i.e. if the song can loop. Returns do not
+    # count, they go back to where the subroutine has been called from. Spawned
+    # subroutines are looked at on their own, as they start in blocks of the graph as well.
+    def can_loop(self):
+        # Blocks that are being visited are in the path of the depth first search,
+        # getting back to one of them means that there is a cycle.
+        visiting = set()
+        visited = set()
+
+        for start in self.blocks:
+            if start in visited:
+                continue
+
+            visiting.add(start)
+            stack = [(start, iter(self.blocks[start].successors))]
+
+            while len(stack) > 0:
+                offset, successors = stack[-1]
+
+                for kind, target in successors:
+                    if kind == EDGE_SPAWN or target not in self.blocks or target in visited:
+                        continue
+                    elif target in visiting:
+                        return True
+
+                    visiting.add(target)
+                    stack.append((target, iter(self.blocks[target].successors)))
+                    break
+                else:
+                    stack.pop()
+                    visiting.remove(offset)
+                    visited.add(offset)
+
+        return False
+
+
+# Returns the offsets to which the control flow can go after the instruction,
+# as (kind, offset) tuples, and whether the following instruction can be reached.
+def get_branches(instruction):
+    cmd_id, args = instruction.cmd_id, instruction.args
+
+    if cmd_id == CMD_NEW_SUBROUTINE:
+        track_id, offset = args
+        return [(EDGE_SPAWN, offset)], True
+    elif cmd_id == CMD_CALL:
+        return [(EDGE_CALL, args[0] & 0xFFFFFF)], True
+    elif cmd_id == CMD_JUMP:
+        mode, offset = args
+        # Modes other than 0 are likely conditions, which we do not know. The
+        # interpreter always takes the jump, so the following instruction is
+        # never reached by it, see SubroutineEventsTemplate.event_handle_jump.
+        return [(EDGE_JUMP, offset)], False
+    elif cmd_id in (CMD_RETURN, CMD_END_OF_TRACK):
+        return [], False
+    else:
+        return [], True
+
+
+# Walks through the BMS data starting at offset 0 and follows all spawned
+# subroutines, calls and jumps. The data is never interpreted, so this takes
+# about as long as decoding every reachable command once.
+def disassemble(data, parser, strict=True):
+    graph = ControlFlowGraph()
+    reader = DataReader(data)
+
+    # Offsets at which a new basic block starts.
+    leaders = set([0])
+    pending = [0]
+
+    while len(pending) > 0:
+        offset = pending.pop()
+
+        while offset not in graph.instructions:
+            reader.seek(offset)
+
+            try:
+                cmd_id = reader.byte()
+
+                if cmd_id not in parser.command_parsers:
+                    graph.unknown_commands.append((offset, cmd_id))
+                    break
+
+                args = parser.command_parsers[cmd_id](reader, strict, cmd_id)
+            except struct.error:
+                graph.truncated.append(offset)
+                break
+
+            instruction = Instruction(offset, cmd_id, args, reader.offset)
+            graph.instructions[offset] = instruction
+
+            branches, falls_through = get_branches(instruction)
+
+            for kind, target in branches:
+                graph.edges.append((offset, target, kind))
+                leaders.add(target)
+                pending.append(target)
+
+                if kind == EDGE_SPAWN:
+                    graph.track_entries.append((args[0], target))
+                elif kind == EDGE_CALL:
+                    graph.call_targets.add(target)
+
+            if len(branches) > 0 or not falls_through:
+                # The instruction after a branch starts a new block.
+                leaders.add(instruction.next_offset)
+
+            if not falls_through:
+                break
+
+            offset = instruction.next_offset
+
+    _build_blocks(graph, leaders)
+
+    return graph
+
+
+def _build_blocks(graph, leaders):
+    for start in sorted(leaders):
+        if start not in graph.instructions:
+            # Offsets at which decoding failed, or which
+            # follow a command that never falls through.
+            continue
+
+        block = BasicBlock(start)
+        offset = start
+
+        while True:
+            instruction = graph.instructions[offset]
+            block.instructions.append(instruction)
+            block.end = instruction.next_offset
+
+            branches, falls_through = get_branches(instruction)
+            block.successors.extend(branches)
+
+            next_offset = instruction.next_offset
+            if not falls_through:
+                break
+            elif next_offset in leaders or next_offset not in graph.instructions:
+                if next_offset in graph.instructions:
+                    block.successors.append((EDGE_FALLTHROUGH, next_offset))
+                break
+
+            offset = next_offset
+
+        graph.blocks[start] = block
+
+
+if __name__ == "__main__":
+    import sys
+    from EventParsers import parsers
+
+    with open(sys.argv[1], "rb") as f:
+        bms_data = f.read()
+
+    version = float(sys.argv[2]) if len(sys.argv) > 2 else 2
+    graph = disassemble(bms_data, parsers.container.get_parser(version))
+
+    for block in graph:
+        print(block)
+        for instruction in block.instructions:
+            print("   ", instruction)
+        print("    ->", block.successors)
+
+    print("Tracks:", graph.track_entries)
+    print("Unknown commands:", graph.unknown_commands)
+    print("Truncated at:", graph.truncated)
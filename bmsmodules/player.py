@@ -0,0 +1,380 @@
+import struct
+import threading
+import time
+
+from bmsmodules.MidiWriter.event_kinds import (EVENT_NOTE_ON, EVENT_NOTE_OFF, EVENT_CONTROLLER,
+                                               EVENT_CONTROLLER_TWO_BYTES, EVENT_PROGRAM,
+                                               EVENT_PITCH)
+from bmsmodules.MidiWriter.tempo_clock import TempoClock
+
+CHANNELS_PER_PORT = 16
+
+LIVE_EVENT = struct.Struct("BBB")
+LIVE_PROGRAM_EVENT = struct.Struct("BB")
+
+
+# Holds the events between the producer and the consumer thread. There is exactly
+# one thread that pushes and one thread that pops, and each of the two positions is
+# only ever changed by one of them, so no lock is needed. A slot is filled before
+# the write position moves past it, and only read once it has.
+class RingBuffer(object):
+    def __init__(self, capacity):
+        # One slot is always left empty to tell a full buffer apart from an empty one.
+        self._slots = [None] * (capacity + 1)
+        self._read_pos = 0
+        self._write_pos = 0
+
+    def __len__(self):
+        return (self._write_pos - self._read_pos) % len(self._slots)
+
+    def is_full(self):
+        return (self._write_pos + 1) % len(self._slots) == self._read_pos
+
+    # Returns False if the buffer is full.
+    def push(self, item):
+        next_pos = (self._write_pos + 1) % len(self._slots)
+        if next_pos == self._read_pos:
+            return False
+
+        self._slots[self._write_pos] = item
+        self._write_pos = next_pos
+
+        return True
+
+    # Returns None if the buffer is empty.
+    def peek(self):
+        if self._read_pos == self._write_pos:
+            return None
+
+        return self._slots[self._read_pos]
+
+    def pop(self):
+        item = self.peek()
+
+        if item is not None:
+            self._slots[self._read_pos] = None
+            self._read_pos = (self._read_pos + 1) % len(self._slots)
+
+        return item
+
+
+# Sinks receive the midi messages at the time at which they should be played.
+# port is the index of the midi port, data the bytes of the message.
+class Sink(object):
+    def open(self):
+        pass
+
+    def send(self, port, data):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# Drops every message, e.g. to measure how well the player keeps up.
+class NullSink(Sink):
+    def send(self, port, data):
+        pass
+
+
+# Keeps every message as a (time, port, data) tuple, with time
+# being the time in seconds since the sink has been opened.
+class RecordingSink(Sink):
+    def __init__(self):
+        self.messages = []
+        self._start = None
+
+    def open(self):
+        self._start = time.time()
+
+    def send(self, port, data):
+        self.messages.append((time.time() - self._start, port, data))
+
+
+# Writes the messages to a file object, e.g. a raw midi device such as /dev/snd/midiC0D0.
+# Messages for other ports than the first one are dropped.
+class RawMidiSink(Sink):
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def send(self, port, data):
+        if port == 0:
+            self.fileobj.write(data)
+            self.fileobj.flush()
+
+
+# Plays the messages with pygame.midi, which needs to be installed.
+class PygameMidiSink(Sink):
+    def __init__(self, device_id=None):
+        try:
+            import pygame.midi
+        except ImportError:
+            raise RuntimeError("PygameMidiSink needs pygame to be installed!")
+
+        self._midi = pygame.midi
+        self.device_id = device_id
+        self._output = None
+
+    def open(self):
+        self._midi.init()
+
+        device_id = self.device_id
+        if device_id is None:
+            device_id = self._midi.get_default_output_id()
+
+        self._output = self._midi.Output(device_id)
+
+    def send(self, port, data):
+        if port == 0:
+            for message in split_messages(data):
+                self._output.write_short(*message)
+
+    def close(self):
+        self._output.close()
+        self._midi.quit()
+
+
+# Returns the port and the midi messages of an event of the scheduler, or None for tempo
+# changes. The tracks are not known in advance during playback, so they cannot be put
+# on channels like in MidiScheduler.compile_midi. Instead, every 16 tracks get a port.
+# Unlike in the midi files, a data byte with the most significant bit set would be read
+# as the status byte of the next message on a live port, so only the lower 7 bits are sent.
+def encode_event(track_id, kind, data1, data2):
+    port, channel = divmod(track_id, CHANNELS_PER_PORT)
+
+    if kind == EVENT_NOTE_ON:
+        data = LIVE_EVENT.pack(0x90 + channel, data1 & 127, data2 & 127)
+    elif kind == EVENT_NOTE_OFF:
+        data = LIVE_EVENT.pack(0x80 + channel, data1 & 127, data2 & 127)
+    elif kind == EVENT_CONTROLLER:
+        data = LIVE_EVENT.pack(0xB0 + channel, data1 & 127, data2 & 127)
+    elif kind == EVENT_CONTROLLER_TWO_BYTES:
+        # The 14 bit value is sent as two controller messages, the most significant
+        # bits to the controller and the least significant bits to the controller + 32.
+        data = (LIVE_EVENT.pack(0xB0 + channel, data1 & 127, (data2 >> 7) & 127)
+                + LIVE_EVENT.pack(0xB0 + channel, (data1 + 32) & 127, data2 & 127))
+    elif kind == EVENT_PROGRAM:
+        data = LIVE_PROGRAM_EVENT.pack(0xC0 + channel, data1 & 127)
+    elif kind == EVENT_PITCH:
+        # The 7 least significant bits come first.
+        data = LIVE_EVENT.pack(0xE0 + channel, data1 & 127, (data1 >> 7) & 127)
+    else:
+        return None
+
+    return port, data
+
+
+# Splits the data returned by encode_event into the single midi messages.
+# Program changes have one data byte, all other messages two.
+def split_messages(data):
+    messages = []
+    offset = 0
+
+    while offset < len(data):
+        length = 2 if 0xC0 <= data[offset] <= 0xDF else 3
+        messages.append(data[offset:offset+length])
+        offset += length
+
+    return messages
+
+
+# Plays a song while it is being interpreted. The producer thread interprets the song
+# up to lookahead seconds ahead of the playback clock and puts the new events into a
+# ring buffer. The consumer thread takes them out and sends them to the sink once they
+# are due. Playback starts as soon as the first window has been interpreted.
+#
+# The timing follows the midi files created by MidiScheduler.compile_midi:
+# division ticks per quarter note at a tempo of tempo_bpm, until the song changes it.
+class Player(object):
+    def __init__(self, interpreter, sink, lookahead=0.2, buffer_size=4096,
+                 division=100, tempo_bpm=120):
+        self.interpreter = interpreter
+        self.sink = sink
+        self.lookahead = lookahead
+
+        self._buffer = RingBuffer(buffer_size)
+
+        self.clock = TempoClock(division, tempo_bpm)
+
+        # How many events of every track have been put into the buffer.
+        self._read_counts = {}
+
+        # The time in seconds up to which the song has been interpreted,
+        # None until the first window has been interpreted.
+        self._produced_time = None
+        self._producer_done = False
+
+        self._stop = threading.Event()
+        self._threads = []
+        self._sink_open = False
+        self._start_time = None
+
+        self.error = None
+
+        self.events_sent = 0
+        # Times at which the consumer had nothing to play because
+        # the producer had not interpreted the song far enough.
+        self.underruns = 0
+        # How late the events have been sent, in seconds.
+        self.max_jitter = 0.0
+        self.total_jitter = 0.0
+        # The time between the start of playback and the first event being sent.
+        self.startup_latency = None
+
+    # Converts the events into (time, port, data) tuples and puts them into the buffer.
+    def _queue_events(self, events):
+        for tick, track_id, kind, data1, data2 in events:
+            if self.clock.handle_event(tick, kind, data1):
+                continue
+
+            message = encode_event(track_id, kind, data1, data2)
+            if message is None:
+                continue
+
+            item = (self.clock.tick_to_time(tick), ) + message
+            while not self._buffer.push(item):
+                if self._stop.wait(0.001):
+                    return
+
+    def _produce(self):
+        interpreter = self.interpreter
+
+        try:
+            while not self._stop.is_set():
+                playback_time = time.time() - self._start_time
+                stop_tick = self.clock.time_to_tick(playback_time + self.lookahead) + 1
+
+                status = interpreter.run_until(stop_tick)
+                self._queue_events(interpreter.scheduler.collect_events(self._read_counts))
+
+                if status is not None:
+                    break
+
+                self._produced_time = self.clock.tick_to_time(stop_tick)
+
+                # Nothing to do until playback has moved on.
+                self._stop.wait(self.lookahead/4)
+
+        except Exception as error:
+            self.error = error
+
+        self._producer_done = True
+
+    def _consume(self):
+        underrun = False
+
+        while not self._stop.is_set():
+            item = self._buffer.peek()
+            now = time.time() - self._start_time
+
+            if item is None:
+                if self._producer_done:
+                    break
+
+                # The buffer being empty is only a problem if the
+                # producer has not reached the current time yet.
+                if (self._produced_time is not None and now > self._produced_time
+                        and not underrun):
+                    self.underruns += 1
+                    underrun = True
+
+                self._stop.wait(0.001)
+                continue
+
+            underrun = False
+            due, port, data = item
+
+            if due > now:
+                self._stop.wait(min(due - now, 0.01))
+                continue
+
+            self.sink.send(port, data)
+            self._buffer.pop()
+
+            jitter = now - due
+            self.events_sent += 1
+            self.total_jitter += jitter
+            self.max_jitter = max(self.max_jitter, jitter)
+
+            if self.startup_latency is None:
+                self.startup_latency = time.time() - self._start_time
+
+    def start(self):
+        if self.interpreter.status is None and len(self.interpreter.scheduler.tracks) == 0:
+            self.interpreter.start()
+
+        self.sink.open()
+        self._sink_open = True
+        self._start_time = time.time()
+
+        self._threads = [threading.Thread(target=self._produce),
+                         threading.Thread(target=self._consume)]
+
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    # Waits until the song has been played to the end or the player has been stopped.
+    def wait(self):
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(0.1)
+
+        if self._sink_open:
+            self.sink.close()
+            self._sink_open = False
+
+    def stop(self):
+        self._stop.set()
+        self.wait()
+
+    def play(self):
+        self.start()
+        self.wait()
+
+    def is_playing(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def get_stats(self):
+        return {"events_sent": self.events_sent,
+                "buffered_events": len(self._buffer),
+                "underruns": self.underruns,
+                "max_jitter": self.max_jitter,
+                "mean_jitter": self.total_jitter/self.events_sent if self.events_sent else 0.0,
+                "startup_latency": self.startup_latency}
+
+
+if __name__ == "__main__":
+    import argparse
+    from pyBMS import BmsInterpreter, PARSERS
+
+    arg_parser = argparse.ArgumentParser(description="Play a BMS file in real time.")
+    arg_parser.add_argument("input_path")
+    arg_parser.add_argument("--parser", default="pikmin2", choices=sorted(PARSERS.keys()))
+    arg_parser.add_argument("--device", default=None,
+                            help="Raw midi device to write to, e.g. /dev/snd/midiC0D0. "
+                                 "Without it, the song is played with pygame.")
+    arg_parser.add_argument("--null", action="store_true",
+                            help="Don't play anything, only show the statistics")
+    args = arg_parser.parse_args()
+
+    with open(args.input_path, "rb") as f:
+        interpreter = BmsInterpreter(f.read(), parser_name=args.parser,
+                                     scheduler_mode="event")
+
+    if args.null:
+        sink = NullSink()
+    elif args.device is not None:
+        sink = RawMidiSink(open(args.device, "wb"))
+    else:
+        sink = PygameMidiSink()
+
+    player = Player(interpreter, sink)
+
+    try:
+        player.play()
+    except KeyboardInterrupt:
+        player.stop()
+
+    print("Finished with status '{0}'".format(interpreter.status))
+    print(player.get_stats())
@@ -0,0 +1,153 @@
+import json
+from timeit import default_timer as timer
+
+from bmsmodules.subroutine_template import SubroutineEventsTemplate
+
+
+# Collects how often every command is handled and how much time is spent decoding and
+# handling it, as well as what every subroutine does. It is filled by ProfilingEventsTemplate,
+# which is only used when profiling is enabled, so normal interpretation is not slowed down.
+class OpcodeProfiler(object):
+    def __init__(self):
+        self.counts = [0]*256
+        self.decode_times = [0.0]*256
+        self.handler_times = [0.0]*256
+        self.events = [0]*256
+
+        # Commands that were not in the decode cache and had to be decoded from the file data.
+        self.decode_cache_misses = [0]*256
+
+        # [commands, active ticks, events, last active tick] by unique subroutine id
+        self.subroutines = {}
+
+    def record(self, unique_id, tick, cmd_id, decode_time, handler_time, events, cache_miss):
+        self.counts[cmd_id] += 1
+        self.decode_times[cmd_id] += decode_time
+        self.handler_times[cmd_id] += handler_time
+        self.events[cmd_id] += events
+
+        if cache_miss:
+            self.decode_cache_misses[cmd_id] += 1
+
+        if unique_id not in self.subroutines:
+            self.subroutines[unique_id] = [0, 0, 0, None]
+
+        activity = self.subroutines[unique_id]
+        activity[0] += 1
+        activity[2] += events
+
+        if activity[3] != tick:
+            activity[1] += 1
+            activity[3] = tick
+
+    # Adds the numbers of another profiler, e.g. to get the profile of many files.
+    # The subroutines are only kept for a single file.
+    def merge(self, other):
+        for cmd_id in range(256):
+            self.counts[cmd_id] += other.counts[cmd_id]
+            self.decode_times[cmd_id] += other.decode_times[cmd_id]
+            self.handler_times[cmd_id] += other.handler_times[cmd_id]
+            self.events[cmd_id] += other.events[cmd_id]
+            self.decode_cache_misses[cmd_id] += other.decode_cache_misses[cmd_id]
+
+        self.subroutines = {}
+
+    def get_report(self):
+        opcodes = {}
+
+        for cmd_id in range(256):
+            if self.counts[cmd_id] > 0:
+                opcodes["0x{0:02X}".format(cmd_id)] = {
+                    "count": self.counts[cmd_id],
+                    "decode_time": self.decode_times[cmd_id],
+                    "handler_time": self.handler_times[cmd_id],
+                    "events": self.events[cmd_id],
+                    "decode_cache_misses": self.decode_cache_misses[cmd_id]}
+
+        subroutines = {}
+        for unique_id, (commands, active_ticks, events, last_tick) in self.subroutines.items():
+            subroutines[str(unique_id)] = {"commands": commands,
+                                           "active_ticks": active_ticks,
+                                           "events": events}
+
+        return {"commands": sum(self.counts),
+                "decode_time": sum(self.decode_times),
+                "handler_time": sum(self.handler_times),
+                "events": sum(self.events),
+                "decode_cache_misses": sum(self.decode_cache_misses),
+                "opcodes": opcodes,
+                "subroutines": subroutines}
+
+    def write_json(self, fileobj):
+        json.dump(self.get_report(), fileobj, indent=4, sort_keys=True)
+
+
+# Handles commands like SubroutineEventsTemplate, but measures the time spent in
+# decoding and handling every command and reports it to the profiler of the subroutine.
+class ProfilingEventsTemplate(SubroutineEventsTemplate):
+    __slots__ = ()
+
+    def handle_next_command(self, subroutine, midi_scheduler, tick,
+                            ignore_unknown_cmd=False, strict=True):
+        track = midi_scheduler.tracks[subroutine.unique_track_id]
+
+        prev_offset = subroutine.reader.offset
+        cache_miss = prev_offset not in subroutine.decode_cache
+        events_before = len(track)
+
+        start = timer()
+        cmd_id, args = subroutine.parse_next_command(strict)
+        decoded = timer()
+
+        curr_offset = subroutine.reader.offset
+
+        handler = subroutine.dispatch_table[cmd_id][2]
+
+        if handler is not None:
+            handler(subroutine, prev_offset, curr_offset, tick,
+                    midi_scheduler, cmd_id, args, strict)
+
+        elif not ignore_unknown_cmd:
+            raise RuntimeError("Cannot handle Command ID {0} with args {1}"
+                               "".format(cmd_id, args))
+
+        handled = timer()
+
+        subroutine.profiler.record(subroutine.unique_track_id, tick, cmd_id,
+                                   decoded - start, handled - decoded,
+                                   len(track) - events_before, cache_miss)
+
+        return cmd_id
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from pyBMS import BmsInterpreter, PARSERS
+
+    arg_parser = argparse.ArgumentParser(description="Profile the interpretation of BMS files.")
+    arg_parser.add_argument("input_paths", nargs="+")
+    arg_parser.add_argument("--parser", default="pikmin2", choices=sorted(PARSERS.keys()))
+    arg_parser.add_argument("--json", default=None,
+                            help="Where to write the report, defaults to the standard output")
+    args = arg_parser.parse_args()
+
+    total = OpcodeProfiler()
+
+    for input_path in args.input_paths:
+        with open(input_path, "rb") as f:
+            interpreter = BmsInterpreter(f.read(), parser_name=args.parser,
+                                         scheduler_mode="event", profile=True)
+
+        interpreter.parse_file()
+
+        if len(args.input_paths) == 1:
+            total = interpreter.profiler
+        else:
+            total.merge(interpreter.profiler)
+
+    if args.json is None:
+        total.write_json(sys.stdout)
+    else:
+        with open(args.json, "w") as f:
+            total.write_json(f)
@@ -0,0 +1,186 @@
+import random
+
+from EventParsers import parsers
+from bmsmodules.assembler import (Assembler, CMD_DELAY_BYTE, CMD_DELAY_SHORT,
+                                  CMD_NEW_SUBROUTINE, CMD_CALL, CMD_RETURN,
+                                  CMD_JUMP, CMD_VL_DELAY, CMD_END_OF_TRACK)
+
+# Commands which the generator writes on purpose. Every other command known to the parser
+# can be added in between the notes as an extra command, see get_extra_commands.
+STRUCTURE_COMMANDS = set(range(0x00, 0x88)) | set([CMD_DELAY_SHORT, CMD_NEW_SUBROUTINE,
+                                                   CMD_CALL, CMD_RETURN, CMD_JUMP,
+                                                   CMD_VL_DELAY, CMD_END_OF_TRACK])
+
+# The most a value of each struct format character can be.
+FORMAT_MAXIMUMS = {"B": 0xFF, "b": 0x7F, "H": 0xFFFF, "h": 0x7FFF, "I": 0xFFFFFFFF, "i": 0x7FFFFFFF}
+
+
+# Returns the (command id, layout) tuples of the commands that only exist to be interpreted,
+# i.e. that neither play notes nor change the control flow, for the version.
+def get_extra_commands(version):
+    layouts = parsers.container.get_layouts(version)
+
+    return sorted((command_id, layout) for command_id, layout in layouts.items()
+                  if command_id not in STRUCTURE_COMMANDS)
+
+
+# Returns random values that fit the data layout of a command.
+def random_values(rand, layout):
+    if layout == "parse_0xB1":
+        unknown_byte = rand.choice((0x40, 0x00))
+        maximum = 0xFFFF if unknown_byte == 0x40 else 0xFFFFFFFF
+        return (rand.randint(0, 0xFF), unknown_byte, rand.randint(0, maximum))
+    elif layout == "parse_VL_delay":
+        return (rand.randint(0, 0xFFFF), )
+    elif layout == "parse_1Byte_1Tripplet":
+        return (rand.randint(0, 0xFF), rand.randint(0, 0xFFFFFF))
+    elif layout.startswith("parse_"):
+        return ()
+    else:
+        return tuple(rand.randint(0, FORMAT_MAXIMUMS[char]) for char in layout if char not in "<>!=@")
+
+
+# Returns a (delay command id, delay, extra command) tuple for each of count notes.
+# Most delays are short 0x80 delays, long_delay_chance of them use 0x88 or variable-length
+# 0xF0 delays. extra_command_chance of the notes are followed by an extra command.
+def random_timing(rand, count, long_delay_chance, extra_command_chance):
+    timing = []
+
+    for i in range(count):
+        if rand.random() >= long_delay_chance:
+            command_id, delay = CMD_DELAY_BYTE, rand.randint(1, 60)
+        elif rand.random() < 0.5:
+            command_id, delay = CMD_DELAY_SHORT, rand.randint(0x100, 0x800)
+        else:
+            command_id, delay = CMD_VL_DELAY, rand.randint(1, 0x800)
+
+        timing.append((command_id, delay, rand.random() < extra_command_chance))
+
+    return timing
+
+
+# Adds a random note for every entry of the timing, each followed by the delay,
+# a note-off and, if the timing says so, a random one of the extra commands.
+def _add_notes(assembler, rand, timing, extra_commands):
+    for command_id, delay, extra in timing:
+        poly_id = rand.randint(1, 7)
+
+        assembler.note_on(rand.randint(24, 100), poly_id, rand.randint(40, 127))
+        assembler.command(command_id, delay)
+        assembler.note_off(poly_id)
+
+        if extra and len(extra_commands) > 0:
+            extra_id, layout = rand.choice(extra_commands)
+            assembler.command(extra_id, *random_values(rand, layout))
+
+
+# Creates the Assembler of a synthetic song with which the interpreter can be tested at any size.
+#
+# The main track starts track_count subroutines with 0xC1 and ends. If nesting is larger than 1,
+# only every nesting-th subroutine is started by the main track, which starts the next one,
+# which starts the next one, and so on. Every subroutine plays notes_per_track notes. If
+# pattern_notes is set, every subroutine calls a shared pattern of that many notes with 0xC4
+# after every call_every notes, which returns with 0xC6. If loop is set, the subroutines jump
+# back to their first note with 0xC8 instead of ending. Every command takes up a tick, so the
+# subroutines use the same delays and have their extra commands in the same places then. That
+# way, the song gets back into the same state after one pass and the loop is detected.
+def build_song(version=2, track_count=16, notes_per_track=1000, seed=0, loop=False,
+               nesting=1, pattern_notes=0, call_every=16,
+               long_delay_chance=0.05, extra_command_chance=0.0):
+    rand = random.Random(seed)
+    assembler = Assembler(version)
+    extra_commands = get_extra_commands(version)
+
+    shared_timing = random_timing(rand, notes_per_track, long_delay_chance, extra_command_chance)
+
+    for track in range(0, track_count, nesting):
+        assembler.spawn(track & 0xFF, "track_{0}".format(track))
+    assembler.end()
+
+    if pattern_notes > 0:
+        assembler.label("pattern")
+        _add_notes(assembler, rand,
+                   random_timing(rand, pattern_notes, long_delay_chance, extra_command_chance),
+                   extra_commands)
+        assembler.ret()
+
+    for track in range(track_count):
+        assembler.label("track_{0}".format(track))
+
+        if (track + 1) % nesting != 0 and track + 1 < track_count:
+            assembler.spawn((track + 1) & 0xFF, "track_{0}".format(track + 1))
+
+        assembler.label("track_{0}_notes".format(track))
+
+        if loop:
+            timing = shared_timing
+        else:
+            timing = random_timing(rand, notes_per_track, long_delay_chance, extra_command_chance)
+
+        step = call_every if pattern_notes > 0 else max(notes_per_track, 1)
+
+        for start in range(0, notes_per_track, step):
+            _add_notes(assembler, rand, timing[start:start+step], extra_commands)
+
+            if pattern_notes > 0:
+                assembler.call("pattern")
+
+        if loop:
+            assembler.jump("track_{0}_notes".format(track))
+        else:
+            assembler.end()
+
+    return assembler
+
+
+def generate_song(version=2, **kwargs):
+    return build_song(version, **kwargs).assemble()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from pyBMS import PARSERS
+
+    arg_parser = argparse.ArgumentParser(description="Generate a synthetic BMS file.")
+    arg_parser.add_argument("output_path")
+    arg_parser.add_argument("--parser", default="pikmin2", choices=sorted(PARSERS.keys()))
+    arg_parser.add_argument("--tracks", type=int, default=16)
+    arg_parser.add_argument("--notes", type=int, default=1000,
+                            help="How many notes every track plays")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--loop", action="store_true",
+                            help="Loop the tracks instead of ending them")
+    arg_parser.add_argument("--nesting", type=int, default=1,
+                            help="How many tracks are started one by another")
+    arg_parser.add_argument("--pattern-notes", type=int, default=0,
+                            help="The size of a pattern that every track calls repeatedly")
+    arg_parser.add_argument("--call-every", type=int, default=16,
+                            help="After how many notes the pattern is called")
+    arg_parser.add_argument("--long-delays", type=float, default=0.05,
+                            help="The share of delays that use 0x88 or 0xF0")
+    arg_parser.add_argument("--extra-commands", type=float, default=0.0,
+                            help="The chance of a version specific command after a note")
+    arg_parser.add_argument("--source", action="store_true",
+                            help="Write the source text for the assembler instead of the BMS file")
+    args = arg_parser.parse_args()
+
+    start = time.time()
+    assembler = build_song(PARSERS[args.parser], track_count=args.tracks,
+                           notes_per_track=args.notes, seed=args.seed, loop=args.loop,
+                           nesting=args.nesting, pattern_notes=args.pattern_notes,
+                           call_every=args.call_every, long_delay_chance=args.long_delays,
+                           extra_command_chance=args.extra_commands)
+
+    if args.source:
+        data = assembler.format_source()
+        mode = "w"
+    else:
+        data = assembler.assemble()
+        mode = "wb"
+
+    with open(args.output_path, mode) as f:
+        f.write(data)
+
+    print("Wrote {0} commands ({1} bytes) to {2} in {3:.2f}s".format(
+        len(assembler), len(data), args.output_path, time.time() - start))
@@ -1,14 +1,70 @@
+import logging
+import weakref
 
-from events import Events
+logger = logging.getLogger(__name__)
 
+# The event handlers do not keep any state, so a handler class only needs a single instance,
+# which is shared by all subroutines. The instance is kept together with the dispatch table
+# whose methods are bound to it, as an (event handler, dispatch table) tuple, by event handler
+# class and by parser. The parsers are weak references, so that long-running processes don't
+# keep the tables of every custom parser they have ever used.
+_dispatch_tables = weakref.WeakKeyDictionary()
 
+# The polyphonic IDs that a note-on command can use. Note-off commands
+# can only turn off the IDs 1 to 7, see SubroutineEventsTemplate.
+POLYPHONIC_VOICES = 8
+
+# The voices of a subroutine that is not playing any notes.
+_SILENT_VOICES = ((), )*POLYPHONIC_VOICES
+
+
+# A dispatch table is a tuple with an entry for each of the 256 command IDs.
+# Each entry is a (struct_obj, parser_func, handler) tuple: The first two are
+# used for decoding the command (see VersionSpecificParser.compile_decoders),
+# the last one is the method of the shared event handler that handles the command,
+# or None. The table is built once for every parser and shared by all subroutines.
+def _compile_dispatch_table(bms_parser, handler_class):
+    tables = _dispatch_tables.setdefault(bms_parser, {})
+
+    if handler_class not in tables:
+        handlers = handler_class.get_event_handlers()
+        event_handler = handler_class()
+        table = []
+
+        for cmd_id, decoder in enumerate(bms_parser.compile_decoders()):
+            struct_obj, parser_func = decoder
+            handler = handlers.get(cmd_id)
+
+            if handler is not None:
+                handler = handler.__get__(event_handler, handler_class)
+
+            table.append((struct_obj, parser_func, handler))
+
+        tables[handler_class] = (event_handler, tuple(table))
+
+    return tables[handler_class]
+
+
+def get_dispatch_table(bms_parser, handler_class):
+    return _compile_dispatch_table(bms_parser, handler_class)[1]
+
+
+# Songs can start hundreds of short subroutines, so the attributes are kept in slots
+# instead of a dictionary for every subroutine.
 class SubroutineTemplate(object):
+    __slots__ = ("reader", "track_id", "parent_id", "unique_track_id", "start_offset",
+                 "bms_subroutines", "return_offset", "jumped", "bms_parser", "decode_cache",
+                 "_voices", "stopped", "options", "pause_ticks_left", "wake_tick",
+                 "profiler", "subroutine_handler", "dispatch_table")
+
     def __init__(self,
                  reader,
                  track_id, unique_track_id, parent_id,
                  offset, bms_parser,
                  options,
-                 custom_subroutine_handler=None):
+                 custom_subroutine_handler=None,
+                 bms_subroutines=None,
+                 decode_cache=None):
 
         # reader is an instance of DataReader, found in DataReader.py
         # With it, data reading can be abstracted a little bit so that
@@ -17,11 +73,6 @@ class SubroutineTemplate(object):
         # data and parse it accordingly.
         self.reader = reader
 
-        # filehandle represents the file handle used by the current reader instance.
-        # Each subroutine has its own reader instance, and every filehandle points to a
-        # different spot in the file data of a BMS file
-        self.filehandle = reader.filehandle
-
         # The track ID is a number, normally between 0 and 15, as specified by the BMS file
         # in 0xC1 events.
         self.track_id = track_id
@@ -35,16 +86,37 @@ class SubroutineTemplate(object):
 
         # This is the offset in the file at which the subroutine data starts.
         self.start_offset = offset
+        self.reader.seek(offset)
+
+        # bms_subroutines is the BmsSubroutines collection the subroutine belongs to.
+        # New subroutines spawned by 0xC1 commands are added to it.
+        self.bms_subroutines = bms_subroutines
+
+        # The offset to which a 0xC6 command returns. It is set by 0xC4 commands.
+        self.return_offset = None
+
+        # Set when the subroutine has jumped to a different offset. The interpreter
+        # uses it to check whether the song has started looping.
+        self.jumped = False
 
         # bmsParser is an instance of VersionSpecificParser found in ParserCreator.py
         # It contains the functions for parsing data from the BMS "version" it has been
         # initiated with.
         self.bms_parser = bms_parser
 
+        # Maps offsets in the file to the command decoded at that offset, as
+        # (command id, arguments, offset of the next command) tuples.
+        # Subroutines of the same song share the cache so that every command
+        # is only decoded once, no matter how often it is played.
+        if decode_cache is None:
+            decode_cache = {}
+        self.decode_cache = decode_cache
+
         # We need to keep track of which notes we have
         # assigned to which IDs so that we can turn off all notes
         # with a specific polyhponic ID when we encounter a note off event.
-        self._enabled_poly_ids = {}
+        # The list has a tuple of the playing notes for every polyphonic ID.
+        self._voices = list(_SILENT_VOICES)
 
         # Once started, a subroutine should be running until it
         # encounters an end of track command.
@@ -53,28 +125,69 @@ class SubroutineTemplate(object):
         self.options = options
         self.pause_ticks_left = 0
 
-        self.subroutine_handler = None
+        # The tick at which the subroutine will handle its next command.
+        # Pauses set by the handled command are turned into a new wake tick
+        # so that the interpreter does not need to count them down tick by tick.
+        self.wake_tick = 0
+
+        # The OpcodeProfiler that ProfilingEventsTemplate reports to, if profiling is enabled.
+        self.profiler = None
+
         if custom_subroutine_handler is None:
-            self.subroutine_handler = SubroutineEventsTemplate(self)
-        else:
-            self.subroutine_handler = custom_subroutine_handler(self)
+            custom_subroutine_handler = SubroutineEventsTemplate
+
+        self.subroutine_handler, self.dispatch_table = _compile_dispatch_table(bms_parser,
+                                                                               custom_subroutine_handler)
 
     # Keeping track of enabled polyphonic IDs and their notes
     def add_polyphonic_note(self, id, note):
-        if id not in self._enabled_poly_ids:
-            self._enabled_poly_ids[id] = [note]
-        else:
-            self._enabled_poly_ids[id].append(note)
+        self._voices[id] += (note, )
 
     def get_notes_by_id(self, id):
-        if id not in self._enabled_poly_ids:
-            return []
-        else:
-            return self._enabled_poly_ids[id]
+        return self._voices[id]
 
     def turn_off_id(self, id):
-        if id in self._enabled_poly_ids:
-            del self._enabled_poly_ids[id]
+        self._voices[id] = ()
+
+    def release_notes(self, scheduler, tick):
+        for notes in self._voices:
+            for note in notes:
+                scheduler.note_off(self.unique_track_id, tick, note, volume=0)
+
+        self._voices = list(_SILENT_VOICES)
+
+    def go_to_offset(self, offset):
+        self.reader.seek(offset)
+        self.jumped = True
+
+    def spawn_subroutine(self, scheduler, track_id, offset, tick):
+        if self.bms_subroutines.spawn_points is not None:
+            self.bms_subroutines.spawn_points.append((track_id, offset, tick))
+        else:
+            self.bms_subroutines.add_subroutine(self.unique_track_id, track_id, offset, tick)
+            scheduler.add_track(self.bms_subroutines.get_previous_uid(), tick)
+
+    # Returns the state of the subroutine at the given tick, that is all information
+    # which decides what the subroutine will do from now on. If the state of every
+    # subroutine is the same at two different ticks, the song has looped.
+    def get_state(self, tick):
+        return (self.track_id, self.reader.offset, self.wake_tick - tick,
+                tuple(self._voices), self.return_offset)
+
+    # Returns everything about the subroutine that changes while it is running,
+    # so that it can be put back into this state by restore_checkpoint.
+    def save_checkpoint(self):
+        return (self.reader.offset, self.wake_tick, self.return_offset, self.stopped,
+                tuple(self._voices))
+
+    def restore_checkpoint(self, checkpoint):
+        offset, self.wake_tick, self.return_offset, self.stopped, voices = checkpoint
+
+        self.reader.seek(offset)
+        self._voices = list(voices)
+
+        self.jumped = False
+        self.pause_ticks_left = 0
 
     def set_pause(self, length):
         if length < 0:
@@ -82,47 +195,147 @@ class SubroutineTemplate(object):
         self.pause_ticks_left += length
 
     def handle_next_command(self, scheduler, tick):
-        if self.pause_ticks_left > 0:
-            self.pause_ticks_left -= 1
-
+        if self.stopped or tick < self.wake_tick:
             return None
         else:
-            cmd = self.subroutine_handler.handle_next_command(scheduler, tick, False, True)
-            return cmd
+            sleep = self.run(scheduler, tick)
+            self.wake_tick = tick + sleep
+
+            return sleep
+
+    # Handles the commands of the subroutine for the current tick and
+    # returns the amount of ticks the subroutine wants to sleep before
+    # it handles its next command.
+    # By default, only one command is handled per tick and a pause of n ticks
+    # makes the subroutine sleep for n ticks on top of the tick that
+    # the command took. With the run_to_delay option, all commands up to the
+    # next pause or the end of the track are handled at once and the subroutine
+    # sleeps for exactly as many ticks as the pause says.
+    # Which command comes next only depends on the offset and the return offset.
+    # If the subroutine gets back to both of them after a jump without a pause,
+    # it would never finish the tick, so the tick ends there instead. The loop
+    # is then found by the loop detection of the interpreter, as it would be
+    # with one command per tick.
+    def run(self, scheduler, tick):
+        if self.options.run_to_delay:
+            # The (offset, return offset) tuples reached in this tick since the first jump.
+            visited = None
+
+            while True:
+                self.subroutine_handler.handle_next_command(self, scheduler, tick, False, True)
+
+                if self.pause_ticks_left > 0 or self.stopped:
+                    break
+                elif self.jumped:
+                    position = (self.reader.offset, self.return_offset)
+
+                    if visited is None:
+                        visited = set()
+                    elif position in visited:
+                        break
+
+                    visited.add(position)
+
+            sleep = max(self.pause_ticks_left, 1)
+        else:
+            self.subroutine_handler.handle_next_command(self, scheduler, tick, False, True)
+            sleep = 1 + self.pause_ticks_left
+
+        self.pause_ticks_left = 0
+
+        return sleep
 
     def parse_next_command(self, strict = True):
-        return self.bms_parser.parse_next_cmd(self.filehandle, self.reader, strict)
+        offset = self.reader.offset
+        cached_cmd = self.decode_cache.get(offset)
+
+        if cached_cmd is None:
+            cmd_id, args = self.decode_command(strict)
+            self.decode_cache[offset] = (cmd_id, args, self.reader.offset)
+        else:
+            cmd_id, args, next_offset = cached_cmd
+            self.reader.offset = next_offset
+
+        return cmd_id, args
+
+    def decode_command(self, strict=True):
+        cmd_id = self.reader.byte()
+        struct_obj, parser_func, handler = self.dispatch_table[cmd_id]
+
+        if struct_obj is not None:
+            args = self.reader.unpack(struct_obj)
+        elif parser_func is not None:
+            args = parser_func(self.reader, strict, cmd_id)
+        else:
+            raise RuntimeError("Unknown Command ID: {cmdID} at offset {offset}"
+                               "".format(cmdID=hex(cmd_id), offset=hex(self.reader.offset - 1)))
+
+        return cmd_id, args
 
 
+def _add_eventhandler(handlers, id, func):
+    if not callable(func):
+        raise RuntimeError("func argument must be a function!")
+    elif id in handlers:
+        raise RuntimeError("Event handler for {0} already exists!".format(hex(id)))
+
+    handlers[id] = func
+
+
+def _add_eventhandler_range(handlers, start, end, func):
+    for i in range(start, end):
+        _add_eventhandler(handlers, i, func)
+
+
+def _fill_undefined_events(handlers, start, end, func):
+    for i in range(start, end):
+        if i not in handlers:
+            _add_eventhandler(handlers, i, func)
+
+
+# Handles the commands of subroutines. The handler does not keep any state, the subroutine
+# that handles the command is passed to every method, so all subroutines share one instance.
 class SubroutineEventsTemplate(object):
-    def __init__(self, subroutine):
-        self.subroutine = subroutine
+    __slots__ = ()
+
+    # Returns a dictionary of command IDs and the functions of the class handling them.
+    # Subclasses can override it to handle more commands. It is only called once
+    # per parser, when the dispatch table is compiled.
+    @classmethod
+    def get_event_handlers(cls):
+        handlers = {}
 
-        self.bms_events = Events()
+        _add_eventhandler_range(handlers, 0x00, 0x80, cls.event_handle_note_on)
+        _add_eventhandler_range(handlers, 0x81, 0x88, cls.event_handle_note_off)
 
-        self._add_eventhandler_range(0x00, 0x80, self.event_handle_note_on)
-        self._add_eventhandler_range(0x81, 0x88, self.event_handle_note_off)
+        _add_eventhandler(handlers, 0x80, cls.event_handle_pause)
+        _add_eventhandler(handlers, 0x88, cls.event_handle_pause)
+        _add_eventhandler(handlers, 0xF0, cls.event_handle_pause)
 
-        self._add_eventhandler(0x80, self.event_handle_pause)
-        self._add_eventhandler(0x88, self.event_handle_pause)
+        _add_eventhandler(handlers, 0xC1, cls.event_handle_new_subroutine)
+        _add_eventhandler(handlers, 0xC4, cls.event_handle_call)
+        _add_eventhandler(handlers, 0xC6, cls.event_handle_return)
+        _add_eventhandler(handlers, 0xC8, cls.event_handle_jump)
 
-        self._add_eventhandler(0xFF, self.event_handle_endoftrack)
+        _add_eventhandler(handlers, 0xFF, cls.event_handle_endoftrack)
 
-        self._fill_undefined_events(0x00, 0xFF, self.event_handle_unknown)
+        _fill_undefined_events(handlers, 0x00, 0xFF, cls.event_handle_unknown)
 
-    def handle_next_command(self, midi_scheduler, tick, ignore_unknown_cmd=False, strict=True):
-        prev_offset = self.subroutine.filehandle.tell()
-        cmd_data = self.subroutine.parse_next_command(strict)
-        curr_offset = self.subroutine.filehandle.tell()
+        return handlers
 
-        cmd_id, args = cmd_data
-        #print cmdData
-        if cmd_id in self.bms_events:
+    def handle_next_command(self, subroutine, midi_scheduler, tick,
+                            ignore_unknown_cmd=False, strict=True):
+        prev_offset = subroutine.reader.offset
+        cmd_id, args = subroutine.parse_next_command(strict)
+        curr_offset = subroutine.reader.offset
+
+        handler = subroutine.dispatch_table[cmd_id][2]
+
+        if handler is not None:
             # tick refers to the tick at which the main loop signaled the subroutine
             # to parse and handle the next command.
-            # Every tick, all subroutines can either parse and handle one command, or sleep.
-            self.bms_events.exec_event(cmd_id, prev_offset, curr_offset, tick,
-                                       midi_scheduler, cmd_id, args, strict)
+            handler(subroutine, prev_offset, curr_offset, tick,
+                    midi_scheduler, cmd_id, args, strict)
 
         elif not ignore_unknown_cmd:
             raise RuntimeError("Cannot handle Command ID {0} with args {1}"
@@ -130,62 +343,80 @@ class SubroutineEventsTemplate(object):
 
         return cmd_id
 
-    def _add_eventhandler(self, id, func):
-        self.bms_events.add_event(id, func)
-
-    def _add_eventhandler_range(self, start, end, func):
-        for i in xrange(start, end):
-            self.bms_events.add_event(i, func)
-
-    def _fill_undefined_events(self, start, end, func):
-        for i in xrange(start, end):
-            if i not in self.bms_events:
-                self.bms_events.add_event(i, func)
-
-    def event_handle_note_on(self, prev_offset, curr_offset, tick,
+    def event_handle_note_on(self, subroutine, prev_offset, curr_offset, tick,
                              midi_scheduler, cmd_id, args, strict):
 
         poly_id, volume = args
 
-        if poly_id > 0x7 and strict:
+        # The polyphonic ID is decoded as a signed byte, so bytes of 0x80
+        # and above are negative and need to be rejected as well.
+        if not 0 <= poly_id <= 0x7 and strict:
             raise RuntimeError("Invalid Polyphonic ID 0x{0:x} at offset 0x{1:x}"
-                               "".format(poly_id, prev_offset))
-        elif poly_id > 0x7:
+                               "".format(poly_id & 0xFF, prev_offset))
+        elif not 0 <= poly_id <= 0x7:
             # Well, we will skip this invalid note and hope that
             # everything will go well.
             return
 
-        self.subroutine.add_polyphonic_note(cmd_id, poly_id)
-        midi_scheduler.note_on(self.subroutine.unique_track_id,
+        subroutine.add_polyphonic_note(poly_id, cmd_id)
+        midi_scheduler.note_on(subroutine.unique_track_id,
                                tick,
                                cmd_id, volume)
 
 
 
-    def event_handle_note_off(self, prev_offset, curr_offset, tick,
+    def event_handle_note_off(self, subroutine, prev_offset, curr_offset, tick,
                               midi_scheduler, cmd_id, args, strict):
 
         poly_id = args[0]
-        for note in self.subroutine.get_notes_by_id(poly_id):
-            midi_scheduler.note_off(self.subroutine.unique_track_id,
+        for note in subroutine.get_notes_by_id(poly_id):
+            midi_scheduler.note_off(subroutine.unique_track_id,
                                     tick,
                                     note, volume=0)
-        self.subroutine.turn_off_id(poly_id)
+        subroutine.turn_off_id(poly_id)
 
 
-    def event_handle_unknown(self, prev_offset, curr_offset, tick,
+    def event_handle_unknown(self, subroutine, prev_offset, curr_offset, tick,
                              midi_scheduler, cmd_id, args, strict):
         pass
 
-    def event_handle_endoftrack(self, prev_offset, curr_offset, tick,
+    def event_handle_endoftrack(self, subroutine, prev_offset, curr_offset, tick,
                                 midi_scheduler, cmd_id, args, strict):
-        print "Track end at", curr_offset, ",", tick, "Ticks"
-        self.subroutine.stopped = True
+        logger.debug("Track end at %d, %d ticks", curr_offset, tick)
+        subroutine.stopped = True
+
+    def event_handle_new_subroutine(self, subroutine, prev_offset, curr_offset, tick,
+                                    midi_scheduler, cmd_id, args, strict):
+        track_id, offset = args
+        subroutine.spawn_subroutine(midi_scheduler, track_id, offset, tick)
+
+    # The most significant byte of the 0xC4 argument is the mode of the command,
+    # the other three bytes are the offset. Modes other than 0 are probably
+    # conditions, but as we do not know them, we always take the call.
+    def event_handle_call(self, subroutine, prev_offset, curr_offset, tick,
+                          midi_scheduler, cmd_id, args, strict):
+        offset = args[0] & 0xFFFFFF
+        subroutine.return_offset = curr_offset
+        subroutine.go_to_offset(offset)
+
+    def event_handle_return(self, subroutine, prev_offset, curr_offset, tick,
+                            midi_scheduler, cmd_id, args, strict):
+        if subroutine.return_offset is None:
+            if strict:
+                raise RuntimeError("Return without call at offset 0x{0:x}"
+                                   "".format(prev_offset))
+        else:
+            subroutine.go_to_offset(subroutine.return_offset)
+
+    def event_handle_jump(self, subroutine, prev_offset, curr_offset, tick,
+                          midi_scheduler, cmd_id, args, strict):
+        mode, offset = args
+        subroutine.go_to_offset(offset)
 
-    def event_handle_pause(self, prev_offset, curr_offset, tick,
+    def event_handle_pause(self, subroutine, prev_offset, curr_offset, tick,
                            midi_scheduler, cmd_id, args, strict):
         delay = args[0]
         # print "Track {0} is paused for {1} ticks".format(current_uniquetrack_id,
         #                                                 delay)
-        self.subroutine.set_pause(delay)
+        subroutine.set_pause(delay)
 
@@ -0,0 +1,309 @@
+import time
+import wave
+
+from bmsmodules.MidiWriter.event_kinds import (EVENT_NOTE_ON, EVENT_NOTE_OFF, EVENT_CONTROLLER,
+                                               EVENT_CONTROLLER_TWO_BYTES, EVENT_PROGRAM,
+                                               EVENT_PITCH)
+from bmsmodules.MidiWriter.tempo_clock import TempoClock
+
+# The synthesizer needs NumPy, everything else works without it.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TABLE_SIZE = 2048
+
+# The range of pitch changes in semitones, as on most midi synthesizers.
+PITCH_BEND_RANGE = 2.0
+PITCH_CENTER = 0x2000
+
+# Controller 7 is the channel volume.
+CONTROLLER_VOLUME = 7
+
+
+def _create_wavetables():
+    phase = numpy.arange(TABLE_SIZE, dtype=numpy.float32) / TABLE_SIZE
+
+    sine = numpy.sin(2*numpy.pi*phase)
+    square = numpy.where(phase < 0.5, 1.0, -1.0) * 0.5
+    saw = (2*phase - 1) * 0.5
+    triangle = 1 - 4*numpy.abs(phase - 0.5)
+
+    return [table.astype(numpy.float32) for table in (sine, square, saw, triangle)]
+
+
+# A note that is being played. level is the current level of the envelope,
+# which rises to 1 after the note has started and falls to 0 after it has been released.
+class Voice(object):
+    def __init__(self, track_id, note, velocity, table, step, started):
+        self.track_id = track_id
+        self.note = note
+        self.velocity = velocity
+        self.table = table
+
+        self.phase = 0.0
+        # How far the phase moves per sample, in wavetable entries.
+        self.step = step
+
+        self.level = 0.0
+        self.released = False
+        self.started = started
+
+
+class RenderStats(object):
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.samples = 0
+        self.render_time = 0.0
+        self.notes = 0
+        # Notes that have been cut off because max_voices notes were playing.
+        self.stolen_voices = 0
+        # Samples that had to be clipped to fit into 16 bits.
+        self.clipped_samples = 0
+
+    def duration(self):
+        return float(self.samples) / self.sample_rate
+
+    # How many seconds of audio have been rendered per second.
+    def realtime_factor(self):
+        if self.render_time == 0:
+            return 0.0
+        else:
+            return self.duration() / self.render_time
+
+    def as_dict(self):
+        return {"sample_rate": self.sample_rate,
+                "duration": self.duration(),
+                "render_time": self.render_time,
+                "realtime_factor": self.realtime_factor(),
+                "notes": self.notes,
+                "stolen_voices": self.stolen_voices,
+                "clipped_samples": self.clipped_samples}
+
+
+# Renders the events of a MidiScheduler into a mono 16 bit WAV file. Every note is a
+# voice that plays one of four wavetables, picked by the program of its track. The
+# samples between two events are computed for all samples of a voice at once.
+# Tempo changes are handled the same way as in the midi files, see TempoClock.
+# gain is the level of max_voices voices playing at full volume together, every voice
+# gets its share of it. No more than max_voices voices are played at once, so the
+# samples are never clipped with a gain of up to 1.
+class Synthesizer(object):
+    def __init__(self, sample_rate=32000, max_voices=32, division=100, tempo_bpm=120,
+                 attack=0.005, release=0.05, gain=1.0, chunk_size=32768):
+        if numpy is None:
+            raise RuntimeError("The synthesizer needs NumPy to be installed!")
+
+        self.sample_rate = sample_rate
+        self.max_voices = max_voices
+        self.division = division
+        self.tempo_bpm = tempo_bpm
+
+        # How much the envelope level changes per sample.
+        self.attack_step = 1.0 / max(1, int(attack*sample_rate))
+        self.release_step = 1.0 / max(1, int(release*sample_rate))
+
+        self.gain = gain
+        self.voice_gain = gain / max_voices
+
+        # The rendered samples are written to the file whenever chunk_size samples are done.
+        self.chunk_size = chunk_size
+
+        self._tables = _create_wavetables()
+
+    def _get_step(self, note, pitch):
+        semitones = note - 69 + (pitch - PITCH_CENTER)*PITCH_BEND_RANGE/PITCH_CENTER
+        frequency = 440.0 * 2**(semitones/12.0)
+
+        return frequency * TABLE_SIZE / self.sample_rate
+
+    # Adds sample_count samples of every voice to out, starting at offset.
+    def _mix(self, voices, volumes, out, offset, sample_count):
+        positions = numpy.arange(1, sample_count + 1, dtype=numpy.float64)
+
+        for voice in voices:
+            phases = voice.phase + positions*voice.step
+            indices = phases.astype(numpy.int64) & (TABLE_SIZE - 1)
+
+            if voice.released:
+                levels = numpy.maximum(voice.level - positions*self.release_step, 0.0)
+            else:
+                levels = numpy.minimum(voice.level + positions*self.attack_step, 1.0)
+
+            amplitude = self.voice_gain * (voice.velocity/127.0) * (volumes.get(voice.track_id, 127)/127.0)
+            out[offset:offset+sample_count] += voice.table[indices] * levels * amplitude
+
+            voice.phase = phases[-1] % TABLE_SIZE
+            voice.level = levels[-1]
+
+        # Voices that have faded out are done.
+        voices[:] = [voice for voice in voices if not voice.released or voice.level > 0]
+
+    def _start_note(self, voices, stats, track_id, note, velocity, programs, pitches, position):
+        if velocity <= 0:
+            return
+
+        if len(voices) >= self.max_voices:
+            # Released voices are stolen first, then the oldest voice.
+            victim = min(voices, key=lambda voice: (not voice.released, voice.started))
+            voices.remove(victim)
+            stats.stolen_voices += 1
+
+        table = self._tables[programs.get(track_id, 0) % len(self._tables)]
+        step = self._get_step(note, pitches.get(track_id, PITCH_CENTER))
+
+        voices.append(Voice(track_id, note, velocity, table, step, position))
+        stats.notes += 1
+
+    def _handle_event(self, voices, stats, track_id, kind, data1, data2,
+                      programs, pitches, volumes, position):
+        if kind == EVENT_NOTE_ON:
+            self._start_note(voices, stats, track_id, data1, data2, programs, pitches, position)
+
+        elif kind == EVENT_NOTE_OFF:
+            for voice in voices:
+                if voice.track_id == track_id and voice.note == data1 and not voice.released:
+                    voice.released = True
+
+        elif kind == EVENT_PROGRAM:
+            programs[track_id] = data1
+
+        elif kind == EVENT_PITCH:
+            pitches[track_id] = data1
+
+            for voice in voices:
+                if voice.track_id == track_id:
+                    voice.step = self._get_step(voice.note, data1)
+
+        elif kind == EVENT_CONTROLLER and data1 == CONTROLLER_VOLUME:
+            volumes[track_id] = data2
+
+        elif kind == EVENT_CONTROLLER_TWO_BYTES and data1 == CONTROLLER_VOLUME:
+            volumes[track_id] = data2 >> 7
+
+    def _write_chunk(self, wav_file, stats, chunk, sample_count):
+        samples = chunk[:sample_count] * 32767
+        stats.clipped_samples += int(numpy.count_nonzero(numpy.abs(samples) > 32767))
+
+        numpy.clip(samples, -32768, 32767, out=samples)
+        wav_file.writeframes(samples.astype("<i2").tobytes())
+
+        stats.samples += sample_count
+        chunk[:] = 0
+
+    # Renders the scheduler's events into the WAV file at path, or into a file object,
+    # and returns a RenderStats object.
+    def render(self, scheduler, path):
+        start = time.time()
+        stats = RenderStats(self.sample_rate)
+
+        clock = TempoClock(self.division, self.tempo_bpm)
+
+        voices = []
+        programs = {}
+        pitches = {}
+        volumes = {}
+
+        chunk = numpy.zeros(self.chunk_size, dtype=numpy.float32)
+        chunk_start = 0
+        position = 0
+
+        wav_file = wave.open(path, "wb")
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(self.sample_rate)
+
+        try:
+            for tick, track_id, kind, data1, data2 in scheduler.collect_events():
+                if clock.handle_event(tick, kind, data1):
+                    continue
+
+                event_position = int(clock.tick_to_time(tick)*self.sample_rate)
+                position, chunk_start = self._render_until(voices, volumes, stats, wav_file,
+                                                           chunk, chunk_start, position,
+                                                           event_position)
+
+                self._handle_event(voices, stats, track_id, kind, data1, data2,
+                                   programs, pitches, volumes, position)
+
+            # Notes that are never turned off are released at the end, after which
+            # the rendering goes on until every voice has faded out.
+            for voice in voices:
+                voice.released = True
+
+            while len(voices) > 0:
+                position, chunk_start = self._render_until(voices, volumes, stats, wav_file,
+                                                           chunk, chunk_start, position,
+                                                           position + self.chunk_size)
+
+            self._write_chunk(wav_file, stats, chunk, position - chunk_start)
+        finally:
+            wav_file.close()
+
+        stats.render_time = time.time() - start
+
+        return stats
+
+    # Renders from position up to end_position, writing every chunk that has been filled
+    # to the file. Returns the new position and the position at which the chunk starts.
+    def _render_until(self, voices, volumes, stats, wav_file, chunk, chunk_start,
+                      position, end_position):
+        while position < end_position:
+            chunk_end = chunk_start + self.chunk_size
+
+            if chunk_end > end_position:
+                self._mix(voices, volumes, chunk, position - chunk_start, end_position - position)
+                position = end_position
+            else:
+                self._mix(voices, volumes, chunk, position - chunk_start, chunk_end - position)
+                self._write_chunk(wav_file, stats, chunk, self.chunk_size)
+
+                position = chunk_start = chunk_end
+
+        return position, chunk_start
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    from pyBMS import BmsInterpreter, PARSERS
+
+    arg_parser = argparse.ArgumentParser(description="Render BMS files to WAV files.")
+    arg_parser.add_argument("input_path", help="A BMS file, or a directory with BMS files")
+    arg_parser.add_argument("output_path", nargs="?", default=None,
+                            help="Defaults to the input path with .wav added")
+    arg_parser.add_argument("--parser", default="pikmin2", choices=sorted(PARSERS.keys()))
+    arg_parser.add_argument("--sample-rate", type=int, default=32000)
+    arg_parser.add_argument("--voices", type=int, default=32,
+                            help="How many notes can be played at the same time")
+    args = arg_parser.parse_args()
+
+    if os.path.isdir(args.input_path):
+        output_dir = args.output_path if args.output_path is not None else args.input_path
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        jobs = [(os.path.join(args.input_path, file_name),
+                 os.path.join(output_dir, file_name + ".wav"))
+                for file_name in sorted(os.listdir(args.input_path))
+                if file_name.endswith(".bms")]
+    else:
+        output_path = args.output_path
+        if output_path is None:
+            output_path = args.input_path + ".wav"
+
+        jobs = [(args.input_path, output_path)]
+
+    synthesizer = Synthesizer(sample_rate=args.sample_rate, max_voices=args.voices)
+
+    for input_path, output_path in jobs:
+        with open(input_path, "rb") as f:
+            interpreter = BmsInterpreter(f.read(), parser_name=args.parser,
+                                         scheduler_mode="event")
+
+        interpreter.parse_file()
+        stats = synthesizer.render(interpreter.scheduler, output_path)
+
+        print("{0}: {1:.1f}s of audio in {2:.2f}s ({3:.1f}x real time)".format(
+            output_path, stats.duration(), stats.render_time, stats.realtime_factor()))
@@ -0,0 +1,90 @@
+import heapq
+
+from bmsmodules.MidiWriter.event_kinds import EVENT_BPM, EVENT_PPQN
+
+
+# The result of interpreting a single track of a song together with the subroutines
+# it starts, see BmsInterpreter.parse_file_parallel. The subroutines of the part have
+# their own unique ids, starting at 0 for the track itself. parent_ids holds the id
+# of the subroutine that started each of them, and tracks its EventTrack.
+# If the spawns of the track have not been interpreted, spawn_points holds their
+# (track id, offset, tick) tuples, in the order in which they happened.
+class TrackPart(object):
+    def __init__(self, status, error, ticks, parent_ids, tracks, spawn_points=None):
+        self.status = status
+        self.error = error
+        self.ticks = ticks
+
+        self.parent_ids = parent_ids
+        self.tracks = tracks
+        self.spawn_points = spawn_points
+
+    # Returns the ids of the subroutines started by each subroutine, in the order in which
+    # they were started, which is the order of their ids.
+    def get_children(self):
+        children = [[] for track in self.tracks]
+
+        for unique_id, parent_id in enumerate(self.parent_ids):
+            if parent_id is not None:
+                children[parent_id].append(unique_id)
+
+        return children
+
+
+# Puts the EventTracks of the main track and of the tracks it has started into the order of the
+# unique ids that the interpreter would have given them, and returns them as a list.
+# track_parts holds the part of every spawn point of main_part, in the same order.
+#
+# The interpreter gives a subroutine the next unique id when it is started. On every tick,
+# the subroutines are handled in the order of their ids, so the subroutines are started in
+# the order of the tick, the id of the subroutine that starts them, and the order in which
+# that subroutine starts them. As a subroutine can only be started on or after the tick of
+# its parent, the ids can be handed out in that order with a priority queue.
+def merge_track_parts(main_part, track_parts):
+    tracks = []
+    children = {}
+
+    # (tick, unique id of the parent, child index, part, id in the part) tuples.
+    queue = []
+
+    def add_track(part, part_id, started):
+        unique_id = len(tracks)
+        tracks.append(part.tracks[part_id])
+
+        for index, (child_part, child_id) in enumerate(started):
+            heapq.heappush(queue, (child_part.tracks[child_id].starts_at, unique_id, index,
+                                   child_part, child_id))
+
+    add_track(main_part, 0, [(part, 0) for part in track_parts])
+
+    while len(queue) > 0:
+        tick, parent_id, index, part, part_id = heapq.heappop(queue)
+
+        if part not in children:
+            children[part] = part.get_children()
+
+        add_track(part, part_id, [(part, child_id) for child_id in children[part][part_id]])
+
+    return tracks
+
+
+# Returns the BPM and PPQN events of all tracks as (tick, unique id, index, kind, value) tuples,
+# in the order in which the interpreter would have added them. The tracks are in the order of
+# their unique ids, as returned by merge_track_parts.
+def get_tempo_map(tracks):
+    tempo_map = []
+
+    for unique_id, track in enumerate(tracks):
+        # Searching the bytes of the kinds is much faster than looking at every event.
+        kinds = track.kinds.tobytes()
+
+        for kind in (EVENT_BPM, EVENT_PPQN):
+            index = kinds.find(kind)
+
+            while index != -1:
+                tempo_map.append((track.ticks[index], unique_id, index, kind, track.data1[index]))
+                index = kinds.find(kind, index + 1)
+
+    tempo_map.sort()
+
+    return tempo_map
@@ -14,4 +14,4 @@ def scale_num(num, from_bits, to_bits):
 
 
 if __name__ == "__main__":
-    print scale_num(2819, 14, 16)
+    print(scale_num(2819, 14, 16))
@@ -1,10 +1,18 @@
-from StringIO import StringIO
+import asyncio
+import heapq
+import multiprocessing
+import struct
 
 from OptionsCollector import OptionsCollector
 from EventParsers import parsers
 from EventParsers.parser_creator import VersionSpecificParser
+from bmsmodules.checkpoints import Checkpoint, CheckpointStore
 from bmsmodules.data_reader import DataReader
+from bmsmodules.disassembler import disassemble
+from bmsmodules.profiler import OpcodeProfiler, ProfilingEventsTemplate
 from bmsmodules.subroutine_template import SubroutineTemplate as Subroutine
+from bmsmodules.track_parts import TrackPart, merge_track_parts, get_tempo_map
+from bmsmodules.MidiWriter.event_kinds import EVENT_BPM
 from bmsmodules.MidiWriter.midi_scheduler import MidiScheduler
 
 # Estimated BMS versions for each of the game.
@@ -16,22 +24,42 @@ PARSERS = {"pikmin1": 0.5,
            "zeldawindwaker": 1.5,
            "supermariosunshine": 1}
 
+# The states in which BmsInterpreter.parse_file can finish.
+# finished: All subroutines have reached their end of track command.
+# looped: The song loops and has been played for the configured amount of loops.
+# truncated: The song has been cut off, either because the subroutines read past
+#            the end of the file data or because the tick limit has been reached.
+# error: The file data could not be interpreted, e.g. due to an unknown command.
+STATUS_FINISHED = "finished"
+STATUS_LOOPED = "looped"
+STATUS_TRUNCATED = "truncated"
+STATUS_ERROR = "error"
+
 
 class BmsSubroutines(object):
-    def __init__(self, bmsfile, parser, options):
+    def __init__(self, bmsfile, parser, options, profiler=None):
         self._subroutines = []
-        self._bmsfile = bmsfile
+        self._bmsfile = memoryview(bmsfile).cast("B")
         self._parser = parser
         self._options = options
-    
-    def add_subroutine(self, parent_id, track_id, offset):
-        # Every subroutine parses the file independently. Therefore we
-        # need to create a different file handle for each subroutine. To avoid
-        # copying the data for every subroutine, we will create a "buffer" of the 
-        # existing file handle.
-        _bmsHandle = StringIO(buffer(self._bmsfile))
-        
-        reader = DataReader(_bmsHandle)
+
+        # If a profiler is set, the subroutines report every handled command to it.
+        self.profiler = profiler
+        self._handler_class = ProfilingEventsTemplate if profiler is not None else None
+
+        # Commands decoded by any of the subroutines, by offset.
+        # See SubroutineTemplate.parse_next_command
+        self.decode_cache = {}
+
+        # If this is a list, 0xC1 commands do not start new subroutines. Instead, the
+        # (track id, offset, tick) tuples of the subroutines are added to it.
+        self.spawn_points = None
+
+    def add_subroutine(self, parent_id, track_id, offset, tick=0):
+        # Every subroutine parses the file independently, but all of them
+        # share the same file data. Each reader only keeps track of the offset
+        # at which its subroutine is reading, so no data is copied.
+        reader = DataReader(self._bmsfile, offset)
         
         # Our unique ID will simply consist of the current amount of subroutines.
         # We need an unique ID for every subroutine because the track IDs in BMS files start at 0,
@@ -42,30 +70,67 @@ class BmsSubroutines(object):
         subroutine = Subroutine(reader,
                                 track_id, unique_id, parent_id,
                                 offset, self._parser,
-                                self._options)
+                                self._options,
+                                custom_subroutine_handler=self._handler_class,
+                                bms_subroutines=self,
+                                decode_cache=self.decode_cache)
+        subroutine.wake_tick = tick
+        subroutine.profiler = self.profiler
 
         self._subroutines.append(subroutine)
 
+    # Removes the subroutines that have been added after the first count subroutines.
+    def truncate(self, count):
+        del self._subroutines[count:]
+
     # Use this method to retrieve the UID of the last subroutine that has been added.
     # When the subroutine list is empty, this results in a negative ID.
     def get_previous_uid(self):
         return len(self._subroutines) - 1
-        
+
+    def get_subroutine(self, unique_id):
+        return self._subroutines[unique_id]
+
+    def __len__(self):
+        return len(self._subroutines)
+
     def __iter__(self):
         for subroutine in self._subroutines:
             yield subroutine
 
-        raise StopIteration()
-
 
 class BmsInterpreter(object):
     def __init__(self, fileobj, parser_name="pikmin2", custom_parser=None,
                  *args, **kwargs):
 
-        self.options = OptionsCollector(base_bpm=100, base_ppqn=100)
-        self._set_options(args, kwargs)
+        # scheduler_mode can be "polling" or "event". With "polling", every subroutine
+        # is visited on every tick. With "event", the interpreter keeps a queue of the
+        # ticks at which the subroutines want to wake up and skips the ticks in-between.
+        # Both modes result in the same midi data.
+        # With run_to_delay, subroutines handle all commands up to their next pause
+        # in a single tick instead of handling one command per tick.
+        # If max_ticks is set, the interpretation stops at that tick.
+        # Once the song is detected to loop, it is played until loop_count loops
+        # have passed, followed by fade_out_ticks ticks during which the volume of
+        # every track goes down. Setting loop_count to 0 disables loop detection.
+        # If checkpoint_interval is set, the state of the interpreter is saved about
+        # every checkpoint_interval ticks, so that seek can go back to any tick quickly.
+        # The checkpoints are thinned out when they take more than checkpoint_memory bytes.
+        # With profile, the time spent on every command is measured, see profiler.py.
+        self.options = OptionsCollector(base_bpm=100, base_ppqn=100,
+                                        scheduler_mode="polling",
+                                        run_to_delay=False,
+                                        max_ticks=None,
+                                        loop_count=2,
+                                        fade_out_ticks=0,
+                                        checkpoint_interval=None,
+                                        checkpoint_memory=8*1024*1024,
+                                        profile=False)
+        self._set_options(*args, **kwargs)
 
         self._bmsfile = fileobj
+        self._parser_name = parser_name
+        self._custom_parser = custom_parser
         
         if parser_name not in PARSERS:
             raise RuntimeError(
@@ -90,42 +155,501 @@ class BmsInterpreter(object):
             self._parser = parsers.container.get_parser(PARSERS[parser_name])
 
         self.scheduler = MidiScheduler()
+
+        self.profiler = None
+        if self.options.profile:
+            self.profiler = OpcodeProfiler()
+
         self._subroutines = BmsSubroutines(self._bmsfile, self._parser,
-                                           self.options)
+                                           self.options, self.profiler)
 
         self._ticks = 0
 
+        # Contains (wake_tick, unique_id) tuples of the subroutines,
+        # used by the event scheduler mode.
+        self._wake_queue = []
+
+        # The completion status of parse_file, and the exception that
+        # stopped the interpretation, if there was one.
+        self.status = None
+        self.error = None
+
+        # Maps the states of all subroutines, taken whenever a subroutine has jumped,
+        # to the tick at which they have been seen. The list holds the same
+        # (state, tick) tuples in the order in which they have been added.
+        self._visited_states = {}
+        self._visited_list = []
+
+        # Once a loop has been found, these hold the tick at which the loop starts,
+        # its length in ticks and the tick at which the interpretation stops.
+        self.loop_start = None
+        self.loop_length = None
+        self._end_tick = None
+
+        # (tick, volume) tuples of the remaining volume changes of the fade out.
+        self._fade_steps = []
+
+        # The tick up to which run_until has interpreted the song.
+        self._position = 0
+
+        self.checkpoints = None
+        self._next_checkpoint = None
+        if self.options.checkpoint_interval is not None:
+            self.checkpoints = CheckpointStore(self.options.checkpoint_interval,
+                                               self.options.checkpoint_memory)
+            self._next_checkpoint = 0
+
     def _set_options(self, *args, **kwargs):
         self.options.set_options(**kwargs)
+
+    # Returns the tick the interpreter has reached.
+    def get_ticks(self):
+        return self._ticks
     
     def parse_file(self):
+        self.start()
+
+        return self.run_until(None)
+
+    # Adds the main subroutine, after which the song can be interpreted with run_until.
+    def start(self):
         # We add a main subroutine that starts doing the work.
         # As such, we set its parent id and track id both to None,
         # because it neither has a parent nor a BMS track id.
-        self._subroutines.add_subroutine(None, None, 0)
+        self.start_track(None, 0, 0)
+
+    # Adds a subroutine that starts at the offset on the given tick in place of the main
+    # subroutine, so that a single track of the song can be interpreted with run_until.
+    def start_track(self, track_id, offset, tick):
+        if self.options.scheduler_mode not in ("event", "polling"):
+            raise RuntimeError("Unknown scheduler mode: {0}".format(self.options.scheduler_mode))
+
+        self._ticks = tick
+
+        self._subroutines.add_subroutine(None, track_id, offset, tick)
         unique_id = self._subroutines.get_previous_uid()
         self.scheduler.add_track(unique_id, self._ticks)
 
+        if self.options.scheduler_mode == "event":
+            self._queue_subroutine(unique_id)
+
+    # Interprets the song up to, but not including, stop_tick, or until the song
+    # has ended if stop_tick is None. Returns the completion status, which is None
+    # while the song has not ended yet. Interpreting a song in several steps
+    # results in the same midi data as interpreting it at once.
+    def run_until(self, stop_tick=None):
+        if self.status is not None:
+            return self.status
+
+        try:
+            if self.options.scheduler_mode == "event":
+                status = self._run_event_loop(stop_tick)
+            else:
+                status = self._run_polling_loop(stop_tick)
+
+        except struct.error as error:
+            # A subroutine tried to read past the end of the file data.
+            status = STATUS_TRUNCATED
+            self.error = error
+        except RuntimeError as error:
+            status = STATUS_ERROR
+            self.error = error
+
+        if status is None:
+            self._position = stop_tick
+            return None
+
+        self.status = status
+
+        if self.status == STATUS_LOOPED:
+            self._emit_fade_steps(self._end_tick)
+
+        # Notes that are still playing when the song has been cut off
+        # need to be turned off, or they would be held forever.
+        if self.status in (STATUS_LOOPED, STATUS_TRUNCATED):
+            self._release_notes()
+
+        return self.status
+
+    # Interprets the song like parse_file, but the tracks started by the main subroutine are
+    # interpreted at the same time in a pool of processes. Subroutines only depend on each
+    # other through the ticks at which they are started, so the main subroutine is
+    # interpreted first on its own to find out at which tick and offset it starts each track.
+    # Every track is then interpreted together with the subroutines it starts, and the
+    # events of all of them are put into the scheduler in the order of the unique ids that
+    # parse_file would have given them. The BPM and PPQN of the scheduler are taken from
+    # the tempo changes of all tracks. As both scheduler modes result in the same midi data,
+    # the tracks are always interpreted with the event mode, which does not need to visit
+    # every tick of every track.
+    # That is only possible if every track finishes or reaches max_ticks. A loop is only found
+    # in the state of all subroutines together, so songs that can loop according to their
+    # control flow graph are interpreted with parse_file right away. If a track loops anyway
+    # or cannot be interpreted, the song is interpreted again with parse_file.
+    # processes is the size of the pool, by default the amount of CPUs.
+    def parse_file_parallel(self, processes=None):
+        if self._custom_parser is not None:
+            raise RuntimeError("Custom parsers cannot be sent to other processes!")
+        elif self.checkpoints is not None or self.profiler is not None:
+            raise RuntimeError("Checkpoints and profiling do not work with parse_file_parallel!")
+        elif len(self._subroutines) > 0:
+            raise RuntimeError("The song has already been started!")
+
+        # Without loop detection, looping songs can only end at max_ticks, like the tracks.
+        if self.options.loop_count and disassemble(self._bmsfile, self._parser).can_loop():
+            return self.parse_file()
+
+        options = dict(self.options.opts)
+        options["scheduler_mode"] = "event"
+
+        main = BmsInterpreter(self._bmsfile, self._parser_name, **options)
+        main._subroutines.spawn_points = []
+        main.parse_file()
+
+        main_part = _get_track_part(main)
+        if not _is_complete(main_part):
+            return self.parse_file()
+
+        spawn_points = main_part.spawn_points
+        track_parts = [None]*len(spawn_points)
+        complete = True
+
+        if len(spawn_points) > 0:
+            pool = multiprocessing.Pool(processes, _init_track_worker,
+                                        (bytes(self._bmsfile), self._parser_name, options))
+
+            try:
+                for index, part in pool.imap_unordered(_interpret_track, enumerate(spawn_points)):
+                    if not _is_complete(part):
+                        complete = False
+                        break
+
+                    track_parts[index] = part
+            finally:
+                # The remaining tracks are not needed if one of them is not complete,
+                # they might never finish.
+                if complete:
+                    pool.close()
+                else:
+                    pool.terminate()
+                pool.join()
+
+        if not complete:
+            return self.parse_file()
+
+        tracks = merge_track_parts(main_part, track_parts)
+
+        for unique_id, track in enumerate(tracks):
+            self.scheduler.tracks[unique_id] = track
+
+        for tick, unique_id, index, kind, value in get_tempo_map(tracks):
+            if kind == EVENT_BPM:
+                self.scheduler.bpm = value
+            else:
+                self.scheduler.ppqn = value
+
+        self._ticks = max(part.ticks for part in [main_part] + track_parts)
+
+        if any(part.status == STATUS_TRUNCATED for part in [main_part] + track_parts):
+            self.status = STATUS_TRUNCATED
+        else:
+            self.status = STATUS_FINISHED
+
+        return self.status
+
+    # Interprets the song in steps of batch_ticks ticks and yields the events added by
+    # every step as a list of (tick, track_id, kind, data1, data2) tuples sorted by tick,
+    # see MidiScheduler.collect_events. No event comes before those of the earlier lists.
+    # Steps without events are not yielded. The asyncio event loop gets to run other tasks
+    # after every step, so that many songs can be streamed at once. The next step is only
+    # interpreted once the consumer asks for more events, so the interpretation never gets
+    # ahead of a slow consumer. The completion status is in status once the stream has ended.
+    async def stream_events(self, batch_ticks=1000):
+        if batch_ticks <= 0:
+            raise RuntimeError("The batch size needs to be positive, not {0}".format(batch_ticks))
+
+        if len(self._subroutines) == 0:
+            self.start()
+
+        # How many events of every track have been yielded.
+        read_counts = {}
+        stop_tick = self._position
+
+        while True:
+            stop_tick += batch_ticks
+            status = self.run_until(stop_tick)
+
+            events = self.scheduler.collect_events(read_counts)
+            if len(events) > 0:
+                yield events
+
+            if status is not None:
+                break
+
+            await asyncio.sleep(0)
+
+    def _reached_tick_limit(self, tick):
+        return self.options.max_ticks is not None and tick >= self.options.max_ticks
+
+    def _reached_loop_end(self, tick):
+        return self._end_tick is not None and tick >= self._end_tick
+
+    def _run_polling_loop(self, stop_tick=None):
         while True:
-            # TODO: Add new subroutines when they are encountered.
-            self._advance_tick()
+            if self._next_checkpoint is not None and self._ticks >= self._next_checkpoint:
+                self._take_checkpoint(self._ticks)
 
-        #return self.scheduler.compile_midi(INSTRUMENT_BANK=0, BPM=100)
+            if stop_tick is not None and self._ticks >= stop_tick:
+                return None
 
+            if self._fade_steps:
+                self._emit_fade_steps(self._ticks)
+
+            if not self._advance_tick():
+                return STATUS_FINISHED
+            elif self._reached_loop_end(self._ticks):
+                self._ticks = self._end_tick
+                return STATUS_LOOPED
+            elif self._reached_tick_limit(self._ticks):
+                return STATUS_TRUNCATED
+
+    def _run_event_loop(self, stop_tick=None):
+        while len(self._wake_queue) > 0:
+            next_tick = self._wake_queue[0][0]
+            if self._reached_loop_end(next_tick):
+                self._ticks = self._end_tick
+                return STATUS_LOOPED
+            elif self._reached_tick_limit(next_tick):
+                self._ticks = self.options.max_ticks
+                return STATUS_TRUNCATED
+
+            if self._next_checkpoint is not None and next_tick >= self._next_checkpoint:
+                self._take_checkpoint(next_tick)
+
+            if stop_tick is not None and next_tick >= stop_tick:
+                return None
+
+            if self._fade_steps:
+                self._emit_fade_steps(next_tick)
+
+            self._handle_next_wakeup()
+
+        # Like the polling mode, count the tick on which the last subroutine has stopped.
+        self._ticks += 1
+
+        return STATUS_FINISHED
+
+    # The state of the song is the state of every running subroutine, together with
+    # the position of the subroutine that has just been handled. The latter is needed
+    # because on the same tick, subroutines after it have not been handled yet.
+    def _get_song_state(self, current_sub):
+        states = []
+        position = None
+
+        for sub in self._subroutines:
+            if sub is current_sub:
+                position = len(states)
+            if not sub.stopped:
+                states.append(sub.get_state(self._ticks))
+
+        return position, tuple(states)
+
+    # Called whenever a subroutine has jumped to a different offset.
+    # If the song has been in the same state before, everything that happened since
+    # then will happen again, so we know where the loop starts and how long it is.
+    def _check_for_loop(self, current_sub):
+        current_sub.jumped = False
+
+        if self._end_tick is not None or not self.options.loop_count:
+            return
+
+        state = self._get_song_state(current_sub)
+
+        if state not in self._visited_states:
+            self._visited_states[state] = self._ticks
+            self._visited_list.append((state, self._ticks))
+        else:
+            self.loop_start = self._visited_states[state]
+            self.loop_length = self._ticks - self.loop_start
+
+            fade_start = self.loop_start + self.options.loop_count*self.loop_length
+
+            # The current tick is always finished, so that both scheduler modes
+            # stop at the same point.
+            self._end_tick = max(fade_start + self.options.fade_out_ticks,
+                                 self._ticks + 1)
+            self._visited_states = {}
+            self._visited_list = []
+
+            self._fade_steps = []
+            if self.options.fade_out_ticks > 0:
+                step_count = min(self.options.fade_out_ticks, 16)
+                for i in range(1, step_count+1):
+                    tick = fade_start + (self.options.fade_out_ticks*i)//step_count
+                    volume = 127 - (127*i)//step_count
+                    self._fade_steps.append((tick, volume))
+
+    # Saves the state of the interpreter before it handles the given tick.
+    def _take_checkpoint(self, tick):
+        checkpoint = Checkpoint(tick, self._ticks,
+                                tuple(sub.save_checkpoint() for sub in self._subroutines),
+                                self.scheduler.save_checkpoint(),
+                                self._visited_list, len(self._visited_list),
+                                self.loop_start, self.loop_length, self._end_tick,
+                                tuple(self._fade_steps))
+
+        self.checkpoints.add(checkpoint)
+        self._next_checkpoint = tick + self.checkpoints.interval
+
+    def _restore_checkpoint(self, checkpoint):
+        self._subroutines.truncate(len(checkpoint.subroutines))
+        for sub, sub_checkpoint in zip(self._subroutines, checkpoint.subroutines):
+            sub.restore_checkpoint(sub_checkpoint)
+
+        self.scheduler.restore_checkpoint(checkpoint.scheduler_state)
+
+        self._ticks = checkpoint.ticks
+        self.status = None
+        self.error = None
+
+        # The list is shared with other checkpoints, which still need all of it.
+        self._visited_list = checkpoint.visited_states[:checkpoint.visited_count]
+        self._visited_states = dict(self._visited_list)
+
+        self.loop_start = checkpoint.loop_start
+        self.loop_length = checkpoint.loop_length
+        self._end_tick = checkpoint.end_tick
+        self._fade_steps = list(checkpoint.fade_steps)
+
+        self._wake_queue = []
+        if self.options.scheduler_mode == "event":
+            for sub in self._subroutines:
+                if not sub.stopped:
+                    self._queue_subroutine(sub.unique_track_id)
+
+        # The checkpoints after this one are taken again while the song is interpreted.
+        self.checkpoints.discard_after(checkpoint.tick)
+        self._next_checkpoint = checkpoint.tick + self.checkpoints.interval
+        self._position = checkpoint.tick
+
+    # Puts the interpreter into the state it would be in after run_until(tick). If the
+    # interpreter has already gone past the tick, it goes back to the last checkpoint
+    # before the tick and interprets the song from there. The events that have been
+    # added to the scheduler since the checkpoint are removed.
+    # Returns the same as run_until.
+    def seek(self, tick):
+        if len(self._subroutines) == 0:
+            self.start()
+
+        if self.status is not None or tick < self._position:
+            if self.checkpoints is None:
+                raise RuntimeError("Seeking backwards needs the checkpoint_interval option to be set!")
+
+            checkpoint = self.checkpoints.find(tick)
+            if checkpoint is None:
+                raise RuntimeError("There is no checkpoint before tick {0}".format(tick))
+
+            self._restore_checkpoint(checkpoint)
+
+        return self.run_until(tick)
+
+    def _emit_fade_steps(self, tick):
+        while self._fade_steps and self._fade_steps[0][0] <= tick:
+            fade_tick, volume = self._fade_steps.pop(0)
+
+            for sub in self._subroutines:
+                if not sub.stopped:
+                    # Controller 7 is the channel volume
+                    self.scheduler.controller_event(sub.unique_track_id, fade_tick,
+                                                    7, volume)
+
+    def _release_notes(self):
+        for sub in self._subroutines:
+            if not sub.stopped:
+                sub.release_notes(self.scheduler, self._ticks)
+
+    def _queue_subroutine(self, unique_id):
+        sub = self._subroutines.get_subroutine(unique_id)
+        heapq.heappush(self._wake_queue, (sub.wake_tick, unique_id))
+
+    # Subroutines that wake up on the same tick are handled in the order
+    # of their unique IDs, which is the same order in which the polling
+    # mode visits them.
+    def _handle_next_wakeup(self):
+        tick, unique_id = heapq.heappop(self._wake_queue)
+        self._ticks = tick
+
+        sub = self._subroutines.get_subroutine(unique_id)
+        known_subroutines = len(self._subroutines)
+
+        sub.handle_next_command(self.scheduler, tick)
+        if sub.jumped:
+            self._check_for_loop(sub)
+
+        # Subroutines that have stopped will not wake up anymore.
+        if not sub.stopped:
+            self._queue_subroutine(unique_id)
+
+        # Subroutines that have been added while handling the command
+        # need to be queued as well.
+        for new_id in range(known_subroutines, len(self._subroutines)):
+            self._queue_subroutine(new_id)
+
+    # Returns False once all subroutines have stopped.
     def _advance_tick(self):
+        running = False
+
         for sub in self._subroutines:
-            cmd = sub.handle_next_command(self.scheduler, self._ticks)
-            if cmd is None:
-                pass
-            else:
-                #print cmd
-                pass
+            sub.handle_next_command(self.scheduler, self._ticks)
+            if sub.jumped:
+                self._check_for_loop(sub)
+
+            if not sub.stopped:
+                running = True
+
         self._ticks += 1
 
+        return running
+
+
+def _get_track_part(interpreter):
+    subroutines = interpreter._subroutines
+
+    return TrackPart(interpreter.status, interpreter.error, interpreter.get_ticks(),
+                     [sub.parent_id for sub in subroutines],
+                     [interpreter.scheduler.tracks[unique_id] for unique_id in range(len(subroutines))],
+                     subroutines.spawn_points)
+
+
+# A part can only be used if the interpretation of the whole song would not have ended
+# before the part did, i.e. if the part has finished or has been cut off by max_ticks.
+def _is_complete(part):
+    return part.status == STATUS_FINISHED or (part.status == STATUS_TRUNCATED and part.error is None)
+
+
+# The song that the worker processes of parse_file_parallel interpret tracks of,
+# as a (file data, parser name, options) tuple.
+_worker_song = None
+
+
+def _init_track_worker(bms_data, parser_name, options):
+    global _worker_song
+    _worker_song = (bms_data, parser_name, options)
+
+
+# Interprets the track at a spawn point and returns the index of the spawn point with the TrackPart.
+def _interpret_track(job):
+    index, (track_id, offset, tick) = job
+    bms_data, parser_name, options = _worker_song
+
+    interpreter = BmsInterpreter(bms_data, parser_name, **options)
+    interpreter.start_track(track_id, offset, tick)
+    interpreter.run_until(None)
+
+    return index, _get_track_part(interpreter)
+
 
 if __name__ == "__main__":
     import os
-    import struct
     #bmsfile = os.path.join("pikmin2_bms","n_tutorial_1stday.bms")
 
 
@@ -140,14 +664,16 @@ if __name__ == "__main__":
 
         bms_parser = BmsInterpreter(f.read(), parser_name=parser)#bms_data)
 
-    try:
-        bms_parser.parse_file()
-    except struct.error as e:
-        print e
-        print "reached end of file, most likely"
-
-    midi = bms_parser.scheduler.compile_midi(instrument_bank=0, bpm=100)
+    status = bms_parser.parse_file()
+    print("Finished parsing with status '{0}'".format(status))
+    if bms_parser.error is not None:
+        print(bms_parser.error)
 
     # This is the output file to which the result is written.
     with open(output_path, "wb") as f:
-        midi.write_midi(f)
\ No newline at end of file
+        bms_parser.scheduler.compile_midi(instrument_bank=0, bpm=100, fileobj=f)
+
+    channels = bms_parser.scheduler.channels
+    print("{0} subroutines on {1} channels, {2} ports".format(len(channels.channels),
+                                                              channels.channel_count(),
+                                                              channels.port_count()))
\ No newline at end of file
@@ -0,0 +1,49 @@
+import unittest
+
+from bmsmodules.assembler import Assembler, assemble
+
+
+class NoteRangeTest(unittest.TestCase):
+    def test_note(self):
+        self.assertEqual(assemble("note 60 1 100"), bytes([0x3C, 0x01, 0x64]))
+
+    # The volume is read as a signed byte, both ways of writing it give the same byte.
+    def test_volume_as_unsigned_byte(self):
+        self.assertEqual(assemble("note 60 1 0xC0"), bytes([0x3C, 0x01, 0xC0]))
+        self.assertEqual(assemble("note 60 1 -64"), bytes([0x3C, 0x01, 0xC0]))
+
+    def test_note_from_0x80_is_rejected(self):
+        # 0xA4 would be a bank select command instead of a note.
+        self.assertRaises(RuntimeError, assemble, "note 0xA4 1 2")
+        self.assertRaises(RuntimeError, assemble, "note 0x80 1 2")
+        self.assertRaises(RuntimeError, assemble, "note -1 1 2")
+
+    def test_invalid_poly_id_is_rejected(self):
+        self.assertRaises(RuntimeError, assemble, "note 60 8 100")
+        self.assertRaises(RuntimeError, assemble, "note 60 -1 100")
+
+    def test_volume_outside_of_a_byte_is_rejected(self):
+        self.assertRaises(RuntimeError, assemble, "note 60 1 0x100")
+        self.assertRaises(RuntimeError, assemble, "note 60 1 -129")
+
+    def test_error_names_the_line(self):
+        with self.assertRaises(RuntimeError) as context:
+            assemble("note 60 1 100\nnote 0xA4 1 2")
+
+        self.assertIn("line 2", str(context.exception))
+
+    def test_note_on_method_is_checked(self):
+        assembler = Assembler()
+        self.assertRaises(RuntimeError, assembler.note_on, 0xA4, 1, 2)
+        self.assertEqual(len(assembler), 0)
+
+    def test_note_off(self):
+        self.assertEqual(assemble("off 7"), bytes([0x87]))
+
+        # off 0 would be the 0x80 delay command.
+        self.assertRaises(RuntimeError, assemble, "off 0")
+        self.assertRaises(RuntimeError, assemble, "off 8")
+
+
+if __name__ == "__main__":
+    unittest.main()
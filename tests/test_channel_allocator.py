@@ -0,0 +1,69 @@
+import unittest
+from io import BytesIO
+
+from bmsmodules.MidiWriter.channel_allocator import allocate_channels
+from bmsmodules.MidiWriter.midi_scheduler import MidiScheduler
+
+# Controller 121 on channel 0 with a delta time of 0.
+RESET_CONTROLLERS = bytes([0x00, 0xB0, 121, 0])
+
+
+# 16 tracks that play until tick 10 and a 17th track that starts at tick 100, after all of them.
+def create_scheduler():
+    scheduler = MidiScheduler()
+
+    for track_id in range(17):
+        tick = 100 if track_id == 16 else 0
+        scheduler.add_track(track_id, tick)
+        scheduler.note_on(track_id, tick, 60, 100)
+
+        # The first track changes the pitch and the volume of the channel.
+        if track_id == 0:
+            scheduler.pitch_change(track_id, 5, 0x3000)
+            scheduler.controller_event(track_id, 5, 7, 30)
+
+        scheduler.note_off(track_id, tick + 10, 60, 0)
+
+    return scheduler
+
+
+class ChannelResetTest(unittest.TestCase):
+    def test_reused_channel_is_reset(self):
+        scheduler = create_scheduler()
+        allocation = allocate_channels(scheduler.tracks)
+
+        self.assertEqual(allocation.get_channel(16), allocation.get_channel(0))
+        self.assertEqual(allocation.get_reset(16), (100, 0))
+
+        for track_id in range(16):
+            self.assertIsNone(allocation.get_reset(track_id))
+
+    def test_reset_is_written_before_the_first_event(self):
+        for use_numpy in (False, True):
+            scheduler = create_scheduler()
+            midi_file = BytesIO()
+            scheduler.compile_midi(instrument_bank=0, bpm=100, fileobj=midi_file,
+                                   use_numpy=use_numpy)
+            data = midi_file.getvalue()
+
+            # The last track: the controller 121 at tick 100, the volume, the pan,
+            # the centered pitch, the program and the note.
+            last_track = data[data.rindex(b"MTrk"):]
+            self.assertIn(bytes([0x64, 0xB0, 121, 0,
+                                 0x00, 0xB0, 7, 100,
+                                 0x00, 0xB0, 10, 64,
+                                 0x00, 0xE0, 0x00, 0x40,
+                                 0x00, 0xC0, 0,
+                                 0x00, 0x90, 60, 100]), last_track)
+            self.assertEqual(data.count(RESET_CONTROLLERS[1:]), 1)
+
+    # Tracks of which the ids are valid channels keep their own channels.
+    def test_no_reset_with_16_tracks(self):
+        scheduler = create_scheduler()
+        del scheduler.tracks[16]
+
+        self.assertEqual(allocate_channels(scheduler.tracks).resets, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
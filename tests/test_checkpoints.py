@@ -0,0 +1,53 @@
+import unittest
+
+from bmsmodules.checkpoints import (Checkpoint, CheckpointStore, VISITED_STATE_SIZE,
+                                    VISITED_SUBROUTINE_SIZE)
+
+
+def create_checkpoint(tick, visited_states, visited_count):
+    return Checkpoint(tick, tick, ((), ), ((), None, None), visited_states, visited_count,
+                      None, None, None, ())
+
+
+class VisitedStatesSizeTest(unittest.TestCase):
+    STATE_SIZE = VISITED_STATE_SIZE + VISITED_SUBROUTINE_SIZE
+
+    def test_shared_list_is_counted_once(self):
+        store = CheckpointStore(10, 10**9)
+        visited_states = [None]*30
+
+        for i in range(3):
+            store.add(create_checkpoint(i*10, visited_states, (i + 1)*10))
+
+        base_size = sum(checkpoint.estimated_size() for checkpoint in store)
+        self.assertEqual(store.estimated_size(), base_size + 30*self.STATE_SIZE)
+
+    # The list of a checkpoint that has been restored is copied.
+    def test_copied_list_is_counted_again(self):
+        store = CheckpointStore(10, 10**9)
+        visited_states = [None]*20
+
+        store.add(create_checkpoint(0, visited_states, 20))
+        store.add(create_checkpoint(10, visited_states[:20], 20))
+
+        base_size = sum(checkpoint.estimated_size() for checkpoint in store)
+        self.assertEqual(store.estimated_size(), base_size + 40*self.STATE_SIZE)
+
+    # The checkpoints that are kept still refer to the visited states before them.
+    def test_thinning_out_keeps_the_visited_states(self):
+        visited_states = [None]*100
+        checkpoint_size = create_checkpoint(0, [], 0).estimated_size()
+
+        store = CheckpointStore(10, 6*checkpoint_size + 100*self.STATE_SIZE)
+        for i in range(10):
+            store.add(create_checkpoint(i*10, visited_states, (i + 1)*10))
+
+        self.assertLessEqual(len(store), 6)
+        self.assertEqual(store.interval, 20)
+        visited_count = max(checkpoint.visited_count for checkpoint in store)
+        self.assertEqual(store.estimated_size(),
+                         len(store)*checkpoint_size + visited_count*self.STATE_SIZE)
+
+
+if __name__ == "__main__":
+    unittest.main()
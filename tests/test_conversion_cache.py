@@ -0,0 +1,24 @@
+import unittest
+from unittest import mock
+
+from EventParsers import parsers
+from bmsmodules import conversion_cache
+
+
+class ConversionKeyTest(unittest.TestCase):
+    def get_key(self):
+        return conversion_cache.get_conversion_key(b"\xFF", parsers.container.get_parser(2),
+                                                   [0xFF], {"bpm": 100})
+
+    # A cache filled by an older interpreter must not be used by a newer one.
+    def test_key_changes_with_the_converter_sources(self):
+        key = self.get_key()
+
+        with mock.patch.object(conversion_cache, "_source_hash", "changed"):
+            self.assertNotEqual(self.get_key(), key)
+
+        self.assertEqual(self.get_key(), key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from EventParsers import parsers
+from bmsmodules.disassembler import disassemble, EDGE_JUMP
+
+
+# 0x00: jump with mode 1 to 0x06, 0x05: no known command, 0x06: end of track
+JUMP_OVER_GARBAGE = bytes([0xC8, 0x01, 0x00, 0x00, 0x06,
+                           0xBB,
+                           0xFF])
+
+
+class JumpTest(unittest.TestCase):
+    # The interpreter takes every jump, whatever its mode is.
+    def test_jump_with_mode_does_not_fall_through(self):
+        graph = disassemble(JUMP_OVER_GARBAGE, parsers.container.get_parser(2))
+
+        self.assertTrue(graph.is_valid())
+        self.assertEqual(sorted(graph.instructions), [0x00, 0x06])
+        self.assertEqual(graph.get_block(0).successors, [(EDGE_JUMP, 0x06)])
+
+
+class CanLoopTest(unittest.TestCase):
+    def can_loop(self, data):
+        return disassemble(data, parsers.container.get_parser(2)).can_loop()
+
+    def test_jump_back(self):
+        # Note on, delay, jump back to the note.
+        self.assertTrue(self.can_loop(bytes([0x3C, 0x01, 0x40, 0x80, 0x05,
+                                             0xC8, 0x00, 0x00, 0x00, 0x00])))
+
+    # Calling the same pattern twice does not loop, the pattern returns.
+    def test_calls_are_not_a_loop(self):
+        # 0x00: call 0x0C, 0x05: call 0x0C, 0x0A: end of track, 0x0C: note on, 0x0F: return
+        self.assertFalse(self.can_loop(bytes([0xC4, 0x00, 0x00, 0x00, 0x0C,
+                                              0xC4, 0x00, 0x00, 0x00, 0x0C,
+                                              0xFF, 0x00,
+                                              0x3C, 0x01, 0x40,
+                                              0xC6, 0x00])))
+
+    def test_jump_forward(self):
+        self.assertFalse(self.can_loop(JUMP_OVER_GARBAGE))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from io import BytesIO
+from unittest import mock
+
+from bmsmodules.MidiWriter import midi_numpy
+from bmsmodules.MidiWriter.midi_scheduler import MidiScheduler
+
+
+# Every kind of event, with delta times of every length as a variable length
+# quantity and more tracks than channels, so that the tracks are put on ports.
+def create_scheduler():
+    scheduler = MidiScheduler()
+
+    for track_id in range(20):
+        scheduler.add_track(track_id, track_id*3)
+        tick = track_id*3
+
+        for delta in (0, 1, 0x7F, 0x80, 0x3FFF, 0x4000, 0x1FFFFF, 0x200000, 0x0FFFFFFF):
+            tick += delta
+            scheduler.note_on(track_id, tick, 60 + track_id, -3 if delta == 1 else 100)
+            scheduler.controller_event(track_id, tick, 7, 0x64)
+            scheduler.controller_event(track_id, tick, 1, 0x1234, use_two_bytes=True)
+            scheduler.program_change(track_id, tick, track_id)
+            scheduler.pitch_change(track_id, tick, 0x2000 + track_id)
+            scheduler.note_off(track_id, tick, 60 + track_id, 0)
+
+        if track_id % 7 == 0:
+            scheduler.change_bpm(track_id, tick, 90 + track_id)
+        if track_id % 5 == 0:
+            scheduler.change_ppqn(track_id, tick, 48)
+
+    return scheduler
+
+
+def compile_midi(scheduler, use_numpy=None):
+    midi_file = BytesIO()
+    scheduler.compile_midi(instrument_bank=0, bpm=100, fileobj=midi_file, use_numpy=use_numpy)
+
+    return midi_file.getvalue()
+
+
+class NumpyEncodingTest(unittest.TestCase):
+    @unittest.skipUnless(midi_numpy.is_available(), "NumPy is not installed")
+    def test_numpy_matches_pure_python(self):
+        scheduler = create_scheduler()
+
+        # Otherwise the tracks would be encoded event by event both times.
+        for track in scheduler.tracks.values():
+            self.assertIsNotNone(midi_numpy.encode_track(track, 0, 100))
+
+        self.assertEqual(compile_midi(scheduler, use_numpy=True),
+                         compile_midi(scheduler, use_numpy=False))
+
+    @unittest.skipUnless(midi_numpy.is_available(), "NumPy is not installed")
+    def test_tracks_numpy_cannot_encode_fall_back(self):
+        scheduler = create_scheduler()
+        # A program change outside of 0 to 127 makes the MIDI class raise an error.
+        scheduler.program_change(0, 0xFFFFFFFF, 200)
+
+        self.assertIsNone(midi_numpy.encode_track(scheduler.tracks[0], 0, 100))
+        self.assertRaises(AssertionError, compile_midi, scheduler, use_numpy=True)
+
+    def test_without_numpy(self):
+        scheduler = create_scheduler()
+        expected = compile_midi(scheduler, use_numpy=False)
+
+        with mock.patch.object(midi_numpy, "numpy", None):
+            self.assertFalse(midi_numpy.is_available())
+            self.assertEqual(compile_midi(scheduler), expected)
+            self.assertRaises(RuntimeError, compile_midi, scheduler, use_numpy=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
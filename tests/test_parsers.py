@@ -0,0 +1,46 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from EventParsers.opcodes import OPCODES, VERSIONS
+from EventParsers.parsers import OpcodeTableContainer
+
+
+class ParserCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = os.path.join(tempfile.mkdtemp(), "parsers")
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.cache_dir))
+
+    def get_parser(self):
+        return OpcodeTableContainer(OPCODES, VERSIONS, cache_dir=self.cache_dir).get_parser(2)
+
+    def test_cached_parser_is_the_same(self):
+        parser = self.get_parser()
+        cached = self.get_parser()
+
+        # No temporary files are left behind.
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        self.assertEqual(sorted(cached.command_parsers), sorted(parser.command_parsers))
+        self.assertEqual(sorted(cached.deprecated), sorted(parser.deprecated))
+
+    # E.g. a file which another process has not finished writing.
+    def test_broken_cache_file_is_rebuilt(self):
+        parser = self.get_parser()
+        cache_path = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+
+        with open(cache_path, "w") as f:
+            f.write('{"game_name": "Pik')
+
+        cached = self.get_parser()
+
+        self.assertEqual(sorted(cached.command_parsers), sorted(parser.command_parsers))
+        with open(cache_path, "r") as f:
+            self.assertEqual(json.load(f)["game_name"], parser.game_name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+from bmsmodules.player import encode_event, split_messages
+from bmsmodules.MidiWriter.event_kinds import (EVENT_NOTE_ON, EVENT_CONTROLLER,
+                                               EVENT_CONTROLLER_TWO_BYTES, EVENT_PROGRAM,
+                                               EVENT_PITCH)
+
+
+class EncodeEventTest(unittest.TestCase):
+    def test_two_byte_controller_is_split_into_two_messages(self):
+        port, data = encode_event(17, EVENT_CONTROLLER_TWO_BYTES, 7, 300)
+
+        self.assertEqual(port, 1)
+        self.assertEqual(split_messages(data), [bytes([0xB1, 7, 300 >> 7]),
+                                                bytes([0xB1, 7 + 32, 300 & 127])])
+
+    def test_program_change_has_one_data_byte(self):
+        port, data = encode_event(0, EVENT_PROGRAM, 5, 0)
+        note_port, note = encode_event(0, EVENT_NOTE_ON, 60, 100)
+
+        self.assertEqual(split_messages(data + note), [bytes([0xC0, 5]), bytes([0x90, 60, 100])])
+
+    # Data bytes from 0x80 on would be read as status bytes by the device.
+    def test_data_bytes_are_valid(self):
+        port, data = encode_event(0, EVENT_NOTE_ON, 60, -3)
+        self.assertEqual(data, bytes([0x90, 60, 0x7D]))
+
+        port, data = encode_event(0, EVENT_CONTROLLER, 200, -1)
+        self.assertTrue(all(byte < 0x80 for byte in data[1:]))
+
+    def test_pitch_sends_least_significant_bits_first(self):
+        port, data = encode_event(0, EVENT_PITCH, 0x2000 + 5, 0)
+        self.assertEqual(data, bytes([0xE0, 5, 0x40]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import io
+import unittest
+
+from pyBMS import BmsInterpreter, STATUS_FINISHED, STATUS_LOOPED, STATUS_TRUNCATED
+from bmsmodules.song_generator import generate_song
+
+
+def interpret(data, **options):
+    interpreter = BmsInterpreter(data, parser_name="pikmin2", **options)
+    interpreter.parse_file()
+
+    midi_file = io.BytesIO()
+    interpreter.scheduler.compile_midi(instrument_bank=0, bpm=100, fileobj=midi_file)
+
+    return interpreter.status, interpreter.get_ticks(), midi_file.getvalue()
+
+
+# The event mode skips the ticks on which nothing happens, but has to give the same results.
+class SchedulerModeTest(unittest.TestCase):
+    def assert_same_results(self, data, status, **options):
+        polling = interpret(data, scheduler_mode="polling", **options)
+        event = interpret(data, scheduler_mode="event", **options)
+
+        self.assertEqual(polling[0], status)
+        self.assertEqual(event[:2], polling[:2])
+        self.assertTrue(event[2] == polling[2], "The midi data is different")
+
+    def test_finished(self):
+        data = generate_song(track_count=4, notes_per_track=50, nesting=2, pattern_notes=4)
+        self.assert_same_results(data, STATUS_FINISHED)
+
+    def test_run_to_delay(self):
+        data = generate_song(track_count=4, notes_per_track=50, extra_command_chance=0.2)
+        self.assert_same_results(data, STATUS_FINISHED, run_to_delay=True)
+
+    def test_looped(self):
+        data = generate_song(track_count=3, notes_per_track=20, loop=True)
+        self.assert_same_results(data, STATUS_LOOPED, fade_out_ticks=50)
+
+    def test_max_ticks(self):
+        data = generate_song(track_count=3, notes_per_track=50)
+        self.assert_same_results(data, STATUS_TRUNCATED, max_ticks=100)
+
+
+if __name__ == "__main__":
+    unittest.main()
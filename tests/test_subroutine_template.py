@@ -0,0 +1,109 @@
+import gc
+import unittest
+import weakref
+
+from pyBMS import BmsInterpreter, STATUS_ERROR, STATUS_FINISHED, STATUS_LOOPED
+from EventParsers import parsers
+from EventParsers.parser_creator import VersionSpecificParser
+from bmsmodules import subroutine_template
+from bmsmodules.subroutine_template import SubroutineEventsTemplate, get_dispatch_table
+
+
+def interpret(data):
+    interpreter = BmsInterpreter(data, parser_name="pikmin2")
+    interpreter.parse_file()
+
+    return interpreter
+
+
+class PolyphonicIdTest(unittest.TestCase):
+    # Note 0x3C with the polyphonic ID, a delay of 5 ticks and the end of the track.
+    def note_track(self, poly_byte):
+        return bytes([0x3C, poly_byte, 0x40, 0x80, 0x05, 0xFF])
+
+    def test_valid_ids(self):
+        for poly_byte in range(0, 8):
+            interpreter = interpret(self.note_track(poly_byte))
+            self.assertEqual(interpreter.status, STATUS_FINISHED)
+
+    # The ID is decoded as a signed byte, these must not turn into negative list indices.
+    def test_ids_from_0x80_are_rejected(self):
+        for poly_byte in (0x80, 0x9C, 0xF9, 0xFE, 0xFF):
+            interpreter = interpret(self.note_track(poly_byte))
+            self.assertEqual(interpreter.status, STATUS_ERROR)
+            self.assertIsInstance(interpreter.error, RuntimeError)
+
+    def test_ids_above_7_are_rejected(self):
+        for poly_byte in (0x08, 0x7F):
+            interpreter = interpret(self.note_track(poly_byte))
+            self.assertEqual(interpreter.status, STATUS_ERROR)
+
+    def test_note_off_releases_note(self):
+        # Note on with ID 6, a delay, the note-off of ID 6 and the end of the track.
+        interpreter = interpret(bytes([0x3C, 0x06, 0x40, 0x80, 0x05, 0x86, 0xFF]))
+        events = [(tick, kind, data1) for tick, track, kind, data1, data2
+                  in interpreter.scheduler.collect_events()]
+
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[1][0], 7)
+        self.assertEqual(events[1][2], 0x3C)
+
+
+class RunToDelayTest(unittest.TestCase):
+    # Note on, note-off and a jump back to the start, without any pause.
+    LOOP_WITHOUT_PAUSE = bytes([0x3C, 0x01, 0x40, 0x81, 0xC8, 0x00, 0x00, 0x00, 0x00])
+
+    # The switch only changes the timing, the loop is detected either way.
+    def test_loop_without_pause_is_detected(self):
+        for run_to_delay in (False, True):
+            for scheduler_mode in ("polling", "event"):
+                interpreter = BmsInterpreter(self.LOOP_WITHOUT_PAUSE, parser_name="pikmin2",
+                                             run_to_delay=run_to_delay,
+                                             scheduler_mode=scheduler_mode, max_ticks=100)
+                self.assertEqual(interpreter.parse_file(), STATUS_LOOPED)
+
+    # A pattern that is called twice in the same tick does not loop.
+    def test_calls_without_pause_are_not_a_loop(self):
+        # 0x00: call 0x0E, 0x05: call 0x0E, 0x0A: delay, 0x0C: end of track,
+        # 0x0E: note on, 0x11: note-off, 0x12: return
+        data = bytes([0xC4, 0x00, 0x00, 0x00, 0x0E,
+                      0xC4, 0x00, 0x00, 0x00, 0x0E,
+                      0x80, 0x05,
+                      0xFF, 0x00,
+                      0x3C, 0x01, 0x40,
+                      0x81,
+                      0xC6, 0x00])
+        interpreter = BmsInterpreter(data, parser_name="pikmin2", run_to_delay=True)
+
+        self.assertEqual(interpreter.parse_file(), STATUS_FINISHED)
+
+        self.assertEqual(interpreter.scheduler.event_count(), 4)
+
+class DispatchTableTest(unittest.TestCase):
+    def test_table_is_shared(self):
+        parser = parsers.container.get_parser(2)
+
+        self.assertIs(get_dispatch_table(parser, SubroutineEventsTemplate),
+                      get_dispatch_table(parser, SubroutineEventsTemplate))
+
+    # The tables of parsers that are not used anymore are not kept.
+    def test_table_is_dropped_with_its_parser(self):
+        cached_parsers = len(subroutine_template._dispatch_tables)
+
+        parser = VersionSpecificParser(2, "Copy")
+        parser.inherit_parsers(parsers.container.get_parser(2))
+        interpreter = BmsInterpreter(bytes([0xFF]), custom_parser=parser)
+        interpreter.parse_file()
+
+        self.assertEqual(len(subroutine_template._dispatch_tables), cached_parsers + 1)
+
+        parser_ref = weakref.ref(parser)
+        del parser, interpreter
+        gc.collect()
+
+        self.assertIsNone(parser_ref())
+        self.assertEqual(len(subroutine_template._dispatch_tables), cached_parsers)
+
+
+if __name__ == "__main__":
+    unittest.main()
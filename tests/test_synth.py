@@ -0,0 +1,27 @@
+import unittest
+from io import BytesIO
+
+from bmsmodules import synth
+from bmsmodules.MidiWriter.midi_scheduler import MidiScheduler
+
+
+@unittest.skipUnless(synth.numpy is not None, "NumPy is not installed")
+class GainTest(unittest.TestCase):
+    # More notes than voices at full volume on the same wavetable, all starting together.
+    def test_full_volume_does_not_clip(self):
+        scheduler = MidiScheduler()
+
+        for track_id in range(40):
+            scheduler.add_track(track_id, 0)
+            scheduler.note_on(track_id, 0, 69, 127)
+            scheduler.note_off(track_id, 50, 69, 0)
+
+        synthesizer = synth.Synthesizer(sample_rate=8000, max_voices=32)
+        stats = synthesizer.render(scheduler, BytesIO())
+
+        self.assertEqual(stats.notes, 40)
+        self.assertEqual(stats.clipped_samples, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()